@@ -19,7 +19,7 @@ pl = [pcr.Primer(k.strip(),v.strip()) for k,v in l]
 x = [30.+0.1*i for i in range(0,500)]
 
 for p in pl:
-	y = [p.sdss_length(i) for i in x]
+	y = p.sdss_lengths(x)
 	pp.plot(x,y,label=p.name)
 
 pp.legend([p.name for p in pl],loc="upper left")
@@ -227,6 +227,8 @@ def primers():
     parser = ArgumentParser(prog='primers', description='Print primer properties')
     parser.add_argument('primers', nargs='+', help='primer text file')
     parser.add_argument('-c', '--csv', action='store_true', dest='csv', help='write a csv file(default is html file)')
+    parser.add_argument('-d', '--dimer', action='store_true', dest='dimer', help='write primer-dimer matrix of all primers')
+    parser.add_argument('-j', '--processes', type=int, default=1, dest='processes', help='number of processes for primer-dimer matrix')
 
     args = parser.parse_args()
 
@@ -239,8 +241,12 @@ def primers():
     for filename in inputfiles:
         ps.load_file(filename)
 
+    dimer = ps.dimer_matrix(args.processes) if args.dimer else None
+
     if args.csv:
         sys.stdout.write(ps.write_csv())
+        if dimer:
+            sys.stdout.write(dimer.write_csv())
     else:
         html = xmlwriter.XmlWriter(sys.stdout)
         b = xmlwriter.builder(html)
@@ -250,4 +256,83 @@ def primers():
             with b.body(style='font-family:monospace;font-size:small'):
                 b.h1('Primers')
                 ps.write_html(html)
+                if dimer:
+                    b.h1('Primer dimers')
+                    dimer.write_html(html)
+
+
+def pbisearch():
+    parser = ArgumentParser(prog='pbisearch', description='Design primer pairs of a template and write a .seqv file')
+    parser.add_argument('input', help='template fasta file')
+    parser.add_argument('-o', '--output', dest='output', help='output .seqv filename, default is standard output')
+    parser.add_argument('-n', '--normal', action='store_true', dest='normal', help='design normal PCR primers instead of bisulfite PCR primers')
+    parser.add_argument('--msp', choices=['methyl', 'unmethyl'], dest='msp', help='design methylation specific primers of methyl or unmethyl version')
+    parser.add_argument('--product_len_min', type=int, default=100, help='minimum pcr product size')
+    parser.add_argument('--product_len_max', type=int, default=250, help='maximum pcr product size')
+    parser.add_argument('--primer_len_min', type=int, default=20, help='minimum primer length')
+    parser.add_argument('--primer_len_max', type=int, default=35, help='maximum primer length')
+    parser.add_argument('--max_tm_diff', type=float, default=4., help='maximum Tm differences between fw and rv primer')
+    parser.add_argument('--max_met_tm_diff', type=float, default=2.5, help='maximum Tm differences between methyl and unmethyl version')
+    parser.add_argument('--max_cpg_in_primer', type=int, default=1, help='maximum number of CpG allowed within the primer')
+    parser.add_argument('--min_cpg_in_primer', type=int, default=1, help='minimum number of CpG within the primer for --msp')
+    parser.add_argument('--score_threshold', type=float, default=100., help='threshold value for primer pair score')
+    parser.add_argument('--max_results', type=int, default=200, help='maximum number of results')
+    parser.add_argument('--per_bin', type=int, default=5, help='number of results kept for each 1/100 of the template')
+    parser.add_argument('--min_distance', type=int, default=0, help='minimum distance between product centers of results in a bin')
+
+    args = parser.parse_args()
+
+    from Bio import SeqIO
+    from ..nucleotide.design import PrimerDesigner
+
+    record = next(SeqIO.parse(args.input, 'fasta'))
+    designer = PrimerDesigner(record.seq, bisulfite=not args.normal,
+                              primer_length=(args.primer_len_min, args.primer_len_max),
+                              product_length=(args.product_len_min, args.product_len_max),
+                              max_tm_diff=args.max_tm_diff,
+                              max_met_tm_diff=args.max_met_tm_diff,
+                              max_cpg_in_primer=args.max_cpg_in_primer,
+                              score_threshold=args.score_threshold,
+                              msp=args.msp,
+                              min_cpg_in_primer=args.min_cpg_in_primer)
+    results = designer.design(args.max_results, per_bin=args.per_bin, min_distance=args.min_distance)
+    if args.msp:
+        prefix = 'M' if args.msp == 'methyl' else 'U'
+    else:
+        prefix = 'P' if args.normal else 'Bi'
+    seqv = designer.write_seqv(results, prefix)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(seqv)
+    else:
+        sys.stdout.write(seqv)
 
+def seqtool():
+    parser = ArgumentParser(prog='seqtool', description='seqtool genome tools')
+    subparsers = parser.add_subparsers(help='sub-command help')
+
+    parser_index = subparsers.add_parser('index', help='seed index of a genome fasta file')
+    index_commands = parser_index.add_subparsers(help='index sub-command help')
+
+    from ..genome import index
+
+    parser_build = index_commands.add_parser('build', help='build seed index of a fasta file')
+    parser_build.add_argument('fasta', help='genome fasta file')
+    parser_build.add_argument('directory', help='output directory of the index')
+    parser_build.add_argument('-k', type=int, default=index.SEED_LENGTH, dest='k', help='k-mer length')
+    parser_build.add_argument('-b', '--bisulfite', action='store_true', dest='bisulfite', help='index the four bisulfite strands too, without writing converted fasta')
+    parser_build.add_argument('-j', '--processes', type=int, default=1, dest='processes', help='number of processes for chromosomes')
+    parser_build.set_defaults(func=index.index_build)
+
+    parser_lookup = index_commands.add_parser('lookup', help='print positions of a k-mer')
+    parser_lookup.add_argument('directory', help='directory of the index')
+    parser_lookup.add_argument('word', help='k-mer of A, T, G, C')
+    parser_lookup.add_argument('-s', '--strand', choices=index.STRANDS, default='genome', dest='strand', help='genome or bisulfite strand pm, pu, nm, nu')
+    parser_lookup.set_defaults(func=index.index_lookup)
+
+    args = parser.parse_args()
+    if not hasattr(args, 'func'):
+        parser.print_usage()
+        return
+    args.func(args)
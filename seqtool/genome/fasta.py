@@ -0,0 +1,124 @@
+import mmap
+
+__all__ = ['MappedFasta']
+
+# bytes of the file read from the map at a time
+BLOCK = 1 << 20
+
+_UPPER = bytes.maketrans(b'abcdefghijklmnopqrstuvwxyz', b'ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+_SPACES = b'\r\n \t'
+
+class MappedFasta:
+    """
+    multi record fasta file mapped in memory.
+
+    records are located by one scan for '>' lines, and a sequence is read
+    from the map only when asked, so a genome is handled chromosome by
+    chromosome without loading the file.
+
+    >>> import tempfile, os
+    >>> with tempfile.NamedTemporaryFile('w', suffix='.fa', delete=False) as f:
+    ...     _ = f.write('>chr1 test\\nACGTN\\nacgt\\n>chr2\\nGGCC\\n')
+    >>> fa = MappedFasta(f.name)
+    >>> fa.names(), fa.length('chr1')
+    (['chr1', 'chr2'], 9)
+    >>> fa.sequence('chr1'), fa.sequence('chr2')
+    ('ACGTNACGT', 'GGCC')
+    >>> list(fa.windows('chr1', 4, 1, 2))
+    [(0, b'ACGTNA'), (3, b'TNACGT'), (7, b'GT')]
+    >>> fa.close(); os.remove(f.name)
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file can not be mapped
+            self._map = b''
+        # name -> (start, end) byte offsets of sequence lines
+        self._records = {}
+        self._names = []
+        self._scan()
+
+    def _scan(self):
+        m = self._map
+        size = len(m)
+        pos = 0 if m[:1] == b'>' else m.find(b'\n>')
+        while 0 <= pos < size:
+            if m[pos:pos+1] == b'\n':
+                pos += 1
+            eol = m.find(b'\n', pos)
+            eol = size if eol < 0 else eol
+            name = m[pos+1:eol].split(None, 1)[0].decode('ascii') if eol > pos+1 else ''
+            nxt = m.find(b'\n>', eol)
+            end = size if nxt < 0 else nxt
+            self._names.append(name)
+            self._records[name] = (min(eol+1, size), end)
+            pos = nxt
+
+    def __len__(self):
+        return len(self._names)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def names(self):
+        return list(self._names)
+
+    def raw(self, name):
+        """
+        sequence bytes of record name with line breaks.
+        """
+        start, end = self._records[name]
+        return self._map[start:end]
+
+    def sequence(self, name):
+        """
+        upper case sequence of record name.
+        """
+        return self.raw(name).translate(None, _SPACES).decode('ascii').upper()
+
+    def blocks(self, name, size=BLOCK):
+        """
+        yield upper case sequence bytes of record name, read size bytes of the map at a time.
+        """
+        start, end = self._records[name]
+        for pos in range(start, end, size):
+            yield self._map[pos:min(pos+size, end)].translate(_UPPER, _SPACES)
+
+    def windows(self, name, size, left=0, right=0):
+        """
+        yield (start, bases) of windows of upper case sequence of record name.
+        k-th window is bases k*size...(k+1)*size extended by left and right
+        bases, within the sequence. start is that of the extended window.
+        only a window and a block of the map are in memory at a time.
+        """
+        blocks = self.blocks(name, BLOCK)
+        buf, buf_start, core, done = b'', 0, 0, False
+        while True:
+            while not done and buf_start + len(buf) < core + size + right:
+                block = next(blocks, None)
+                if block is None:
+                    done = True
+                else:
+                    buf += block
+            if core > 0 and core >= buf_start + len(buf):
+                return
+            lo = max(core - left, 0)
+            yield lo, buf[lo-buf_start:core+size+right-buf_start]
+            core += size
+            drop = max(core - left, 0) - buf_start
+            buf, buf_start = buf[drop:], buf_start + drop
+
+    def length(self, name):
+        raw = self.raw(name)
+        return len(raw) - sum(raw.count(c) for c in [b'\r', b'\n', b' ', b'\t'])
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
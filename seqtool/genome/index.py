@@ -0,0 +1,303 @@
+import os
+import json
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ..nucleotide.primerhits import encode
+from .fasta import MappedFasta
+from . import kmer
+
+__all__ = ['SeedIndex', 'build_index', 'convert', 'convert_bases', 'STRANDS']
+
+SEED_LENGTH = 12
+META = 'index.json'
+# bases of a chromosome sorted into a run at a time, and entries of all runs merged at a time
+BUILD_CHUNK = 1 << 22
+MERGE_BLOCK = 1 << 22
+
+# strands of bsindex/convert.cpp, as (methyl, sense) of BisulfiteIndex.strand
+BISULFITE_STRANDS = {'pm': (True, True), 'pu': (False, True), 'nm': (True, False), 'nu': (False, False)}
+STRANDS = ['genome', 'pm', 'pu', 'nm', 'nu']
+
+def convert(seq, strand):
+    """
+    upper case seq converted to a strand, same as BisulfiteIndex.strand.
+    sense strands convert C to T, antisense strands G to A, and methyl
+    strands keep CpG.
+
+    >>> [convert('ACGTCCGG', s) for s in STRANDS]
+    ['ACGTCCGG', 'ACGTTCGG', 'ATGTTTGG', 'ACGTCCGA', 'ACATCCAA']
+    """
+    if strand == 'genome':
+        return seq
+    return convert_bases(np.frombuffer(seq.encode('ascii'), dtype=np.uint8), strand).tobytes().decode('ascii')
+
+def convert_bases(bases, strand):
+    """
+    convert of upper case letters as uint8 array. a converted copy is
+    returned, or bases itself for genome.
+    """
+    if strand == 'genome':
+        return bases
+    b = bases.copy()
+    methyl, sense = BISULFITE_STRANDS[strand]
+    if sense:
+        target = b == ord('C')
+        if methyl:
+            target[:-1] &= b[1:] != ord('G')
+        b[target] = ord('T')
+    else:
+        target = b == ord('G')
+        if methyl:
+            target[1:] &= b[:-1] != ord('C')
+        b[target] = ord('A')
+    return b
+
+def kmer_dtype(k):
+    return np.uint32 if k <= 16 else np.uint64
+
+def sort_seeds(kmers, positions, k, kind='quicksort'):
+    """
+    packed k-mers and their positions in the order of (k-mer, position).
+    kind is that of the sort of 64 bit keys, mergesort for sorted runs.
+    """
+    if kmer_dtype(k) == np.uint64:
+        order = np.lexsort((positions, kmers))
+        return kmers[order], positions[order]
+    # k-mer and position in one 64 bit key, whose unstable sort is much faster
+    shift = np.uint64(32)
+    key = (kmers.astype(np.uint64) << shift) | positions
+    key.sort(kind=kind)
+    return (key >> shift).astype(np.uint32), key.astype(np.uint32)
+
+def seed_arrays(seq, k):
+    """
+    (sorted packed k-mers, their positions) of every valid k-mer of seq.
+    positions of a k-mer are in ascending order.
+
+    >>> kmers, positions = seed_arrays('ATGATGN', 3)
+    >>> kmers.tolist() == sorted(kmer.pack_word(w) for w in ['ATG', 'TGA', 'GAT', 'ATG'])
+    True
+    >>> positions
+    array([0, 3, 1, 2], dtype=uint32)
+    """
+    kmers, valid = kmer.pack(encode(seq), k)
+    positions = np.flatnonzero(valid).astype(np.uint32)
+    return sort_seeds(kmers[positions], positions, k)
+
+def _path(directory, strand, chrom, kind):
+    return os.path.join(directory, strand, '{}.{}.npy'.format(chrom, kind))
+
+def _seed_runs(fasta, chrom, k, strand, chunk, directory):
+    """
+    write sorted seed arrays of every chunk bases of a strand into directory.
+    return (list of (kmers file, positions file), length of chromosome).
+    """
+    runs = []
+    length = 0
+    # one more base on each side keeps CpG of the conversion at the edges
+    for w, (start, bases) in enumerate(fasta.windows(chrom, chunk, 1, k)):
+        length = max(length, start + len(bases))
+        codes = encode(convert_bases(np.frombuffer(bases, dtype=np.uint8), strand))
+        first = w*chunk - start
+        kmers, valid = kmer.pack(codes, k, first, min(first + chunk, len(codes) - k + 1))
+        offsets = np.flatnonzero(valid)
+        if not len(offsets):
+            continue
+        kmers, positions = sort_seeds(kmers[offsets], (offsets + w*chunk).astype(np.uint32), k)
+        run = tuple(os.path.join(directory, '{}.{}.npy'.format(len(runs), kind)) for kind in ['kmers', 'positions'])
+        np.save(run[0], kmers)
+        np.save(run[1], positions)
+        runs.append(run)
+    return runs, length
+
+class _NpyReader:
+    """
+    blocks of a 1-d .npy file read by seek, so that only the block is in memory.
+    """
+    def __init__(self, filename):
+        self._file = open(filename, 'rb')
+        np.lib.format.read_magic(self._file)
+        shape, fortran_order, self.dtype = np.lib.format.read_array_header_1_0(self._file)
+        self.length = shape[0]
+        self._offset = self._file.tell()
+
+    def read(self, start, count):
+        self._file.seek(self._offset + start * self.dtype.itemsize)
+        return np.fromfile(self._file, self.dtype, max(min(count, self.length - start), 0))
+
+    def close(self):
+        self._file.close()
+
+def _write_npy(f, dtype, length):
+    np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                                             'fortran_order': False, 'shape': (length,)})
+
+def merge_runs(runs, kmers_file, positions_file, k, block=MERGE_BLOCK):
+    """
+    k-way merge of sorted (kmers, positions) .npy runs into kmers_file and
+    positions_file. a block of each run is in memory at a time: entries up to
+    the smallest last entry of the blocks are sorted and appended at once.
+    block is the number of entries of all the blocks.
+    """
+    readers = [(_NpyReader(a), _NpyReader(b)) for a, b in runs]
+    block = max(block // max(len(readers), 1), 1)
+    total = sum(ps.length for ks, ps in readers)
+    heads = [0] * len(readers)
+    with open(kmers_file, 'wb') as kmers_out, open(positions_file, 'wb') as positions_out:
+        _write_npy(kmers_out, kmer_dtype(k), total)
+        _write_npy(positions_out, np.uint32, total)
+        done = 0
+        while done < total:
+            blocks = [(ks.read(h, block), ps.read(h, block)) for (ks, ps), h in zip(readers, heads)]
+            # an entry beyond a block is at least its last entry, so those up to the least of them are final
+            limits = [(int(ks[-1]), int(ps[-1])) for (ks, ps), (rk, rp), h in zip(blocks, readers, heads)
+                      if h + len(ks) < rp.length]
+            kmers = []
+            positions = []
+            for r, (ks, ps) in enumerate(blocks):
+                if limits:
+                    lk, lp = min(limits)
+                    n = int(((ks < lk) | ((ks == lk) & (ps <= lp))).sum())
+                else:
+                    n = len(ks)
+                kmers.append(ks[:n])
+                positions.append(ps[:n])
+                heads[r] += n
+            kmers, positions = sort_seeds(np.concatenate(kmers), np.concatenate(positions), k, 'mergesort')
+            kmers.astype(kmer_dtype(k)).tofile(kmers_out)
+            positions.tofile(positions_out)
+            done += len(kmers)
+    for ks, ps in readers:
+        ks.close()
+        ps.close()
+
+def build_chromosome(args):
+    """
+    worker writing the arrays of every strand of a chromosome.
+    the chromosome is read from the map and converted chunk bases at a
+    time, each chunk is sorted into a run on disk, and the runs are merged
+    into the arrays, so memory does not grow with the chromosome.
+    """
+    filename, directory, chrom, k, strands, chunk = args
+    length = 0
+    with MappedFasta(filename) as fasta:
+        for strand in strands:
+            tmp = tempfile.mkdtemp(dir=os.path.join(directory, strand))
+            try:
+                runs, length = _seed_runs(fasta, chrom, k, strand, chunk, tmp)
+                merge_runs(runs, _path(directory, strand, chrom, 'kmers'), _path(directory, strand, chrom, 'positions'),
+                           k, MERGE_BLOCK)
+            finally:
+                shutil.rmtree(tmp)
+    return chrom, length
+
+def build_index(filename, directory, k=SEED_LENGTH, bisulfite=False, processes=1, chunk=BUILD_CHUNK):
+    """
+    write SeedIndex of a fasta file into directory. with bisulfite, the four
+    bisulfite strands are indexed too. the metadata is written last, so an
+    unfinished index is never opened. chunk: bases of a chromosome sorted at a time.
+    """
+    if not 0 < k <= kmer.MAX_K:
+        raise ValueError('k must be 1...{}: {}'.format(kmer.MAX_K, k))
+    strands = STRANDS if bisulfite else STRANDS[:1]
+    for strand in strands:
+        os.makedirs(os.path.join(directory, strand), exist_ok=True)
+    with MappedFasta(filename) as fasta:
+        names = fasta.names()
+
+    args = [(filename, directory, chrom, k, strands, chunk) for chrom in names]
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            chromosomes = list(executor.map(build_chromosome, args))
+    else:
+        chromosomes = [build_chromosome(a) for a in args]
+
+    meta = {'k': k, 'fasta': os.path.abspath(filename), 'strands': strands, 'chromosomes': chromosomes}
+    with open(os.path.join(directory, META), 'w') as f:
+        json.dump(meta, f)
+    return SeedIndex(directory)
+
+class SeedIndex:
+    """
+    on-disk seed index of a genome written by build_index.
+
+    each chromosome and strand has a sorted array of packed k-mers and an
+    array of their positions, both saved as .npy. arrays are memory-mapped
+    on first use, so opening the index reads only its metadata, and a
+    lookup is a bisection touching a few pages of the map.
+
+    >>> import tempfile, shutil
+    >>> d = tempfile.mkdtemp()
+    >>> with open(os.path.join(d, 'g.fa'), 'w') as f:
+    ...     _ = f.write('>chr1\\nATGCGATGCA\\n>chr2\\nCCATGCG\\n')
+    >>> index = build_index(os.path.join(d, 'g.fa'), os.path.join(d, 'idx'), k=4, bisulfite=True)
+    >>> index = SeedIndex(os.path.join(d, 'idx'))
+    >>> index.chromosomes, index.k
+    (['chr1', 'chr2'], 4)
+    >>> index.find('ATGC')
+    [('chr1', [0, 5]), ('chr2', [2])]
+    >>> index.find('ATGT', strand='pu'), index.find('ATGT', strand='pm')
+    ([('chr1', [0, 5]), ('chr2', [2])], [('chr1', [5])])
+    >>> shutil.rmtree(d)
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, META)) as f:
+            meta = json.load(f)
+        self.k = meta['k']
+        self.fasta = meta['fasta']
+        self.strands = meta['strands']
+        self.chromosomes = [name for name, length in meta['chromosomes']]
+        self.lengths = dict((name, length) for name, length in meta['chromosomes'])
+        self._arrays = {}
+
+    def arrays(self, chrom, strand='genome'):
+        """
+        memory-mapped (sorted packed k-mers, positions) of a chromosome.
+        """
+        key = (chrom, strand)
+        if key not in self._arrays:
+            if strand not in self.strands:
+                raise ValueError('strand is not indexed: {}'.format(strand))
+            self._arrays[key] = (np.load(_path(self.directory, strand, chrom, 'kmers'), mmap_mode='r'),
+                                 np.load(_path(self.directory, strand, chrom, 'positions'), mmap_mode='r'))
+        return self._arrays[key]
+
+    def positions(self, chrom, packed, strand='genome'):
+        """
+        ascending positions of packed k-mer on a chromosome.
+        """
+        kmers, positions = self.arrays(chrom, strand)
+        # same dtype as the map, or the whole array is converted for the comparison
+        v = kmers.dtype.type(packed)
+        lo = np.searchsorted(kmers, v, 'left')
+        hi = np.searchsorted(kmers, v, 'right')
+        return np.asarray(positions[lo:hi], dtype=np.int64)
+
+    def find(self, word, strand='genome'):
+        """
+        list of (chromosome, positions) of a word of A, T, G, C of length k.
+        """
+        word = word.upper()
+        if len(word) != self.k or set(word) - set('ATGC'):
+            raise ValueError('word must be {} letters of A, T, G, C: {}'.format(self.k, word))
+        packed = kmer.pack_word(word)
+        ret = []
+        for chrom in self.chromosomes:
+            ps = self.positions(chrom, packed, strand)
+            if len(ps):
+                ret.append((chrom, ps.tolist()))
+        return ret
+
+def index_build(args):
+    build_index(args.fasta, args.directory, args.k, args.bisulfite, args.processes)
+
+def index_lookup(args):
+    index = SeedIndex(args.directory)
+    for chrom, positions in index.find(args.word, args.strand):
+        for t in positions:
+            print('{}\t{}'.format(chrom, t))
@@ -0,0 +1,275 @@
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ..nucleotide import iupac, to_seq
+from ..nucleotide.primer import Primer
+from ..nucleotide.primerset import _Pattern
+from ..nucleotide.primerhits import PrimerHits, encode
+from ..nucleotide.pcr import MAX_PRODUCT_SIZE, PCRProducts
+from .fasta import MappedFasta
+from .index import SeedIndex, convert_bases, STRANDS
+from . import kmer
+
+__all__ = ['PrimerSeeds', 'GenomeProduct', 'window_products', 'search_chromosome', 'insilico_pcr']
+
+SEED_LENGTH = 12
+# a degenerate seed is expanded into at most this number of k-mers,
+# otherwise the tail is matched at every position.
+MAX_SEED_EXPANSION = 64
+# bases of a chromosome searched at a time
+WINDOW = 1 << 20
+
+class PrimerSeeds:
+    """
+    sorted packed k-mer seeds of primer 3' tails, forward and reverse complement.
+
+    the seed of a tail is k bases at primer 3' end, or the least degenerate
+    k bases if it expands into too many k-mers. k-mers of a template are
+    looked up in the seeds by bisection, and only the hits are verified by
+    the allowed letters of the tail on the encoded template, so the result
+    is that of PrimerSet.find on an unambiguous template.
+
+    >>> ps = PrimerSeeds([Primer('a', 'ATGCATGC'), Primer('b', 'GCAYGC')], k=4, min_length=0)
+    >>> ps.find('nnnATGCATGCnnnGCATGCATnnn')
+    [([3], [14]), ([5, 14], [])]
+    """
+    def __init__(self, primers, k=SEED_LENGTH, min_length=16):
+        self.primers = list(primers)
+        self.min_length = min_length
+        self.lengths = [len(p.search_tail(min_length)) for p in self.primers]
+        self.k = min([k] + self.lengths)
+
+        self.patterns = []
+        self.scan_patterns = []
+        seeds = []
+        owners = []
+        offsets = []
+        for i, p in enumerate(self.primers):
+            tail = to_seq(p.search_tail(min_length))
+            for strand, seq in [(True, tail), (False, tail.reverse_complement())]:
+                pattern = _Pattern(i, strand, seq, iupac.basematch_unambiguous)
+                words, offset = self._seed(pattern)
+                if words is None:
+                    self.scan_patterns.append(pattern)
+                else:
+                    seeds.extend(kmer.pack_word(w) for w in words)
+                    owners.extend([len(self.patterns)] * len(words))
+                    offsets.extend([offset] * len(words))
+                self.patterns.append(pattern)
+
+        order = np.argsort(np.array(seeds, dtype=np.uint64), kind='mergesort')
+        self.seeds = np.array(seeds, dtype=np.uint64)[order]
+        self.owners = np.array(owners, dtype=np.int64)[order]
+        self.offsets = np.array(offsets, dtype=np.int64)[order]
+
+    def _seed(self, pattern):
+        k = self.k
+        l = pattern.length
+        # primer 3' end is the end of forward pattern and the start of reverse pattern.
+        last = l - k if pattern.strand else 0
+        for offset in [last] + sorted(range(l-k+1), key=lambda o: abs(o-last)):
+            words = kmer.expand(pattern.allowed[offset:offset+k], MAX_SEED_EXPANSION)
+            if words is not None:
+                return words, offset
+        return None, None
+
+    def candidates(self, start, kmers, valid):
+        """
+        (pattern indices, start positions) of seed hits of packed k-mers from position start.
+        """
+        if not len(self.seeds) or not len(kmers):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        lo = np.searchsorted(self.seeds, kmers)
+        found = valid & (self.seeds[np.minimum(lo, len(self.seeds)-1)] == kmers)
+        pos = np.flatnonzero(found)
+        lo = lo[pos]
+        count = np.searchsorted(self.seeds, kmers[pos], 'right') - lo
+        # every seed of the run lo...hi of each hit
+        first = np.repeat(np.cumsum(count) - count, count)
+        seed = np.arange(count.sum()) - first + np.repeat(lo, count)
+        return self.owners[seed], start + np.repeat(pos, count) - self.offsets[seed]
+
+    def index_candidates(self, index, chrom, strand='genome'):
+        """
+        (pattern indices, start positions) of seed hits looked up in SeedIndex of the same k.
+        """
+        owners = [np.zeros(0, dtype=np.int64)]
+        positions = [np.zeros(0, dtype=np.int64)]
+        for seed, owner, offset in zip(self.seeds.tolist(), self.owners.tolist(), self.offsets.tolist()):
+            ps = index.positions(chrom, seed, strand)
+            owners.append(np.full(len(ps), owner, dtype=np.int64))
+            positions.append(ps - offset)
+        return np.concatenate(owners), np.concatenate(positions)
+
+    def find(self, template, codes=None, candidates=None):
+        """
+        same as PrimerSet(primers, False, min_length).find(template).
+        candidates: iterable of (pattern indices, start positions) to be verified,
+        seed hits of k-mers of the template by default. candidates are verified
+        on encoded template codes, so template is not used if codes is given.
+        """
+        codes = encode(template) if codes is None else codes
+        n = len(codes)
+        if candidates is None:
+            candidates = (self.candidates(start, kmers, valid) for start, kmers, valid in kmer.iter_kmers(codes, self.k))
+        owners = [np.zeros(0, dtype=np.int64)]
+        positions = [np.zeros(0, dtype=np.int64)]
+        for o, t in candidates:
+            owners.append(o)
+            positions.append(t)
+        owners = np.concatenate(owners)
+        order = np.argsort(owners, kind='mergesort')
+        positions = np.concatenate(positions)[order]
+        bounds = np.searchsorted(owners[order], np.arange(len(self.patterns)+1))
+
+        scan = set(id(p) for p in self.scan_patterns)
+        ret = [[None, None] for p in self.primers]
+        for o, p in enumerate(self.patterns):
+            if id(p) in scan:
+                starts = np.arange(max(n - p.length + 1, 0))
+            else:
+                starts = positions[bounds[o]:bounds[o+1]]
+            ret[p.index][0 if p.strand else 1] = np.unique(p.match_codes(codes, starts))
+        return [(fw.tolist(), np.setdiff1d(rc, fw).tolist()) for fw, rc in ret]
+
+    def hits(self, template, codes=None, candidates=None):
+        """
+        same as PrimerSet(primers, False, min_length).hits(template).
+        """
+        codes = encode(template) if codes is None else codes
+        return PrimerHits.from_starts(self.primers, template, self.find(template, codes, candidates), self.lengths,
+                                      template_codes=codes).filter()
+
+class GenomeProduct:
+    """
+    product of in-silico PCR on a chromosome. start and end are those of
+    the whole product with primer 5' ends, length is that of PCRProduct.
+    """
+    __slots__ = ('chrom', 'fw', 'rv', 'start', 'end', 'length')
+
+    def __init__(self, chrom, fw, rv, start, end, length):
+        self.chrom = chrom
+        self.fw = fw
+        self.rv = rv
+        self.start = start
+        self.end = end
+        self.length = length
+
+    def __repr__(self):
+        return 'GenomeProduct({}:{}-{}, {} -> {}, {}bp)'.format(self.chrom, self.start, self.end, self.fw, self.rv, self.length)
+
+def window_products(codes, seeds, max_product_size=MAX_PRODUCT_SIZE, candidates=None):
+    """
+    PCRProducts of encoded template codes, paired as PCR._search.
+    """
+    hits = seeds.hits(None, codes, candidates)
+    return PCRProducts(None, hits, *hits.pairs(max_product_size))
+
+def search_chromosome(args):
+    """
+    worker of a chromosome. args is (fasta filename, chromosome name, [(primer name, sequence)],
+    k, max_product_size, SeedIndex directory or None, strand, window).
+    the fasta and the index are mapped in each process, so only the chromosome name is sent.
+
+    the chromosome is read from the map in windows of window bases, and a
+    product is taken from the window of the 3' end of its forward hit. the
+    window is extended by the longest primer on the left and by
+    max_product_size on the right, so that the product and its primers are
+    in it, and by one more base on each side for CpG of converted strands.
+    """
+    filename, chrom, primers, k, max_product_size, directory, strand, window = args
+    index = SeedIndex(directory) if directory else None
+    seeds = PrimerSeeds([Primer(name, seq) for name, seq in primers], index.k if index else k)
+
+    indexed = None
+    # tails shorter than k of the index are searched without it
+    if index is not None and seeds.k == index.k:
+        owners, positions = seeds.index_candidates(index, chrom, strand)
+        if not len(positions) and not seeds.scan_patterns:
+            return []
+        order = np.argsort(positions, kind='mergesort')
+        indexed = owners[order], positions[order]
+
+    if max_product_size is None or window is None:
+        size, right = sys.maxsize, 0
+    else:
+        size, right = window, max_product_size + 1
+    left = max([len(p.seq) for p in seeds.primers] + [0]) + 1
+
+    columns = [[] for c in range(7)]
+    with MappedFasta(filename) as fasta:
+        for w, (start, bases) in enumerate(fasta.windows(chrom, size, left, right)):
+            codes = encode(convert_bases(np.frombuffer(bases, dtype=np.uint8), strand))
+            candidates = None
+            if indexed is not None:
+                owners, positions = indexed
+                lo, hi = np.searchsorted(positions, [start, start + len(codes)])
+                candidates = [(owners[lo:hi], positions[lo:hi] - start)]
+            products = window_products(codes, seeds, max_product_size, candidates)
+            r = products.records
+            h = products.hits.records
+            loc = h['loc_3p'][r['fw_hit']] + start
+            core = np.flatnonzero((w*size <= loc) & (loc < (w+1)*size))
+            r = r[core]
+            length = (r['start_i'] - r['start_0']) + np.maximum(0, r['end_i'] - r['start_i']) + (r['end_0'] - r['end_i'])
+            for c, v in zip(columns, [h['primer'][r['fw_hit']], loc[core], h['primer'][r['rv_hit']], h['loc_3p'][r['rv_hit']] + start,
+                                      r['start_0'] + start, r['end_0'] + start, length]):
+                c.append(v)
+
+    fw, fw_loc, rv, rv_loc, starts, ends, lengths = [np.concatenate(c).tolist() for c in columns]
+    # in the order of PCR._search, that is of (forward hit, reverse hit) on the whole chromosome
+    order = np.lexsort((rv_loc, rv, fw_loc, fw)).tolist()
+    names = [p.name for p in seeds.primers]
+    return [GenomeProduct(chrom, names[fw[i]], names[rv[i]], starts[i], ends[i], lengths[i]) for i in order]
+
+def insilico_pcr(filename, primers, processes=1, k=SEED_LENGTH, max_product_size=MAX_PRODUCT_SIZE,
+                 index=None, strand='genome', window=WINDOW):
+    """
+    yield list of GenomeProduct of each chromosome of a fasta file, in the order of the file.
+    chromosomes are searched in a process pool if processes > 1.
+
+    index: directory of SeedIndex of the fasta file, seeds are looked up in it
+    instead of packing k-mers of chromosomes.
+    strand: 'genome' or a bisulfite strand of index.STRANDS, converted in memory.
+    window: bases of a chromosome searched at a time, see search_chromosome.
+    """
+    primers = [(p.name, str(p.seq)) for p in primers]
+    with MappedFasta(filename) as fasta:
+        names = fasta.names()
+    if index is not None:
+        seed_index = SeedIndex(index)
+        if seed_index.chromosomes != names:
+            raise ValueError('index is not built from {}: {}'.format(filename, index))
+        if strand not in seed_index.strands:
+            raise ValueError('strand is not indexed: {}'.format(strand))
+    args = [(filename, chrom, primers, k, max_product_size, index, strand, window) for chrom in names]
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            for products in executor.map(search_chromosome, args):
+                yield products
+    else:
+        for a in args:
+            yield search_chromosome(a)
+
+def main():
+    from argparse import ArgumentParser
+    parser = ArgumentParser(prog='insilico_pcr', description='Print PCR products of primers on a genome fasta file')
+    parser.add_argument('fasta', help='fasta file of genome, searched chromosome by chromosome')
+    parser.add_argument('primers', nargs='+', help="primer sequences from 5' to 3'")
+    parser.add_argument('-j', '--processes', type=int, default=1, dest='processes', help='number of processes for chromosomes')
+    parser.add_argument('-k', '--seed', type=int, default=SEED_LENGTH, dest='k', help='seed length of primer 3\' tails')
+    parser.add_argument('-l', '--length', type=int, default=MAX_PRODUCT_SIZE, dest='length', help='maximum product size')
+    parser.add_argument('-i', '--index', dest='index', help='directory of seed index made by seqtool index build')
+    parser.add_argument('-s', '--strand', choices=STRANDS, default='genome', dest='strand', help='genome or bisulfite strand pm, pu, nm, nu')
+    args = parser.parse_args()
+
+    primers = [Primer(seq, seq) for seq in args.primers]
+    for products in insilico_pcr(args.fasta, primers, args.processes, args.k, args.length, args.index, args.strand):
+        for p in products:
+            sys.stdout.write('\t'.join(str(v) for v in [p.chrom, p.start, p.end, p.length, p.fw, p.rv]) + '\n')
+        sys.stdout.flush()
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,87 @@
+import itertools
+
+import numpy as np
+
+from ..nucleotide.primerhits import encode, IUPAC_LETTERS
+
+__all__ = ['pack', 'pack_word', 'iter_kmers', 'expand']
+
+# codes of encode below this are A, T, G, C, packed in 2 bits.
+BASES = 4
+MAX_K = 31
+
+# positions of k-mers packed at once
+CHUNK = 1 << 22
+
+def pack_word(word):
+    """
+    packed k-mer of a word of A, T, G, C.
+
+    >>> pack_word('A'), pack_word('C'), pack_word('TA'), pack_word('AT')
+    (0, 3, 4, 1)
+    """
+    v = 0
+    for c in word:
+        v = (v << 2) | IUPAC_LETTERS.index(c)
+    return v
+
+def pack(codes, k, start=0, end=None):
+    """
+    (packed k-mers, valid) of positions start...end of encoded sequence codes.
+    a k-mer is valid if all of its letters are A, T, G or C.
+
+    >>> codes = encode('ATNTAAT')
+    >>> kmers, valid = pack(codes, 2)
+    >>> kmers[valid].tolist() == [pack_word(w) for w in ['AT', 'TA', 'AA', 'AT']]
+    True
+    >>> valid
+    array([ True, False, False,  True,  True,  True])
+    """
+    if not 0 < k <= MAX_K:
+        raise ValueError('k must be 1...{}: {}'.format(MAX_K, k))
+    end = len(codes) - k + 1 if end is None else end
+    if end <= start:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=bool)
+    c = codes[start:end+k-1]
+    n = end - start
+
+    invalid = np.zeros(len(c)+1, dtype=np.int64)
+    np.cumsum(c >= BASES, out=invalid[1:])
+    valid = invalid[k:k+n] == invalid[:n]
+
+    base = np.where(c < BASES, c, 0).astype(np.uint64)
+    kmers = np.zeros(n, dtype=np.uint64)
+    two = np.uint64(2)
+    for j in range(k):
+        kmers <<= two
+        kmers |= base[j:j+n]
+    return kmers, valid
+
+def iter_kmers(codes, k, chunk=CHUNK):
+    """
+    yield (start, packed k-mers, valid) of encoded sequence codes, chunk positions at a time.
+
+    >>> [(s, len(v)) for s, m, v in iter_kmers(encode('ATGCATGCAT'), 4, chunk=3)]
+    [(0, 3), (3, 3), (6, 1)]
+    """
+    n = len(codes) - k + 1
+    for start in range(0, max(n, 0), chunk):
+        kmers, valid = pack(codes, k, start, min(start+chunk, n))
+        yield start, kmers, valid
+
+def expand(allowed, limit):
+    """
+    list of words of A, T, G, C matched by allowed letters of each position,
+    or None if there are more than limit words.
+
+    >>> expand(['A', 'TC', 'G'], 4)
+    ['ATG', 'ACG']
+    >>> expand(['A', 'TC', 'GC'], 3) is None
+    True
+    """
+    count = 1
+    for a in allowed:
+        count *= len(a)
+    if count > limit:
+        return None
+    return [''.join(w) for w in itertools.product(*allowed)]
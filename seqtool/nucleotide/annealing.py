@@ -1,3 +1,7 @@
+from collections import defaultdict
+
+import numpy as np
+
 __all__ = ['OligoAnnealing']
 
 def annealing_score_n(x,y):
@@ -37,14 +41,152 @@ class AnnealingState:
         w.pop()
         w.pop()
 
+# index of annealing_score_n for encoded bases, other letters are 4.
+_SCORE = np.zeros((5, 5), dtype=np.int32)
+for _x in range(4):
+    for _y in range(4):
+        _SCORE[_x, _y] = annealing_score_n('ATGC'[_x], 'ATGC'[_y])
+
+_codes = np.full(256, 4, dtype=np.intp)
+for _i, _c in enumerate('ATGC'):
+    _codes[ord(_c)] = _i
+
+def _encode(s):
+    return _codes[np.frombuffer(s.encode('ascii', 'replace'), dtype=np.uint8)]
+
+def _run_sum(d):
+    """
+    sum of leading non zero values of each row.
+    """
+    return (d * np.cumprod(d != 0, axis=-1)).sum(axis=-1)
+
+_offsets_cache = {}
+
+def _offsets(n, m):
+    """
+    index arrays of annealing_score for lengths n, m, which depend only on the lengths.
+    """
+    key = (n, m)
+    if key in _offsets_cache:
+        return _offsets_cache[key]
+
+    # ss[i] of offset k is score[wi, vi], as indexed in annealing_score_reference.
+    ks = np.arange(-(n-1), m)[:,None]
+    i = np.arange(min(n, m))[None,:]
+    if n <= m:
+        wi = np.where(ks <= 0, i - ks, i)
+        lengths = np.where(ks <= 0, n + ks, np.minimum(n, m - ks))
+        # 0: no end annealing, 1: left, 2: right, 3: both
+        ea_kind = np.where(ks <= 0, 3, np.where(ks <= m - n, 2, 0))
+    else:
+        # for m-n < k <= 0, w[k+i] of the reference wraps around for negative index.
+        wi = np.where(ks <= m - n, i - ks, np.where(ks <= 0, (ks + i) % n, i))
+        lengths = np.where(ks <= m - n, n + ks, np.where(ks <= 0, m, m - ks))
+        ea_kind = np.where(ks <= m - n, 3, np.where(ks <= 0, 1, 0))
+    vi = np.where(ks <= 0, i, ks + i)
+    lengths = lengths[:,0]
+    ea_kind = ea_kind[:,0]
+
+    valid = i < lengths[:,None]
+    ri = np.where(valid, lengths[:,None] - 1 - i, 0)
+    ret = (ks, np.where(valid, wi, 0), np.where(valid, vi, 0), valid, ri, lengths, ea_kind)
+    if len(_offsets_cache) < 4096:
+        _offsets_cache[key] = ret
+    return ret
+
 def annealing_score(p,q):
     """
+    same as annealing_score_reference, evaluating all offsets at once.
+
+    one score matrix of bases of p and reversed q is built, and the score
+    list of each offset k is the diagonal k of the matrix.
+
     >>> fw = 'GAAGGAGACCCAAATTCAAAGTT'
     >>> rv = 'CCTTTCTCCCTTCGTAGGT'
     >>> annealing_score(fw, rv)
     ((18, -7, [2, 4, 4, 0, 2, 0, 0, 0, 0, 0, 0, 0, 2, 4, 0, 0]), (10, -7, [2, 4, 4, 0, 2, 0, 0, 0, 0, 0, 0, 0, 2, 4, 0, 0]))
     >>> annealing_score(fw, fw)
     ((24, 6, [4, 2, 2, 0, 0, 0, 4, 0, 0, 0, 4, 0, 0, 0, 2, 2, 4]), (4, -18, [2, 2, 0, 2, 2]))
+    >>> annealing_score(fw, 'TTTGAATTTGG') == annealing_score_reference(fw, 'TTTGAATTTGG')
+    True
+    """
+    p = str(p).upper()
+    q = str(q).upper()
+    n = len(p)
+    m = len(q)
+    if not n or not m:
+        return annealing_score_reference(p, q)
+
+    ks, lengths, ss, a, ea = _diagonal_scores(_encode(p)[None,:], _encode(q[::-1])[None,:])
+
+    def state(values):
+        # the first offset with the highest value, like strict comparison of the reference
+        j = int(np.argmax(values))
+        return (int(values[j]), int(ks[j]), ss[0,j,:lengths[j]].tolist())
+
+    return state(a[0]), state(ea[0])
+
+def _diagonal_scores(w, v):
+    """
+    w, v: encoded p and reversed q, of shape (number of pairs, length).
+    return (offsets, score list lengths, score lists, max annealing scores, end annealing scores) of all offsets.
+    """
+    n = w.shape[1]
+    m = v.shape[1]
+    ks, wi, vi, valid, ri, lengths, ea_kind = _offsets(n, m)
+    ss = np.where(valid, _SCORE[w[:,wi], v[:,vi]], 0)
+    # scores read from right end
+    ss_r = np.where(valid, ss[:, np.arange(len(ks))[:,None], ri], 0)
+
+    left = _run_sum(ss)
+    right = _run_sum(ss_r)
+    ea = np.where(ea_kind == 3, np.maximum(left, right),
+                  np.where(ea_kind == 2, right, np.where(ea_kind == 1, left, -1)))
+    return ks[:,0], lengths, ss, ss.sum(axis=-1), ea
+
+def annealing_score_batch(ps, qs):
+    """
+    return (max annealing scores, end annealing scores) of annealing_score(p, q)
+    for each pair of ps and qs, as numpy arrays.
+    pairs of the same lengths are evaluated together.
+
+    >>> ps = ['GAAGGAGACCCAAATTCAAAGTT', 'GAAGGAGACCCAAATTCAAAGTT', 'ATGCAT']
+    >>> qs = ['CCTTTCTCCCTTCGTAGGT', 'GAAGGAGACCCAAATTCAAAGTT', 'ATGCAT']
+    >>> annealing_score_batch(ps, qs)
+    (array([18, 24, 16]), array([10,  4, 16]))
+    """
+    ps = [str(p).upper() for p in ps]
+    qs = [str(q).upper() for q in qs]
+    a = np.zeros(len(ps), dtype=np.int64)
+    ea = np.zeros(len(ps), dtype=np.int64)
+
+    groups = defaultdict(list)
+    for j, (p, q) in enumerate(zip(ps, qs)):
+        groups[(len(p), len(q))].append(j)
+
+    for (n, m), js in groups.items():
+        if not n or not m:
+            for j in js:
+                a_v, ea_v = annealing_score_reference(ps[j], qs[j])
+                a[j], ea[j] = a_v[0], ea_v[0]
+            continue
+        w = _encode(''.join(ps[j] for j in js)).reshape(len(js), n)
+        v = _encode(''.join(qs[j][::-1] for j in js)).reshape(len(js), m)
+        _, _, _, ga, gea = _diagonal_scores(w, v)
+        a[js] = ga.max(axis=1)
+        ea[js] = gea.max(axis=1)
+    return a, ea
+
+def annealing_score_reference(p,q):
+    """
+    pure python implementation of annealing_score.
+
+    >>> fw = 'GAAGGAGACCCAAATTCAAAGTT'
+    >>> rv = 'CCTTTCTCCCTTCGTAGGT'
+    >>> annealing_score_reference(fw, rv)
+    ((18, -7, [2, 4, 4, 0, 2, 0, 0, 0, 0, 0, 0, 0, 2, 4, 0, 0]), (10, -7, [2, 4, 4, 0, 2, 0, 0, 0, 0, 0, 0, 0, 2, 4, 0, 0]))
+    >>> annealing_score_reference(fw, fw)
+    ((24, 6, [4, 2, 2, 0, 0, 0, 4, 0, 0, 0, 4, 0, 0, 0, 2, 2, 4]), (4, -18, [2, 2, 0, 2, 2]))
     """
     sv = annealing_score_n
     p = str(p).upper()
@@ -0,0 +1,121 @@
+import numpy as np
+
+from .cpg import re_CpG, bisulfite_conversion, to_unambiguous
+from .template_index import template_index, DEFAULT_K
+
+__all__ = ['BisulfiteIndex', 'bisulfite_index']
+
+# (methyl, sense) of the four converted strands
+STRANDS = [(True, True), (False, True), (True, False), (False, False)]
+
+class BisulfiteIndex:
+    """
+    bisulfite converted strands of a template, their k-mer indexes and CpG sites.
+
+    bisulfite_conversion of each sense is made once, and the methyl and
+    unmethyl strands are resolved from it. every strand and its k-mer index
+    are built on first use and shared by all callers. conversion keeps
+    positions, so CpG sites of the template are those of all strands, and
+    are kept as a sorted array to be ranged by bisection.
+
+    >>> from seqtool.nucleotide import to_seq
+    >>> idx = BisulfiteIndex(to_seq('ATGCGCAACGTTCG'), k=4)
+    >>> idx.converted(True)
+    Seq('ATGYGTAAYGTTYG', IUPACAmbiguousDNA())
+    >>> idx.strand(methyl=False, sense=False)
+    Seq('ATACACAACATTCA', IUPACUnambiguousDNA())
+    >>> idx.cpg
+    array([ 3,  8, 12])
+    >>> idx.cpg_sites(3, 12), idx.count_cpg(4)
+    ([3, 8], 2)
+    >>> idx.find('AACGTT', methyl=True, sense=True)
+    ([6], [])
+    >>> idx.find('AACGTT', methyl=False, sense=True)
+    ([], [])
+    >>> idx.find('AAYGTT')
+    ([6], [])
+    """
+    def __init__(self, template, k=DEFAULT_K):
+        self.template = template
+        self.k = k
+        self._converted = {}
+        self._strands = {}
+        self._cpg = None
+
+    def __len__(self):
+        return len(self.template)
+
+    def converted(self, sense=True):
+        """
+        bisulfite_conversion of the template, CpG are Y (sense) or R (antisense).
+        """
+        if sense not in self._converted:
+            self._converted[sense] = bisulfite_conversion(self.template, sense=sense)
+        return self._converted[sense]
+
+    def strand(self, methyl, sense=True):
+        """
+        converted strand whose CpG are all methyl or all unmethyl.
+        """
+        key = (methyl, sense)
+        if key not in self._strands:
+            self._strands[key] = to_unambiguous(self.converted(sense), methyl=methyl)
+        return self._strands[key]
+
+    def strands(self):
+        """
+        list of ((methyl, sense), strand) of the four strands.
+        """
+        return [(key, self.strand(*key)) for key in STRANDS]
+
+    def index(self, methyl=None, sense=True):
+        """
+        TemplateIndex of a strand, or of the Y/R converted template if methyl is None.
+        """
+        seq = self.converted(sense) if methyl is None else self.strand(methyl, sense)
+        return template_index(seq, self.k)
+
+    def find(self, tail, methyl=None, sense=True):
+        """
+        TemplateIndex.find of tail on a strand. on the Y/R converted template,
+        tail matches only where it matches both methyl and unmethyl strands.
+        """
+        return self.index(methyl, sense).find(tail, template_ambiguous=methyl is None)
+
+    @property
+    def cpg(self):
+        if self._cpg is None:
+            self._cpg = np.array([m.start() for m in re_CpG.finditer(str(self.template).upper())], dtype=np.int64)
+        return self._cpg
+
+    def cpg_sites(self, start=None, end=None):
+        """
+        list of CpG positions t in start <= t < end, same as cpg.cpg_sites.
+        """
+        start = 0 if start is None else start
+        end = len(self.template) if end is None else end
+        cpg = self.cpg
+        return [int(t) for t in cpg[np.searchsorted(cpg, start):np.searchsorted(cpg, end)]]
+
+    def count_cpg(self, start=None, end=None):
+        start = 0 if start is None else start
+        end = len(self.template) if end is None else end
+        return int(np.searchsorted(self.cpg, end) - np.searchsorted(self.cpg, start))
+
+def bisulfite_index(template, k=DEFAULT_K):
+    """
+    return BisulfiteIndex of template. the index is cached on the template object.
+    """
+    key = '_bisulfite_index_{}'.format(k)
+    try:
+        return getattr(template, key)
+    except AttributeError:
+        pass
+
+    idx = BisulfiteIndex(template, k)
+    try:
+        setattr(template, key, idx)
+    except AttributeError:
+        # str template can not hold cache.
+        pass
+    return idx
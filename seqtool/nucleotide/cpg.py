@@ -143,11 +143,8 @@ def bisulfite(seq, methyl, sense=True):
     >>> bisulfite(Seq.Seq('ATGCGC'), methyl=False, sense=False)
     Seq('ATACAC', IUPACUnambiguousDNA())
     """
-    key = '_b' + ('m' if methyl else 'u') + ('p' if sense else 'n')
-
-    if not hasattr(seq, key):
-        setattr(seq, key, bisulfite_conversion_unambiguous(seq, sense=sense, methyl=methyl))
-    return getattr(seq, key)
+    from .bisulfite_index import bisulfite_index
+    return bisulfite_index(seq).strand(methyl, sense)
 
 def gc_ratio(seq):
     """
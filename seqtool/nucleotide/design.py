@@ -0,0 +1,457 @@
+import copy
+
+import numpy as np
+
+from . import primer_cond as pcond
+from . import melt_temp
+from .annealing import _SCORE, _encode
+from .cpg import to_unambiguous
+from .bisulfite_index import bisulfite_index
+from .primer import Primer, PrimerPair
+from .. import nucleotide
+from ..util.topk import BinnedTopK
+
+__all__ = ['PrimerDesigner', 'DesignedPair']
+
+##################################################################
+## exhaustive primer pair design, after c/bisearch.cpp
+##
+## every window of the template is a primer candidate. Tm and GC of all
+## windows are differences of prefix sums, and self annealing of a window
+## of length n is derived from windows of length n-1 and n-2, so all
+## candidates are scored in O(1) each. scores agree with PrimerCondition.
+##################################################################
+
+# width of product centers whose pairs are enumerated at once
+SLICE_WIDTH = 32
+# number of pairs whose pa and pea are evaluated at once, doubled for each chunk
+EVALUATION_CHUNK = 64
+
+# pairing of template bases, which is annealing of a primer and the reverse
+# complement of the template
+_IDENTITY = _SCORE[:, [1, 0, 3, 2, 4]]
+
+# weights of 2 x gc_ratio
+_GC2 = np.zeros(256, dtype=np.int64)
+for _c, _w in [('G', 2), ('C', 2), ('Y', 1), ('R', 1)]:
+    _GC2[ord(_c)] = _w
+
+def _prefix(values):
+    ret = np.zeros(len(values)+1, dtype=np.int64)
+    np.cumsum(values, out=ret[1:])
+    return ret
+
+def _shift(a, fill):
+    """
+    a[i+1] at i.
+    """
+    return np.append(a[1:], fill)
+
+class _Candidates:
+    """
+    primer candidates template[start:start+length] as numpy columns.
+
+    fw is the window itself and rv is its reverse complement, which share
+    length, gc, Tm and sa. sea of fw is annealing at the window 3' end, and
+    that of rv at the window 5' end.
+
+    template may have Y and R of bisulfite_conversion. primers are written
+    in letters of resolved (template by default), of which gc, sa and sea
+    are taken. cpg counts Y of template, and tm is Tm of the unmethyl
+    version (methyl if methyl) and otm that of the other version, both of
+    which are given by one lookup of the template.
+    """
+    def __init__(self, template, condition, pcr_mix, resolved=None, methyl=False):
+        s = str(template).upper()
+        L = len(s)
+        lmin = int(condition.primer_length.minimum)
+        lmax = min(int(condition.primer_length.maximum), L)
+        y = np.frombuffer(s.encode('ascii'), dtype=np.uint8) == ord('Y')
+        s = s if resolved is None else str(resolved).upper()
+        bases = np.frombuffer(s.encode('ascii'), dtype=np.uint8)
+        codes = _encode(s)
+
+        # sa_0, half of end run and full flag of windows of length n-2 and n-1.
+        # a full end run covers all pairs of the window.
+        zeros = np.zeros(L, dtype=np.int64)
+        s0 = [zeros, zeros]
+        half = [zeros, zeros]
+        full = [np.zeros(L, dtype=bool), np.ones(L, dtype=bool)]
+        sa_prefix = sa_suffix = sea_prefix = sea_suffix = zeros
+
+        idx = np.arange(L)
+        columns = []
+        for n in range(1, lmax+1):
+            sc = _SCORE[codes, codes[np.minimum(idx+n-1, L-1)]].astype(np.int64)
+            if n >= 2:
+                s0.append(_shift(s0[-2], 0) + 2*sc)
+                half.append(np.where(sc == 0, 0, sc + _shift(half[-2], 0)))
+                full.append((sc != 0) & _shift(full[-2], False))
+            else:
+                s0.append(zeros)
+                half.append(zeros)
+                full.append(np.zeros(L, dtype=bool))
+            s0.pop(0), half.pop(0), full.pop(0)
+
+            ea = np.where(full[-1], 2*half[-1], half[-1])
+            sa_prefix = np.maximum(sa_prefix, s0[-1])
+            sa_suffix = np.maximum(s0[-1], _shift(sa_suffix, 0))
+            sea_prefix = np.maximum(sea_prefix, ea)
+            sea_suffix = np.maximum(ea, _shift(sea_suffix, 0))
+
+            if n >= lmin:
+                starts = np.arange(L-n+1)
+                columns.append((starts, np.full(len(starts), n),
+                                np.maximum(sa_prefix, sa_suffix)[starts],
+                                sea_suffix[starts], sea_prefix[starts]))
+
+        def cat(k, dtype):
+            return np.concatenate([c[k] for c in columns]).astype(dtype) if columns else np.zeros(0, dtype=dtype)
+
+        self.start = cat(0, np.int64)
+        self.length = cat(1, np.int64)
+        self.end = self.start + self.length
+        self.sa = cat(2, np.int64)
+        self.sea_fw = cat(3, np.int64)
+        self.sea_rv = cat(4, np.int64)
+
+        gc2 = _prefix(_GC2[bases])
+        self.gc = 100. * ((gc2[self.end] - gc2[self.start]) / 2.) / self.length
+        self._cpg = _prefix(y)
+        self.cpg = self._cpg[self.end] - self._cpg[self.start]
+
+        tms = melt_temp.TemplateThermo(template).tm_range(self.start, self.end, pcr_mix, unmethyl=None)
+        self.tm, self.otm = tms[::-1] if methyl else tms
+
+        c = condition
+        common = c.primer_length.weight * np.abs(self.length - c.primer_length.optimal) \
+                 + c.gc.weight * np.abs(self.gc - c.gc.optimal) \
+                 + c.tm.weight * np.abs(self.tm - c.tm.optimal) \
+                 + c.sa.weight * np.abs(self.sa - c.sa.optimal)
+        self.score_fw = common + c.sea.weight * np.abs(self.sea_fw - c.sea.optimal)
+        self.score_rv = common + c.sea.weight * np.abs(self.sea_rv - c.sea.optimal)
+
+        def bound(cond, v):
+            return (cond.minimum <= v) & (v <= cond.maximum)
+
+        with np.errstate(invalid='ignore'):
+            valid = ~np.isnan(self.tm) & bound(c.gc, self.gc) & bound(c.tm, self.tm) & bound(c.sa, self.sa)
+        self.valid = valid
+        self.valid_fw = valid & bound(c.sea, self.sea_fw)
+        self.valid_rv = valid & bound(c.sea, self.sea_rv)
+
+    def __len__(self):
+        return len(self.start)
+
+    def cpg_in(self, starts, ends):
+        """
+        number of CpG in template[starts:ends].
+        """
+        return self._cpg[np.clip(ends, 0, len(self._cpg)-1)] - self._cpg[np.clip(starts, 0, len(self._cpg)-1)]
+
+class DesignedPair:
+    """
+    a designed primer pair, fw is template[fw_start:fw_end] and rv is
+    reverse complement of template[rv_start:rv_end].
+    """
+    def __init__(self, score, fw_start, fw_end, rv_start, rv_end, fw, rv, tm_fw, tm_rv, pa, pea,
+                 otm_fw=None, otm_rv=None):
+        self.score = score
+        self.fw_start = fw_start
+        self.fw_end = fw_end
+        self.rv_start = rv_start
+        self.rv_end = rv_end
+        self.fw = fw
+        self.rv = rv
+        self.tm_fw = tm_fw
+        self.tm_rv = tm_rv
+        self.pa = pa
+        self.pea = pea
+        # Tm of the other methylation version in bisulfite design
+        self.otm_fw = otm_fw
+        self.otm_rv = otm_rv
+
+    @property
+    def product_length(self):
+        return self.rv_end - self.fw_start
+
+    def rank(self):
+        return (self.fw_start, self.fw_end, self.rv_start, self.rv_end)
+
+    def primer_pair(self, name):
+        return PrimerPair(Primer(name+'-F', self.fw), Primer(name+'-R', self.rv))
+
+    def __repr__(self):
+        return '<DesignedPair {}-{} score={:.2f} {} {}>'.format(self.fw_start, self.rv_end, self.score, self.fw, self.rv)
+
+class PrimerDesigner:
+    """
+    exhaustive primer pair design of a template.
+
+    in bisulfite mode, primers are designed on the bisulfite converted sense
+    strand, and CpG cytosines are written as Y in forward primers and as R
+    in reverse primers, so that primers anneal regardless of methylation.
+    both methyl and unmethyl Tm must be within the condition, and the
+    difference is at most max_met_tm_diff.
+
+    with msp of 'methyl' or 'unmethyl', primers are methylation specific
+    (MSP) ones, where CpG are written as C and G, or as T and A. each
+    primer has at least min_cpg_in_primer CpG, one of which is within
+    msp_3prime bases of its 3' end, and is scored by the Tm of its version.
+    Tm of the other version at the same place is reported as oTm, so that
+    a methyl and an unmethyl design may be matched.
+
+    scores are those of condition.score_primerpair, and pairs whose score
+    exceed score_threshold are discarded. per_bin best pairs are kept for
+    each bin_size bases (1/100 of the template by default) of the template.
+
+    >>> t = 'GCCGTTAGCACCAGGATCTACCTGAAATCACCGCCTCGTTGAGTTGACCGCAACCCTTGCGTCGAGAGCAAGCCTTCCAAGTCACAGGCAAGCTCGTCTTCATTCTTAGGGTTCGGACATCAAGCGCACCCTTTACAATGGGCGATGCCAGTTCCTATACACACGTCGCAAACAATGTGTTCGATACCCGTCTGAAAGTAGGCCCAAACCGACCTTACGCTCAGTTGAT'
+    >>> d = PrimerDesigner(t, product_length=(100, 200))
+    >>> rs = d.design(max_results=3)
+    >>> [(r.fw_start, r.rv_end, round(r.score, 2)) for r in rs]
+    [(16, 212, 12.3), (14, 212, 12.7), (91, 212, 13.02)]
+    >>> abs(rs[0].score - pcond.NORMAL_PCR.score_primerpair(rs[0].primer_pair('P'))) < 1e-9
+    True
+    >>> [(r.fw_start, r.rv_end) for r in d.design(max_results=3, bin_size=50, min_distance=10)]
+    [(16, 212), (91, 212), (14, 168)]
+
+    >>> d = PrimerDesigner(t, bisulfite=True, primer_length=(18, 30), product_length=(100, 200), max_cpg_in_primer=2, max_met_tm_diff=5.)
+    >>> rs = d.design(max_results=1)
+    >>> abs(rs[0].score - pcond.BISULFITE_PCR.score_primerpair(rs[0].primer_pair('P'))) < 1e-9
+    True
+    >>> rs[0].otm_fw > rs[0].tm_fw
+    True
+    >>> print(d.write_seqv(rs, 'Bi'))
+    general:
+        sequence: GCCGTTAGCACCAGGATCTACCTGAAATCACCGCCTCGTTGAGTTGACCGCAACCCTTGCGTCGAGAGCAAGCCTTCCAAGTCACAGGCAAGCTCGTCTTCATTCTTAGGGTTCGGACATCAAGCGCACCCTTTACAATGGGCGATGCCAGTTCCTATACACACGTCGCAAACAATGTGTTCGATACCCGTCTGAAAGTAGGCCCAAACCGACCTTACGCTCAGTTGAT
+        show_bisulfite: True
+    <BLANKLINE>
+    primers:
+        //Bi-001: score=16.78, product=113, Tm=55.69/59.60, oTm=60.63/64.55, pa=20, pea=6
+        Bi-001-F: TGAAATTATYGTTTYGTTGAGTTG
+        Bi-001-R: TAAAAAATACRCTTAATATCCRAACCCT
+    <BLANKLINE>
+    bs_pcr:
+        Bi-001: Bi-001-F, Bi-001-R
+    <BLANKLINE>
+
+    >>> d = PrimerDesigner(t, msp='methyl', primer_length=(18, 30), product_length=(80, 200))
+    >>> r = d.design(max_results=1)[0]
+    >>> r.fw, r.rv
+    ('TTGAGTTGATCGTAATTTTTGC', 'ACTTTCAAACGAATATCGAA')
+    >>> abs(r.score - pcond.BISULFITE_PCR.score_primerpair(r.primer_pair('P'))) < 1e-9
+    True
+    """
+    def __init__(self, template, bisulfite=False, condition=None,
+                 primer_length=None, product_length=(100, 250),
+                 max_tm_diff=4., max_met_tm_diff=2.5, max_cpg_in_primer=1,
+                 score_threshold=100., pcr_mix=melt_temp.STANDARD_MIX,
+                 msp=None, min_cpg_in_primer=1, msp_3prime=3):
+        if msp not in (None, 'methyl', 'unmethyl'):
+            raise ValueError("msp must be 'methyl' or 'unmethyl': {}".format(msp))
+        self.template = nucleotide.to_unambiguous_seq(str(template).upper())
+        self.bisulfite = bisulfite = bisulfite or msp is not None
+        self.msp = msp
+        if condition is None:
+            condition = pcond.BISULFITE_PCR if bisulfite else pcond.NORMAL_PCR
+        self.condition = condition = copy.deepcopy(condition)
+        if primer_length:
+            condition.primer_length.minimum, condition.primer_length.maximum = primer_length
+        self.product_length = product_length
+        self.max_tm_diff = max_tm_diff
+        self.max_met_tm_diff = max_met_tm_diff
+        self.max_cpg_in_primer = max_cpg_in_primer
+        self.min_cpg_in_primer = min_cpg_in_primer
+        self.msp_3prime = msp_3prime
+        self.score_threshold = score_threshold
+        self.pcr_mix = pcr_mix
+
+        if bisulfite:
+            self.design_seq = str(bisulfite_index(self.template).converted(True))
+        else:
+            self.design_seq = str(self.template)
+        # letters of primers
+        if msp:
+            self.primer_seq = str(to_unambiguous(self.design_seq, methyl=msp == 'methyl'))
+        else:
+            self.primer_seq = self.design_seq
+        self._codes = _encode(self.primer_seq)
+        self._design_rc = str(nucleotide.to_seq(self.primer_seq).reverse_complement())
+
+        self._candidates = None
+        self.scorer = pcond.PrimerScorer(condition)
+
+    @property
+    def candidates(self):
+        if self._candidates is None:
+            self._candidates = _Candidates(self.design_seq, self.condition, self.pcr_mix,
+                                           self.primer_seq, self.msp == 'methyl')
+        return self._candidates
+
+    def _valid(self, c):
+        """
+        (valid fw, valid rv) masks including score threshold and bisulfite criteria.
+        """
+        valid = c.valid
+        if self.msp:
+            valid = valid & (c.cpg >= self.min_cpg_in_primer)
+            k = self.msp_3prime
+            return (valid & c.valid_fw & (c.cpg_in(c.end-k, c.end) > 0) & (c.score_fw <= self.score_threshold),
+                    valid & c.valid_rv & (c.cpg_in(c.start, c.start+k) > 0) & (c.score_rv <= self.score_threshold))
+        if self.bisulfite:
+            tm = self.condition.tm
+            with np.errstate(invalid='ignore'):
+                valid = valid & (tm.minimum <= c.otm) & (c.otm <= tm.maximum)
+                valid &= c.cpg <= self.max_cpg_in_primer
+                valid &= (c.cpg == 0) | (np.abs(c.tm - c.otm) <= self.max_met_tm_diff)
+        return (valid & c.valid_fw & (c.score_fw <= self.score_threshold),
+                valid & c.valid_rv & (c.score_rv <= self.score_threshold))
+
+    def _primer_seq(self, start, end, forward):
+        if forward:
+            return self.primer_seq[start:end]
+        L = len(self.primer_seq)
+        return self._design_rc[L-end:L-start]
+
+    def _pairs(self, fws, rvs, c0, c1):
+        """
+        (fw, rv) candidate indices of pairs whose product center is in [c0, c1).
+        fws are sorted by start and rvs by end.
+        """
+        c = self.candidates
+        pmin, pmax = self.product_length
+        fw_start = c.start[fws]
+        fws = fws[np.searchsorted(fw_start, c0 - pmax//2 - 1, 'left'):
+                  np.searchsorted(fw_start, c1 - pmin//2 + 1, 'right')]
+        i = c.start[fws]
+        rv_end = c.end[rvs]
+        lo = np.searchsorted(rv_end, np.maximum(2*c0 - i, i + pmin), 'left')
+        hi = np.searchsorted(rv_end, np.minimum(2*c1 - 1 - i, i + pmax), 'right')
+        counts = np.maximum(hi - lo, 0)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        f = np.repeat(fws, counts)
+        r = rvs[np.repeat(lo, counts) + offsets]
+
+        keep = c.start[r] >= c.end[f]
+        keep &= np.abs(c.tm[r] - c.tm[f]) <= self.max_tm_diff
+        if self.bisulfite and not self.msp:
+            keep &= np.abs(c.otm[r] - c.otm[f]) <= self.max_tm_diff
+        return f[keep], r[keep]
+
+    def _pa_lower_bound(self, f, r):
+        """
+        lower bound of pa of pairs, from pa of the shortest fw and rv at the
+        same start and end, whose alignments are parts of those of the pairs.
+        annealing_score pairs fw[a] with rv[k+a] for k in (m-n, 0] in another
+        way if fw is longer than rv, and such alignments are skipped then.
+        """
+        c = self.candidates
+        core = int(self.condition.primer_length.minimum)
+        lmax = int(self.condition.primer_length.maximum)
+        if not len(f) or core < 1:
+            return np.zeros(len(f))
+        L = len(self.design_seq)
+        keys, inverse = np.unique(c.start[f] * (L+1) + c.end[r], return_inverse=True)
+        rows = np.arange(core)[None,:]
+        w = self._codes[keys[:,None] // (L+1) + rows]
+        x = self._codes[keys[:,None] % (L+1) - core + rows]
+
+        bound = np.zeros(len(keys), dtype=np.int64)
+        safe = np.zeros(len(keys), dtype=np.int64)
+        for d in range(-(core-1), core):
+            a0, a1 = max(0, -d), min(core, core-d)
+            v = _IDENTITY[w[:,a0:a1], x[:,a0+d:a1+d]].sum(axis=1)
+            bound = np.maximum(bound, v)
+            if d >= 1 or d <= core - lmax:
+                safe = np.maximum(safe, v)
+        return np.where(c.length[f] <= c.length[r], bound[inverse], safe[inverse])
+
+    def design(self, max_results=200, bin_size=None, per_bin=5, min_distance=0):
+        """
+        return list of DesignedPair in the order of score, best first.
+        with min_distance, pairs of a bin whose product centers are closer
+        than min_distance to a better pair are dropped (see BinnedTopK).
+        """
+        c = self.candidates
+        L = len(self.design_seq)
+        bins = BinnedTopK(L, L // 100 if bin_size is None else bin_size, per_bin, min_distance)
+
+        valid_fw, valid_rv = self._valid(c)
+        fws = np.flatnonzero(valid_fw)
+        fws = fws[np.argsort(c.start[fws], kind='mergesort')]
+        rvs = np.flatnonzero(valid_rv)
+        rvs = rvs[np.argsort(c.end[rvs], kind='mergesort')]
+
+        # pairs are enumerated by slices of product center within a bin, and
+        # evaluated from the best. pa and pea only add to the score, so the
+        # rest of a slice is dropped once it does not beat the floor of the bin.
+        size = bins.bin_size
+        for b in range(len(bins.bins)):
+            end = L if b == len(bins.bins)-1 else (b+1)*size
+            for c0 in range(b*size, end, SLICE_WIDTH):
+                f, r = self._pairs(fws, rvs, c0, min(c0+SLICE_WIDTH, end))
+                score = c.score_fw[f] + c.score_rv[r]
+                keep = score <= min(self.score_threshold, bins.floors[b])
+                f, r = f[keep], r[keep]
+                keep = self._pa_lower_bound(f, r) <= self.condition.pa.maximum
+                f, r = f[keep], r[keep]
+                score = c.score_fw[f] + c.score_rv[r]
+                order = np.argsort(score, kind='mergesort')
+                k, n = 0, EVALUATION_CHUNK
+                while k < len(order):
+                    chunk = order[k:k+n]
+                    chunk = chunk[score[chunk] <= bins.floors[b]]
+                    if not len(chunk):
+                        break
+                    self._add_pairs(bins, f[chunk], r[chunk])
+                    # most of pairs fail pa or pea while the bin is not full
+                    k, n = k+n, 2*n
+
+        results = bins.items()
+        return results[:max_results] if max_results else results
+
+    def _add_pairs(self, bins, f, r):
+        c = self.candidates
+        cond = self.condition
+        fw = [self._primer_seq(int(c.start[k]), int(c.end[k]), True) for k in f]
+        rv = [self._primer_seq(int(c.start[k]), int(c.end[k]), False) for k in r]
+        pa, pea = np.array(self.scorer.annealings(fw, rv), dtype=np.int64).reshape(-1, 2).T
+        total = c.score_fw[f] + c.score_rv[r] \
+                + cond.pa.weight * np.abs(pa - cond.pa.optimal) \
+                + cond.pea.weight * np.abs(pea - cond.pea.optimal)
+        ok = (cond.pa.minimum <= pa) & (pa <= cond.pa.maximum) \
+             & (cond.pea.minimum <= pea) & (pea <= cond.pea.maximum) \
+             & (total <= self.score_threshold)
+
+        for k in np.flatnonzero(ok):
+            i, j = f[k], r[k]
+            pair = DesignedPair(float(total[k]), int(c.start[i]), int(c.end[i]), int(c.start[j]), int(c.end[j]),
+                                fw[k], rv[k], float(c.tm[i]), float(c.tm[j]), int(pa[k]), int(pea[k]),
+                                float(c.otm[i]), float(c.otm[j]))
+            bins.add((pair.fw_start + pair.rv_end) // 2, pair.score, pair, pair.rank())
+
+    def write_seqv(self, results, prefix='P'):
+        """
+        .seqv text of the template, primers: and pcr: or bs_pcr: sections of results.
+        """
+        section = 'bs_pcr' if self.bisulfite else 'pcr'
+        lines = ['general:', '    sequence: {}'.format(self.template)]
+        if self.bisulfite:
+            lines.append('    show_bisulfite: True')
+        lines += ['', 'primers:']
+        names = []
+        for k, r in enumerate(results):
+            name = '{}-{:03d}'.format(prefix, k+1)
+            names.append(name)
+            tm = 'Tm={:.2f}/{:.2f}'.format(r.tm_fw, r.tm_rv)
+            if self.bisulfite:
+                tm += ', oTm={:.2f}/{:.2f}'.format(r.otm_fw, r.otm_rv)
+            lines.append('    //{}: score={:.2f}, product={}, {}, pa={}, pea={}'.format(
+                name, r.score, r.product_length, tm, r.pa, r.pea))
+            lines.append('    {}-F: {}'.format(name, r.fw))
+            lines.append('    {}-R: {}'.format(name, r.rv))
+        lines += ['', '{}:'.format(section)]
+        for name in names:
+            lines.append('    {0}: {0}-F, {0}-R'.format(name))
+        lines.append('')
+        return '\n'.join(lines)
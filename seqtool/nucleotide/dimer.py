@@ -0,0 +1,122 @@
+import io
+import csv
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import primer_cond as pcond
+from .annealing import annealing_score_batch
+from ..util import xmlwriter
+
+__all__ = ['DimerMatrix']
+
+def _dimer_block(args):
+    """
+    pa and pea of rows x cols sequences.
+    """
+    rows, cols = args
+    a, ea = annealing_score_batch([p for p in rows for q in cols],
+                                  [q for p in rows for q in cols])
+    return a.reshape(len(rows), len(cols)), ea.reshape(len(rows), len(cols))
+
+class DimerMatrix:
+    """
+    pair annealing and pair end annealing of all primers against all primers.
+
+    pa[i, j], pea[i, j] are the scores of PrimerPair(primers[i], primers[j]),
+    and the diagonal is self annealing of each primer.
+    with processes > 1, rows are divided among a process pool.
+
+    >>> from seqtool.nucleotide.primer import Primer, PrimerPair
+    >>> ps = [Primer('a', 'GAAGGAGACCCAAATTCAAAGTT'), Primer('b', 'CCTTTCTCCCTTCGTAGGT'), Primer('c', 'ATGCAT')]
+    >>> m = DimerMatrix(ps)
+    >>> m.pa
+    array([[24, 18, 10],
+           [18, 28,  8],
+           [10,  8, 16]])
+    >>> m.pea[0, 1] == PrimerPair(ps[0], ps[1]).pea.score
+    True
+    >>> m.pairs()
+    [('a', 'a'), ('b', 'b'), ('c', 'c')]
+    >>> print(m.write_csv().strip())
+    pa,a,b,c
+    a,24,18,10
+    b,18,28,8
+    c,10,8,16
+    <BLANKLINE>
+    pea,a,b,c
+    a,4,10,4
+    b,10,2,2
+    c,4,2,16
+    >>> print(DimerMatrix([Primer('fw, 2nd', 'ATGC'), ps[1]], processes=2).write_csv().strip())
+    pa,"fw, 2nd",b
+    "fw, 2nd",8,6
+    b,6,28
+    <BLANKLINE>
+    pea,"fw, 2nd",b
+    "fw, 2nd",8,4
+    b,4,2
+    """
+    def __init__(self, primers, processes=1):
+        primers = list(primers)
+        self.names = [p.name for p in primers]
+        seqs = [str(p.full_seq) for p in primers]
+        n = len(seqs)
+
+        if processes > 1 and n > 1:
+            chunks = [c for c in np.array_split(np.arange(n), min(processes, n)) if len(c)]
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                blocks = list(executor.map(_dimer_block, [([seqs[i] for i in c], seqs) for c in chunks]))
+        else:
+            blocks = [_dimer_block((seqs, seqs))]
+
+        if n:
+            self.pa = np.vstack([a for a, ea in blocks])
+            self.pea = np.vstack([ea for a, ea in blocks])
+        else:
+            self.pa = np.zeros((0, 0), dtype=np.int64)
+            self.pea = np.zeros((0, 0), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.names)
+
+    def pairs(self, condition=pcond.NORMAL_PCR):
+        """
+        return list of (name, name) whose pa or pea is out of bound of condition.
+        each combination is reported once.
+        """
+        bad = (self.pa > condition.pa.maximum) | (self.pea > condition.pea.maximum)
+        bad |= bad.T
+        return [(self.names[i], self.names[j]) for i, j in zip(*np.nonzero(np.triu(bad)))]
+
+    def write_csv(self):
+        f = io.StringIO()
+        w = csv.writer(f, lineterminator='\n')
+        for title, m in [('pa', self.pa), ('pea', self.pea)]:
+            w.writerow([title] + self.names)
+            for name, row in zip(self.names, m):
+                w.writerow([name] + [int(v) for v in row])
+            w.writerow([])
+        return f.getvalue()
+
+    def write_html(self, w, condition=pcond.NORMAL_PCR):
+        # 0 for no annealing, 1 for the bound of condition or over
+        heat = np.maximum(self.pa / condition.pa.maximum, self.pea / condition.pea.maximum)
+        heat = np.clip(heat, 0., 1.)
+
+        b = xmlwriter.builder(w)
+        with b.div(cls='dimermatrix'):
+            with b.table(cls='dimermatrixtable', border=1):
+                with b.tr:
+                    b.th('pa/pea')
+                    for name in self.names:
+                        b.th(name)
+                for i, name in enumerate(self.names):
+                    with b.tr:
+                        b.th(name)
+                        for j in range(len(self.names)):
+                            g = int(255 * (1. - heat[i, j]))
+                            b.td('{}/{}'.format(self.pa[i, j], self.pea[i, j]),
+                                 style='background-color:rgb(255,{0},{0})'.format(g))
+
+            b.p('pa. pair annealing, pea. pair end annealing of row primer as forward and column primer as reverse', style='font-size:x-small')
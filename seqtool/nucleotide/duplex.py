@@ -0,0 +1,200 @@
+from math import log10
+from collections import defaultdict
+
+import numpy as np
+
+from . import melt_temp
+from .melt_temp import K, R, DEFAULT_MIX
+
+__all__ = ['duplex_dg', 'hairpin_dg', 'duplex_dg_batch', 'hairpin_dg_batch']
+
+##################################################################
+## SantaLucia, J., & Hicks, D. (2004).
+## The thermodynamics of DNA structural motifs.
+##
+## delta G [kcal/mol] of the most stable structure, negative is stable.
+## only Watson-Crick stacks are scored; a helix is an unbroken run of
+## complementary pairs with terminal penalties at both ends, and the best
+## helix of every alignment is found by dynamic programming over its pairs.
+##################################################################
+
+NN_LETTERS = melt_temp.NN_LETTERS
+# other letters never pair
+OTHER = len(NN_LETTERS)
+
+_codes = np.full(256, OTHER, dtype=np.intp)
+for _i, _c in enumerate(NN_LETTERS):
+    _codes[ord(_c)] = _i
+
+def _pad(table, shape):
+    ret = np.zeros(shape, dtype=np.float64)
+    ret[tuple(slice(0, s) for s in table.shape)] = table
+    return ret
+
+_STACK_H = _pad(melt_temp._SL_H.reshape(4, 4), (5, 5))
+_STACK_S = _pad(melt_temp._SL_S.reshape(4, 4), (5, 5))
+_TERMINAL_H = _pad(melt_temp._SL_TERMINAL_H, (5,))
+_TERMINAL_S = _pad(melt_temp._SL_TERMINAL_S, (5,))
+
+# hairpin loop initiation at 37C, by loop length
+HAIRPIN_LOOP_LENGTHS = [3, 4, 5, 6, 7, 8, 9, 10, 12, 14, 16, 18, 20, 25, 30]
+HAIRPIN_LOOP_DG = [3.5, 3.5, 3.3, 4.0, 4.2, 4.3, 4.5, 4.6, 5.0, 5.1, 5.3, 5.5, 5.7, 6.1, 6.3]
+MIN_HAIRPIN_LOOP = 3
+
+def _encode(seq):
+    return _codes[np.frombuffer(str(seq).upper().encode('ascii', 'replace'), dtype=np.uint8)]
+
+def _pair(a, b):
+    # A:T and C:G in ACGT order
+    return (a < OTHER) & (a + b == 3)
+
+def _loop_dg(length, temp_k):
+    """
+    hairpin loop delta G, which is entropic and scales with temperature.
+    """
+    length = np.asarray(length, dtype=np.float64)
+    l30 = HAIRPIN_LOOP_LENGTHS[-1]
+    dg37 = np.where(length <= l30,
+                    np.interp(length, HAIRPIN_LOOP_LENGTHS, HAIRPIN_LOOP_DG),
+                    HAIRPIN_LOOP_DG[-1] + 2.44 * R * (37.+K) / 1000. * np.log(np.maximum(length, l30) / l30))
+    return dg37 * temp_k / (37.+K)
+
+class _Thermo:
+    def __init__(self, temp, pcr_mix):
+        self.temp_k = temp + K
+        # salt correction of entropy for each stack
+        self.salt_s = 0.368 * log10(pcr_mix.cation_conc())
+
+    def stack(self, a, a_next):
+        # top strand dinucleotide a, a_next
+        return _STACK_H[a, a_next] - self.temp_k * (_STACK_S[a, a_next] + self.salt_s) / 1000.
+
+    def terminal(self, a):
+        return _TERMINAL_H[a] - self.temp_k * _TERMINAL_S[a] / 1000.
+
+def _best_helix(paired, stack, start, end):
+    """
+    pairs of each row are in helix order, stack[:, t] is the stack of pair t-1 and t.
+    start[:, t], end[:, t] are the costs to open and close a helix at pair t.
+    return the lowest delta G of a helix of at least 2 pairs for each row.
+    """
+    rows, cols = paired.shape
+    best = np.full(rows, np.inf)
+    opened = np.where(paired[:,0], start[:,0], np.inf)
+    extended = np.full(rows, np.inf)
+    for t in range(1, cols):
+        ok = paired[:,t-1] & paired[:,t]
+        extended = np.where(ok, np.minimum(opened, extended) + stack[:,t], np.inf)
+        best = np.minimum(best, extended + end[:,t])
+        opened = np.where(paired[:,t], start[:,t], np.inf)
+    return best
+
+def duplex_dg(p, q, temp=37., pcr_mix=DEFAULT_MIX):
+    """
+    delta G [kcal/mol] of the most stable helix of p (5'->3') and q (5'->3')
+    over all alignment offsets, 0 if no helix is formed.
+
+    >>> s = 'ATGCATGCCATGGTT'
+    >>> from seqtool.nucleotide import to_seq
+    >>> rc = str(to_seq(s).reverse_complement())
+    >>> abs(duplex_dg(s, rc, 60.) + melt_temp.sl_delta_g(s, DEFAULT_MIX.cation_conc(), 60.+K) / 1000.) < 1e-9
+    True
+    >>> round(duplex_dg('GAAGGAGACCCAAATTCAAAGTT', 'CCTTTCTCCCTTCGTAGGT'), 2)
+    -3.4
+    >>> duplex_dg('AAAAAA', 'AAAAAA')
+    0.0
+    """
+    return float(duplex_dg_batch([p], [q], temp, pcr_mix)[0])
+
+def duplex_dg_batch(ps, qs, temp=37., pcr_mix=DEFAULT_MIX):
+    """
+    duplex_dg of each pair of ps and qs as numpy array.
+    pairs of the same lengths are evaluated together.
+    """
+    ps = [str(p).upper() for p in ps]
+    qs = [str(q).upper()[::-1] for q in qs]
+    ret = np.zeros(len(ps))
+    th = _Thermo(temp, pcr_mix)
+
+    groups = defaultdict(list)
+    for k, (p, q) in enumerate(zip(ps, qs)):
+        groups[(len(p), len(q))].append(k)
+
+    for (n, m), ks in groups.items():
+        if not n or not m:
+            continue
+        w = _encode(''.join(ps[k] for k in ks)).reshape(len(ks), n)
+        v = _encode(''.join(qs[k] for k in ks)).reshape(len(ks), m)
+
+        # pairs of w[wi] and v[vi] at each alignment offset
+        offsets = np.arange(-(n-1), m)[:,None]
+        t = np.arange(min(n, m))[None,:]
+        wi = np.maximum(0, -offsets) + t
+        vi = np.maximum(0, offsets) + t
+        valid = (wi < n) & (vi < m)
+        a = np.where(valid, w[:, np.minimum(wi, n-1)], OTHER)
+        b = np.where(valid, v[:, np.minimum(vi, m-1)], OTHER)
+
+        ret[ks] = _best_helices(th, a, b, a[:,:,:-1], a[:,:,1:]).min(axis=1)
+    return np.minimum(ret, 0.)
+
+def _best_helices(th, a, b, stack_5p, stack_3p, loop=0.):
+    """
+    _best_helix of (sequences, alignments, helix position) arrays of paired bases a, b.
+    stack_5p, stack_3p are the top strand dinucleotides of stacks.
+    return array of (sequences, alignments).
+    """
+    shape = a.shape
+    paired = _pair(a, b)
+    stack = np.zeros(shape)
+    stack[:,:,1:] = th.stack(stack_5p, stack_3p)
+    term = th.terminal(a)
+    rows = shape[0] * shape[1]
+    best = _best_helix(paired.reshape(rows, -1), stack.reshape(rows, -1),
+                       (term + loop).reshape(rows, -1), term.reshape(rows, -1))
+    return best.reshape(shape[:2])
+
+def hairpin_dg(p, temp=37., pcr_mix=DEFAULT_MIX):
+    """
+    delta G [kcal/mol] of the most stable hairpin of p, 0 if no hairpin is formed.
+    a stem of p[i] ... p[i+l-1] paired with p[j-l+1] ... p[j] closes a loop of
+    at least MIN_HAIRPIN_LOOP bases.
+
+    >>> round(hairpin_dg('GGGCCCAAAAGGGCCC'), 2)
+    -3.68
+    >>> hairpin_dg('ATGCAAATTTTT')
+    0.0
+    """
+    return float(hairpin_dg_batch([p], temp, pcr_mix)[0])
+
+def hairpin_dg_batch(ps, temp=37., pcr_mix=DEFAULT_MIX):
+    """
+    hairpin_dg of each of ps as numpy array.
+    """
+    ps = [str(p).upper() for p in ps]
+    ret = np.zeros(len(ps))
+    th = _Thermo(temp, pcr_mix)
+
+    groups = defaultdict(list)
+    for k, p in enumerate(ps):
+        groups[len(p)].append(k)
+
+    for n, ks in groups.items():
+        if n < MIN_HAIRPIN_LOOP + 4:
+            continue
+        w = _encode(''.join(ps[k] for k in ks)).reshape(len(ks), n)
+
+        # each center c = i+j, pairs walk outward from the innermost pair allowed by the loop
+        centers = np.arange(2*MIN_HAIRPIN_LOOP+2, 2*n-2)[:,None]
+        inner = (centers - MIN_HAIRPIN_LOOP - 1) // 2
+        t = np.arange(n//2)[None,:]
+        i = inner - t
+        j = centers - i
+        valid = (i >= 0) & (j < n)
+        a = np.where(valid, w[:, np.clip(i, 0, n-1)], OTHER)
+        b = np.where(valid, w[:, np.clip(j, 0, n-1)], OTHER)
+
+        # top strand dinucleotide of the outer pair and the inner pair is p[i], p[i+1]
+        loop = _loop_dg(j - i - 1, th.temp_k)
+        ret[ks] = _best_helices(th, a, b, a[:,:,1:], a[:,:,:-1], loop).min(axis=1)
+    return np.minimum(ret, 0.)
@@ -1,6 +1,10 @@
 from math import log10, log, exp
 
-__all__ = ['melting_temperature_unambiguous','melting_temperature_unmethyl']
+import numpy as np
+
+from ..util.memoize import LRUCache
+
+__all__ = ['melting_temperature_unambiguous','melting_temperature_unmethyl','tm_batch','TemplateThermo','tm_grid','fraction_grid']
 
 # gas constant, [J/molK]
 R = 1.987
@@ -29,6 +33,12 @@ class PCRMixture(object):
         """
         return self.c_na + self.c_k + 4*(self.c_mg**0.5)
 
+    def key(self):
+        '''
+        hashable snapshot of the mixture.
+        '''
+        return (self.c_na, self.c_k, self.c_mg, self.c_primer, self.c_ntp)
+
 DEFAULT_C_NA = 33.*10**-3
 DEFAULT_C_K = 0
 DEFAULT_C_MG = (2+4.5)*10**-3
@@ -42,26 +52,70 @@ STANDARD_MIX = PCRMixture(50*10**-3, 0, 1*10**-3, 200*10**-9, 0)
 
 DEFAULT_MIX = STANDARD_MIX
 
-def melting_temperature_unmethyl(seq, pcr_mix=DEFAULT_MIX, unmethyl=True):
-    seq = str(seq).upper()
-    if unmethyl:
-        seq = seq.replace('R','A').replace('Y','T')
-    else:
-        seq = seq.replace('R','G').replace('Y','C')
+# shared cache of Tm and complex fraction, keyed on
+# (kind, sequence, PCRMixture.key(), ...). tm_batch shares the Tm entries
+# of the scalar functions. TemplateThermo, sl_suffix_fractions, tm_grid and
+# fraction_grid are not cached, as their values come from prefix sums of
+# a template or grids which are cheaper to recompute than to look up.
+THERMO_CACHE = LRUCache(maxsize=100000)
+
+_UNMETHYL_TABLE = str.maketrans('RY', 'AT')
+_METHYL_TABLE = str.maketrans('RY', 'GC')
+
+def _normalize(seqs, unmethyl):
+    '''
+    upper case sequences whose R/Y are resolved to unmethyl (A/T) or methyl (G/C) version.
+    '''
+    table = _UNMETHYL_TABLE if unmethyl else _METHYL_TABLE
+    return [str(s).upper().translate(table) for s in seqs]
 
+def melting_temperature_unmethyl(seq, pcr_mix=DEFAULT_MIX, unmethyl=True):
+    seq = _normalize([seq], unmethyl)[0]
     return melting_temperature_unambiguous(seq, pcr_mix)
 
+def tm_batch(seqs, pcr_mix=DEFAULT_MIX, unmethyl=True):
+    '''
+    melting_temperature_unmethyl of many sequences at once, as numpy array.
+
+    >>> seqs = ['ATGCATGCATGCAAT', 'GGCYRATGC', 'AT', 'A']
+    >>> tms = tm_batch(seqs)
+    >>> all(tms == [melting_temperature_unmethyl(s) for s in seqs])
+    True
+    >>> all(tm_batch(seqs, unmethyl=False) == [melting_temperature_unmethyl(s, unmethyl=False) for s in seqs])
+    True
+    >>> THERMO_CACHE.clear()
+    >>> tms = tm_batch(seqs + seqs)
+    >>> THERMO_CACHE.hits, THERMO_CACHE.misses
+    (0, 4)
+    >>> melting_temperature_unmethyl('GGCYRATGC') == tms[1]
+    True
+    >>> THERMO_CACHE.hits, THERMO_CACHE.misses
+    (1, 4)
+    '''
+    seqs = _normalize(seqs, unmethyl)
+    mix = pcr_mix.key()
+    tms = dict((s, THERMO_CACHE.lookup(('tm', s, mix), None)) for s in set(seqs) if ('tm', s, mix) in THERMO_CACHE)
+    missing = [s for s in set(seqs) if s not in tms]
+    if missing:
+        tms.update(zip(missing, wetmur_tm_batch(missing, pcr_mix.cation_conc(), pcr_mix.c_primer)))
+        for s in missing:
+            THERMO_CACHE.lookup(('tm', s, mix), tms.__getitem__, s)
+    return np.array([tms[s] for s in seqs], dtype=np.float64)
+
 
 def melting_temperature_unambiguous(seq, pcr_mix=DEFAULT_MIX):
     '''
     unmethyl:   if 'unmethyl' is true, all CpGs of template are assumed to be unmethyled
                 then unmethyl version of primer are used for calculation
     '''
-
-    return wetmur_tm(str(seq), pcr_mix.cation_conc(), pcr_mix.c_primer)
+    seq = str(seq)
+    return THERMO_CACHE.lookup(('tm', seq, pcr_mix.key()),
+                               wetmur_tm, seq, pcr_mix.cation_conc(), pcr_mix.c_primer)
 
 def complex_fraction(seq, anneal_temp, pcr_mix=DEFAULT_MIX):
-    return sl_fraction(str(seq), anneal_temp, pcr_mix.cation_conc(), pcr_mix.c_primer)
+    seq = str(seq)
+    return THERMO_CACHE.lookup(('fraction', seq, pcr_mix.key(), anneal_temp),
+                               sl_fraction, seq, anneal_temp, pcr_mix.cation_conc(), pcr_mix.c_primer)
 
 ##################################################################
 ## Wetmur, J. G., & Fresco, J. (1991). 
@@ -126,6 +180,33 @@ def wetmur_tm(seqstr, cation_conc, c_primer):
     salt_term =  16.6*log10(cation_conc / (1.+0.7*cation_conc)) + 3.85
     t_p = t0*d_h_p / (d_h_p-d_g_p + R*t0*log(c_primer) ) + salt_term - K
     return t_p
+
+def wetmur_tm_batch(seqs, cation_conc, c_primer):
+    '''
+    wetmur_tm of many sequences at once.
+    '''
+    codes, lengths = _encode_batch(seqs)
+    return _wetmur_tm(_nn_sum(codes, lengths, _NNT_DH), _nn_sum(codes, lengths, _NNT_DG), cation_conc, c_primer)
+
+def _wetmur_tm(nn_dh, nn_dg, cation_conc, c_primer):
+    '''
+    wetmur_tm from sums of nearest-neighbor values, as numpy arrays.
+    '''
+    salt_term =  16.6*log10(cation_conc / (1.+0.7*cation_conc)) + 3.85
+    return _wetmur_tm_terms(nn_dh, nn_dg, salt_term, log(c_primer))
+
+def _wetmur_tm_terms(nn_dh, nn_dg, salt_term, log_c_primer):
+    '''
+    salt_term and log_c_primer may be arrays broadcast against nn_dh, nn_dg.
+    '''
+    t0 = 298.2 # room temp.
+    d_h_e = 5.
+    d_h_p = -1000. * ( 2*d_h_e + nn_dh )
+    d_g_e = 1.
+    d_g_i = -2.2
+    d_g_p = -1000. * ( 2*d_g_e + d_g_i + nn_dg )
+    t_p = t0*d_h_p / (d_h_p-d_g_p + R*t0*log_c_primer ) + salt_term - K
+    return t_p
     
     
 
@@ -240,3 +321,293 @@ SantaLuciaS = {
 'TG' :  -22.7,
 'TT' :  -22.2,
 }
+
+
+##################################################################
+## batch computation
+##
+## dinucleotides are encoded as 4*first+second over 'ACGT', and
+## nearest-neighbor values are summed from 5' end with cumsum, in the same
+## order as the scalar functions, so that the results are identical.
+##################################################################
+
+NN_LETTERS = 'ACGT'
+
+_letter_codes = np.full(256, 255, dtype=np.uint8)
+for _i, _c in enumerate(NN_LETTERS):
+    _letter_codes[ord(_c)] = _i
+
+def _nn_table(values):
+    return np.array([values[a+b] for a in NN_LETTERS for b in NN_LETTERS], dtype=np.float64)
+
+def _terminal_table(values):
+    return np.array([values[a] for a in NN_LETTERS], dtype=np.float64)
+
+_NNT_DH = _nn_table(NNT_DH)
+_NNT_DG = _nn_table(NNT_DG)
+# NNT_DH and NNT_DG in integer units of 0.1 and 0.01
+DH_SCALE = 10
+DG_SCALE = 100
+_NNT_DH_INT = np.round(_NNT_DH * DH_SCALE).astype(np.int64)
+_NNT_DG_INT = np.round(_NNT_DG * DG_SCALE).astype(np.int64)
+_SL_H = _nn_table(SantaLuciaH)
+_SL_S = _nn_table(SantaLuciaS)
+_SL_TERMINAL_H = _terminal_table(SantaLuciaTerminalH)
+_SL_TERMINAL_S = _terminal_table(SantaLuciaTerminalS)
+
+def _encode_batch(seqs):
+    '''
+    return (code matrix padded with 0, lengths) of sequences consist of ACGT.
+    '''
+    seqs = [str(s) for s in seqs]
+    lengths = np.array([len(s) for s in seqs], dtype=np.int64)
+    flat = _letter_codes[np.frombuffer(''.join(seqs).encode('ascii'), dtype=np.uint8)]
+    if (flat == 255).any():
+        raise KeyError('base must be one of {}'.format(NN_LETTERS))
+
+    codes = np.zeros((len(seqs), max(lengths.max(), 2) if len(seqs) else 2), dtype=np.uint8)
+    rows = np.repeat(np.arange(len(seqs)), lengths)
+    starts = np.cumsum(lengths) - lengths
+    codes[rows, np.arange(len(flat)) - starts[rows]] = flat
+    return codes, lengths
+
+def _nn_sum(codes, lengths, table):
+    '''
+    sum of nearest-neighbor values of each row.
+    '''
+    values = table[4*codes[:,:-1].astype(np.intp) + codes[:,1:]]
+    cum = np.cumsum(values, axis=1)
+    last = np.maximum(lengths-2, 0)
+    return np.where(lengths >= 2, cum[np.arange(len(lengths)), last], 0.)
+
+def _prefix(values):
+    ret = np.zeros(len(values)+1, dtype=np.int64)
+    np.cumsum(values, out=ret[1:])
+    return ret
+
+# rows of TemplateThermo by unmethyl, None for both
+_VERSION_ROWS = {True: 0, False: 1, None: slice(None)}
+
+class TemplateThermo:
+    """
+    nearest-neighbor values of a template accumulated from 5' end.
+
+    built once per template, Tm of any substring is given in O(1) from
+    differences of the cumulative arrays. values are accumulated as integers
+    of DH_SCALE, DG_SCALE units so that differences are exact, and results
+    agree with wetmur_tm within floating point rounding.
+    substrings which contain other than ACGTRY have nan Tm.
+
+    >>> t = TemplateThermo('ATGCATGCATGCAATNNATGCYGR')
+    >>> abs(t.tm(2, 14) - melting_temperature_unmethyl('GCATGCATGCAA')) < 1e-9
+    True
+    >>> abs(t.tm(17, 24, unmethyl=False) - melting_temperature_unmethyl('ATGCYGR', unmethyl=False)) < 1e-9
+    True
+    >>> t.tm(12, 18)
+    nan
+    >>> tm, otm = t.tm_range([17], [24], unmethyl=None)
+    >>> (tm == t.tm(17, 24)).all(), (otm == t.tm(17, 24, unmethyl=False)).all()
+    (True, True)
+    >>> w = t.tm_windows(12)
+    >>> len(w), abs(w[2] - t.tm(2, 14)) < 1e-9, int(np.isnan(w).sum())
+    (13, True, 9)
+    """
+    def __init__(self, template):
+        self.length = len(template)
+        cums = []
+        for unmethyl in [True, False]:
+            s = _normalize([template], unmethyl)[0]
+            codes = _letter_codes[np.frombuffer(s.encode('ascii'), dtype=np.uint8)]
+            invalid = codes == 255
+            codes = np.where(invalid, 0, codes).astype(np.intp)
+            nn = 4*codes[:-1] + codes[1:]
+            cums.append((_prefix(_NNT_DH_INT[nn]), _prefix(_NNT_DG_INT[nn]), _prefix(invalid)))
+        # rows of unmethyl and methyl version
+        self._cum_dh, self._cum_dg, self._cum_invalid = [np.vstack(c) for c in zip(*cums)]
+
+    def __len__(self):
+        return self.length
+
+    def nn_sums(self, starts, ends, unmethyl=True):
+        """
+        return (sum of NNT_DH, sum of NNT_DG, valid) of template[starts:ends].
+        with unmethyl=None, each is an array of rows of unmethyl and methyl version.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        row = _VERSION_ROWS[unmethyl]
+        last = np.maximum(ends-1, starts)
+        dh = (self._cum_dh[row, last] - self._cum_dh[row, starts]) / DH_SCALE
+        dg = (self._cum_dg[row, last] - self._cum_dg[row, starts]) / DG_SCALE
+        valid = self._cum_invalid[row, ends] == self._cum_invalid[row, starts]
+        return dh, dg, valid
+
+    def tm_range(self, starts, ends, pcr_mix=DEFAULT_MIX, unmethyl=True):
+        """
+        Tm of template[starts:ends] for each pair of starts and ends.
+        with unmethyl=None, rows of unmethyl and methyl Tm from the same lookup.
+        """
+        dh, dg, valid = self.nn_sums(starts, ends, unmethyl)
+        tm = _wetmur_tm(dh, dg, pcr_mix.cation_conc(), pcr_mix.c_primer)
+        return np.where(valid, tm, np.nan)
+
+    def tm(self, start, end, pcr_mix=DEFAULT_MIX, unmethyl=True):
+        return float(self.tm_range([start], [end], pcr_mix, unmethyl)[0])
+
+    def tm_windows(self, length, pcr_mix=DEFAULT_MIX, unmethyl=True):
+        """
+        Tm of template[i:i+length] for all i.
+        """
+        starts = np.arange(max(self.length-length+1, 0))
+        return self.tm_range(starts, starts+length, pcr_mix, unmethyl)
+
+def _terminals(codes, lengths, table):
+    rows = np.arange(len(lengths))
+    return table[codes[:,0]], table[codes[rows, np.maximum(lengths-1, 0)]]
+
+def sl_delta_s_batch(seqs, cation_conc):
+    '''
+    >>> seqs = ['ATGCATGCATGCAAT', 'GGCATGC', 'AT']
+    >>> all(sl_delta_s_batch(seqs, 0.05) == [sl_delta_s(s, 0.05) for s in seqs])
+    True
+    '''
+    codes, lengths = _encode_batch(seqs)
+    return _sl_delta_s(codes, lengths, cation_conc)
+
+def _sl_delta_s(codes, lengths, cation_conc):
+    first, last = _terminals(codes, lengths, _SL_TERMINAL_S)
+    ret = _nn_sum(codes, lengths, _SL_S)
+    ret += first
+    ret += last
+    delta_s = -1 * ret
+    return delta_s - 0.368 * (lengths-1) * log10(cation_conc)
+
+def sl_delta_h_batch(seqs):
+    '''
+    >>> seqs = ['ATGCATGCATGCAAT', 'GGCATGC', 'AT']
+    >>> all(sl_delta_h_batch(seqs) == [sl_delta_h(s) for s in seqs])
+    True
+    '''
+    codes, lengths = _encode_batch(seqs)
+    return _sl_delta_h(codes, lengths)
+
+def _sl_delta_h(codes, lengths):
+    first, last = _terminals(codes, lengths, _SL_TERMINAL_H)
+    ret = _nn_sum(codes, lengths, _SL_H)
+    ret += first
+    ret += last
+    return -1 * ret
+
+def sl_delta_g_batch(seqs, cation_conc, temp_k):
+    '''
+    >>> seqs = ['ATGCATGCATGCAAT', 'GGCATGC', 'AT']
+    >>> all(sl_delta_g_batch(seqs, 0.05, 330.) == [sl_delta_g(s, 0.05, 330.) for s in seqs])
+    True
+    '''
+    codes, lengths = _encode_batch(seqs)
+    return 1000. * _sl_delta_h(codes, lengths) - temp_k * _sl_delta_s(codes, lengths, cation_conc)
+
+def sl_tm_batch(seqs, cation_conc, primer_conc):
+    '''
+    >>> seqs = ['ATGCATGCATGCAAT', 'GGCATGC', 'AT']
+    >>> all(sl_tm_batch(seqs, 0.05, 2e-7) == [sl_tm(s, 0.05, 2e-7) for s in seqs])
+    True
+    '''
+    codes, lengths = _encode_batch(seqs)
+    delta_s = _sl_delta_s(codes, lengths, cation_conc)
+    delta_h = _sl_delta_h(codes, lengths)
+    tm = 1000. * delta_h / ( delta_s - R * log10(primer_conc/4.) )
+    return tm - K
+
+# SantaLucia values in integer units of 0.1
+SL_SCALE = 10
+_SL_H_INT = np.round(_SL_H * SL_SCALE).astype(np.int64)
+_SL_S_INT = np.round(_SL_S * SL_SCALE).astype(np.int64)
+
+def sl_suffix_fractions(seqstr, aneal_temps, cation_conc, primer_conc):
+    '''
+    sl_fraction of every 3' suffix of seqstr at every annealing temperature.
+
+    delta H and delta S are extended by one dinucleotide per suffix length,
+    so all suffixes cost O(len(seqstr)) for each temperature.
+    ret[t, k-1] is the fraction of seqstr[-k:] at aneal_temps[t], and agrees
+    with sl_fraction within floating point rounding.
+
+    >>> f = sl_suffix_fractions('ATGCATGCAAT', [40., 60.], 0.05, 2e-7)
+    >>> f.shape
+    (2, 11)
+    >>> abs(f[1, 5] / sl_fraction('TGCAAT', 60., 0.05, 2e-7) - 1) < 1e-12
+    True
+    '''
+    codes, lengths = _encode_batch([seqstr[::-1]])
+    codes = codes[0, :lengths[0]].astype(np.intp)
+    ks = np.arange(1, len(codes)+1)
+
+    # nearest-neighbor sums of suffixes, seqstr is reversed to dinucleotides of 5'->3'.
+    nn = 4*codes[1:] + codes[:-1]
+    nn_h = np.concatenate([[0], np.cumsum(_SL_H_INT[nn])]) / SL_SCALE
+    nn_s = np.concatenate([[0], np.cumsum(_SL_S_INT[nn])]) / SL_SCALE
+
+    delta_h = -1 * (nn_h + _SL_TERMINAL_H[codes] + _SL_TERMINAL_H[codes[0]])
+    delta_s = -1 * (nn_s + _SL_TERMINAL_S[codes] + _SL_TERMINAL_S[codes[0]])
+    delta_s = delta_s - 0.368 * (ks-1) * log10(cation_conc)
+
+    temp_k = np.asarray(aneal_temps, dtype=np.float64)[:,None] + K
+    delta_g = 1000. * delta_h - temp_k * delta_s
+    a = primer_conc * np.exp(delta_g / (R * temp_k))
+    return a/(1.+a)
+
+##################################################################
+## condition grid
+##
+## sequence dependent sums are computed once, and only salt and
+## concentration terms are evaluated for each PCRMixture.
+##################################################################
+
+def tm_grid(seqs, pcr_mixes, unmethyl=True):
+    '''
+    melting_temperature_unmethyl of each sequence in each PCRMixture.
+    ret[i, j] is Tm of seqs[i] in pcr_mixes[j]. seqs may be Primers, as str(primer) is its sequence.
+
+    >>> seqs = ['ATGCATGCATGCAAT', 'GGCYRATGC']
+    >>> mixes = [STANDARD_MIX, PCRMixture(50e-3, 0, 2e-3, 500e-9, 0)]
+    >>> g = tm_grid(seqs, mixes)
+    >>> g.shape
+    (2, 2)
+    >>> all(g[i, j] == melting_temperature_unmethyl(s, m) for i, s in enumerate(seqs) for j, m in enumerate(mixes))
+    True
+    '''
+    codes, lengths = _encode_batch(_normalize(seqs, unmethyl))
+    nn_dh = _nn_sum(codes, lengths, _NNT_DH)[:,None]
+    nn_dg = _nn_sum(codes, lengths, _NNT_DG)[:,None]
+
+    salt_term = np.array([16.6*log10(c / (1.+0.7*c)) + 3.85 for c in (m.cation_conc() for m in pcr_mixes)])
+    log_c_primer = np.array([log(m.c_primer) for m in pcr_mixes])
+    return _wetmur_tm_terms(nn_dh, nn_dg, salt_term, log_c_primer)
+
+def fraction_grid(seqs, pcr_mixes, aneal_temps, unmethyl=True):
+    '''
+    complex_fraction of each sequence in each PCRMixture at each annealing temperature.
+    ret[i, j, k] is the fraction of seqs[i] in pcr_mixes[j] at aneal_temps[k].
+
+    >>> seqs = ['ATGCATGCATGCAAT', 'GGCATGC']
+    >>> mixes = [STANDARD_MIX, PCRMixture(50e-3, 0, 2e-3, 500e-9, 0)]
+    >>> g = fraction_grid(seqs, mixes, [50., 60., 70.])
+    >>> g.shape
+    (2, 2, 3)
+    >>> all(abs(g[i, j, k] / complex_fraction(s, t, m) - 1) < 1e-12 for i, s in enumerate(seqs) for j, m in enumerate(mixes) for k, t in enumerate([50., 60., 70.]))
+    True
+    '''
+    codes, lengths = _encode_batch(_normalize(seqs, unmethyl))
+    delta_h = _sl_delta_h(codes, lengths)[:,None,None]
+    delta_s = _sl_delta_s(codes, lengths, 1.)[:,None,None]
+    lengths = lengths[:,None,None]
+
+    log_cation = np.array([log10(m.cation_conc()) for m in pcr_mixes])[None,:,None]
+    c_primer = np.array([m.c_primer for m in pcr_mixes])[None,:,None]
+    temp_k = np.asarray(aneal_temps, dtype=np.float64)[None,None,:] + K
+
+    delta_s = delta_s - 0.368 * (lengths-1) * log_cation
+    delta_g = 1000. * delta_h - temp_k * delta_s
+    a = c_primer * np.exp(delta_g / (R * temp_k))
+    return a/(1.+a)
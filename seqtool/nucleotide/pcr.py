@@ -2,25 +2,46 @@
 
 from Bio import Seq
 from collections import defaultdict
+
+import numpy as np
+
 from . import PPrintSequence, no_stop_in_frame, to_seq
 from ..util.memoize import memoize
 from ..util import xmlwriter
-from .cpg import bisulfite, bisulfite_conversion, cpg_sites, count_cpg, bisulfite_conversion_unambiguous
+from .cpg import cpg_sites, count_cpg
+from .bisulfite_index import bisulfite_index
 from ..view.baseseq_renderer import BaseseqRenderer
 
 
 from .primer import PrimerPair, Primer, PrimerPartial
+from .primerset import PrimerSet
 
 MAX_PRODUCT_SIZE = 1500
 
+# default of arguments whose None has a meaning
+_DEFAULT = object()
+
 product_alignment_view_count = 0
 
 __all__ = ['PCR', 'BisulfitePCR', 'RtPCR']
 
+# coordinates of products, see PCRProduct
+PRODUCT_DTYPE = np.dtype([('fw_hit', np.int64),
+                          ('rv_hit', np.int64),
+                          ('start_0', np.int64),
+                          ('start', np.int64),
+                          ('start_i', np.int64),
+                          ('end_i', np.int64),
+                          ('end', np.int64),
+                          ('end_0', np.int64)])
+
 class PCRProduct:
     fcount = 0
-    
-    def __init__(self, i, j, pcr):
+
+    __slots__ = ('pcr', 'hits', 'fw_hit', 'rv_hit', 'start_0', 'start', 'start_i', 'end_i', 'end', 'end_0',
+                 '_parts', '_primerpair')
+
+    def __init__(self, pcr, hits, record):
         """
         template:
                      i.left  i.right       j.left j.right   
@@ -30,65 +51,105 @@ class PCRProduct:
                                              <----------|
         seq:        0   v[0]  v[1]          v[2] v[3]  v[4]
 
+        a product is fw_hit and rv_hit of PrimerHits with coordinates of a
+        PRODUCT_DTYPE record. annealings, sequence and partial primers are
+        built on first use.
         """
         self.pcr = pcr
-        assert(i.template == j.template)
-        assert(i <= j)
+        self.hits = hits
+        (self.fw_hit, self.rv_hit, self.start_0, self.start,
+         self.start_i, self.end_i, self.end, self.end_0) = [int(v) for v in record]
 
-        self.i = i
-        self.j = j
+    @property
+    def i(self):
+        return self.hits.annealing(self.fw_hit)
 
-        self.fw = i.primer
-        self.rv = j.primer
+    @property
+    def j(self):
+        return self.hits.annealing(self.rv_hit)
 
-        self.template = i.template
+    @property
+    def fw(self):
+        return self.hits.primers[self.hits.records[self.fw_hit]['primer']]
 
-        self.start_0 =  i.leftmost
-        self.start = i.match_left
-        self.start_i = i.match_right
-        self.end_i = j.match_left
-        self.end = j.match_right
-        self.end_0 =  j.rightmost
+    @property
+    def rv(self):
+        return self.hits.primers[self.hits.records[self.rv_hit]['primer']]
 
-        self.head = i.primer_adapter_sense
-        self.fw_3 = i.primer_match_sense
-        self.middle = self.template[self.start_i:self.end_i]
-        self.rv_3 = j.primer_match_sense
-        self.tail = j.primer_adapter_sense
+    @property
+    def template(self):
+        return self.hits.template
 
-        if len(self.head)>0:
-            p = i.primer_match
-            self.fwp = PrimerPartial(i.primer.name, i.primer.seq, len(p))
-        else:
-            self.fwp = i.primer
+    @property
+    def parts(self):
+        """
+        [head, fw_3, middle, rv_3, tail]
+        """
+        try:
+            return self._parts
+        except AttributeError:
+            i, j = self.i, self.j
+            self._parts = [i.primer_adapter_sense, i.primer_match_sense,
+                           self.template[self.start_i:self.end_i],
+                           j.primer_match_sense, j.primer_adapter_sense]
+            return self._parts
+
+    head = property(lambda self: self.parts[0])
+    fw_3 = property(lambda self: self.parts[1])
+    middle = property(lambda self: self.parts[2])
+    rv_3 = property(lambda self: self.parts[3])
+    tail = property(lambda self: self.parts[4])
 
-        if len(self.tail)>0:
-            p = j.primer_match
-            self.rvp = PrimerPartial(j.primer.name, j.primer.seq, len(p))
-        else:
-            self.rvp = j.primer
+    @property
+    def seq(self):
+        head, fw_3, middle, rv_3, tail = self.parts
+        return head + fw_3 + middle + rv_3 + tail
+
+    @property
+    def v(self):
+        fw = self.start_i - self.start_0
+        middle = fw + max(0, self.end_i - self.start_i)
+        return [self.start - self.start_0, fw, middle, middle + self.end - self.end_i, len(self)]
 
-        self.partial_match = bool(self.head or self.tail)
-        self.primerpair = PrimerPair(self.fwp, self.rvp)
+    @property
+    def partsv(self):
+        v = self.v
+        return [(0,v[0]), (v[0],v[1]), (v[1],v[2]), (v[2],v[3]), (v[3],v[4])]
+
+    @property
+    def partial_match(self):
+        return self.start_0 != self.start or self.end != self.end_0
+
+    @property
+    def fwp(self):
+        if self.start_0 != self.start:
+            return PrimerPartial(self.fw.name, self.fw.seq, self.start_i - self.start)
+        return self.fw
 
-        self.parts = [self.head, self.fw_3, self.middle, self.rv_3, self.tail]
-        self.seq = self.head + self.fw_3 + self.middle + self.rv_3 + self.tail
-        v = []
-        k = 0
-        for part in self.parts:
-            k += len(part)
-            v.append(k)
-        self.v = v
-        self.partsv = [(0,v[0]), (v[0],v[1]), (v[1],v[2]), (v[2],v[3]), (v[3],v[4])]
+    @property
+    def rvp(self):
+        if self.end != self.end_0:
+            return PrimerPartial(self.rv.name, self.rv.seq, self.end - self.end_i)
+        return self.rv
+
+    @property
+    def primerpair(self):
+        try:
+            return self._primerpair
+        except AttributeError:
+            self._primerpair = PrimerPair(self.fwp, self.rvp)
+            return self._primerpair
 
     def cpg_sites(self):
-        return cpg_sites(self.template, (self.start_i, self.end_i))
+        # conversions keep CpG sites of the original template
+        return bisulfite_index(self.pcr.template).cpg_sites(self.start_i, self.end_i)
 
     def __repr__(self):
         return "PCRProduct(%s -> %s: %s)"%(self.fw.name, self.rv.name, self.seq)
 
     def __len__(self):
-        return len(self.seq)
+        # middle is empty if primers overlap
+        return (self.start_i - self.start_0) + max(0, self.end_i - self.start_i) + (self.end_0 - self.end_i)
 
     def __str__(self):
         return str(self.seq)
@@ -144,27 +205,54 @@ class PCRProduct:
             b.a('.seq file',href=subfs.get_link_path(filename))
 
 class PCRProducts:
-    def __init__(self, products):
-        self.products = list(products)
+    """
+    products of PCR as an array of PRODUCT_DTYPE records.
+    PCRProduct of a record is made on first access and kept.
+    """
+    def __init__(self, pcr, hits, fw_hits=(), rv_hits=()):
+        self.pcr = pcr
+        self.hits = hits
+        r = np.zeros(len(fw_hits), dtype=PRODUCT_DTYPE)
+        if len(r):
+            r['fw_hit'] = fw_hits
+            r['rv_hit'] = rv_hits
+            r['start_0'] = hits.leftmost[fw_hits]
+            r['start'] = hits.match_left[fw_hits]
+            r['start_i'] = hits.match_right[fw_hits]
+            r['end_i'] = hits.match_left[rv_hits]
+            r['end'] = hits.match_right[rv_hits]
+            r['end_0'] = hits.rightmost[rv_hits]
+        self.records = r
+        self._products = {}
 
     def __repr__(self):
-        return repr(self.products)
+        return repr(list(self))
 
     def __len__(self):
-        return len(self.products)
+        return len(self.records)
+
+    def __getitem__(self, k):
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError('product index out of range')
+        if k not in self._products:
+            self._products[k] = PCRProduct(self.pcr, self.hits, self.records[k])
+        return self._products[k]
 
     def write_html(self, b, toc, subfs, callback = None):
         w = b.get_writer()
-        if len(self.products) > 0:
+        if len(self) > 0:
             with b.div(klass='products'):
-                for c in self.products:
+                for c in self:
                     c.write_html(b, toc, subfs, callback)
         else:
             with b.div(klass='products'):
                 b.p('no products')
 
     def __iter__(self):
-        yield from self.products
+        for k in range(len(self)):
+            yield self[k]
 
 def alignview(template, fw, rv, bisulfite, seqview):
     if seqview:
@@ -176,7 +264,7 @@ def alignview(template, fw, rv, bisulfite, seqview):
     return aseq
         
 class PCR:
-    def __init__(self, name, template, primer_fw, primer_rv):
+    def __init__(self, name, template, primer_fw, primer_rv, max_product_size=None, workspace=None):
         """
                          11111111112222222222333333333344444444445555555555666666
                012345678901234567890123456789012345678901234567890123456789012345
@@ -206,6 +294,13 @@ class PCR:
         Seq('TCTTGTAAGAGTTGTG', IUPACUnambiguousDNA())
         >>> p.tail
         Seq('CTCGAGTCT', IUPACUnambiguousDNA())
+        >>> pcr.count_products(), pcr.count_products(max_product_size=50)
+        (1, 0)
+        >>> short = PCR('B2M', t, fw, rv, max_product_size=50)
+        >>> short.count_products(), short.count_products(max_product_size=None)
+        (0, 1)
+
+        with workspace (TemplateWorkspace), primer hits are borrowed from it.
         """
         assert(isinstance(template, Seq.Seq))
         assert(isinstance(name, str))
@@ -219,32 +314,39 @@ class PCR:
         self.rv = self.primers.rv
         self.pair_annealing = self.primers.pair_annealing
         self.pair_end_annealing = self.primers.pair_end_annealing
+        self.max_product_size = max_product_size
+        self.workspace = workspace
 
-        self.products = PCRProducts(self._search(self.template))
+        self.products = self._search(self.template)
 
     @property
     @memoize
     def primer_score(self):
+        if self.workspace is not None:
+            return self.workspace.scorer.score_primerpairs([self.primers])[0]
         return self.primers.score
 
+    def _hits(self, template, template_ambiguous=False):
+        if self.workspace is not None:
+            return self.workspace.hits(template, [self.fw, self.rv], template_ambiguous)
+        return PrimerSet([self.fw, self.rv], template_ambiguous).hits(template)
+
     def _search(self, template, template_ambiguous=False):
-        fpp,fpc = self.fw.search(template,template_ambiguous)
-        rpp,rpc = self.rv.search(template,template_ambiguous)
-
-        for i in fpp:
-            for j in fpc: # fw -> fw
-                if i <= j:
-                    yield PCRProduct(i,j,self)
-            for j in rpc: # fw -> rv
-                if i <= j:
-                    yield PCRProduct(i,j,self)
-        for i in rpp:
-            for j in fpc: # rv -> fw
-                if i <= j:
-                    yield PCRProduct(i,j,self)
-            for j in rpc: # rv -> rv
-                if i <= j:
-                    yield PCRProduct(i,j,self)
+        """
+        PCRProducts of template. fw -> fw, fw -> rv, rv -> fw, rv -> rv pairs.
+        """
+        hits = self._hits(template, template_ambiguous)
+        return PCRProducts(self, hits, *hits.pairs(self.max_product_size))
+
+    def count_products(self, template=None, template_ambiguous=False, max_product_size=_DEFAULT):
+        """
+        number of products on template (the template of PCR by default),
+        without building them. max_product_size is that of PCR by default,
+        and None for no limit.
+        """
+        template = self.template if template is None else template
+        max_product_size = self.max_product_size if max_product_size is _DEFAULT else max_product_size
+        return len(self._hits(template, template_ambiguous).pairs(max_product_size)[0])
 
     def debugprint(self):
         print('%s: score=%.2f'%(self.name, self.primer_score()))
@@ -280,8 +382,8 @@ list of tuples
 (full-name, abbr-name, conversion_function)
 """
 bisulfite_conversions = [
-    ("Bisulfite-Treated Sense", "+", lambda x: bisulfite_conversion(x, sense=True)),
-    ("Bisulfite-Treated Antisense", "-", lambda x: bisulfite_conversion(x, sense=False)),
+    ("Bisulfite-Treated Sense", "+", lambda x: bisulfite_index(x).converted(True)),
+    ("Bisulfite-Treated Antisense", "-", lambda x: bisulfite_index(x).converted(False)),
     ("Genome", "G", lambda x: x),
 ]
 
@@ -289,14 +391,14 @@ class PCRconv(PCR):
     """
     PCR for converted templates.
     """
-    def __init__(self, name, original_template, primer_fw, primer_rv, conversions=[]):
-        super().__init__(name, original_template, primer_fw, primer_rv)
+    def __init__(self, name, original_template, primer_fw, primer_rv, conversions=[], workspace=None):
+        super().__init__(name, original_template, primer_fw, primer_rv, workspace=workspace)
         self.conversions = conversions
         self.converted_temp = []
 
         for name, abbr, conv in conversions:
             temp = conv(original_template)
-            products = PCRProducts(self._search(temp,True))
+            products = self._search(temp, True)
             self.converted_temp.append((name, abbr, temp, products))
 
     def write_html(self, b, toc, subfs, callback = None):
@@ -319,8 +421,8 @@ class PCRconv(PCR):
         return alignview(template, self.fw, self.rv, False, seqview)
         
 class BisulfitePCR(PCRconv):
-    def __init__(self, name, genome, primer_fw, primer_rv):
-        super().__init__(name, genome, primer_fw, primer_rv, bisulfite_conversions)
+    def __init__(self, name, genome, primer_fw, primer_rv, workspace=None):
+        super().__init__(name, genome, primer_fw, primer_rv, bisulfite_conversions, workspace)
 
     def get_bs_products(self):
         return self.converted_temp[0][3]
@@ -333,14 +435,14 @@ class PCRmulti(PCR):
     """
     PCR for multiple different templates
     """
-    def __init__(self, name, templates, primer_fw, primer_rv):
+    def __init__(self, name, templates, primer_fw, primer_rv, workspace=None):
 
-        super().__init__(name, templates[0][1], primer_fw, primer_rv)
+        super().__init__(name, templates[0][1], primer_fw, primer_rv, workspace=workspace)
         self.templates = templates
         self.multi_temp = []
 
         for tname, seq in templates:
-            pcr = PCR(name, seq, primer_fw, primer_rv)
+            pcr = PCR(name, seq, primer_fw, primer_rv, workspace=workspace)
             self.multi_temp.append((tname, pcr))
 
     def write_html(self, b, toc, subfs, callback = None):
@@ -352,13 +454,13 @@ class PCRmulti(PCR):
             pcr.products.write_html(b, toc, subfs, callback)
             
 class RtPCR(PCRmulti):
-    def __init__(self, name, genome, transcripts, primer_fw, primer_rv):
+    def __init__(self, name, genome, transcripts, primer_fw, primer_rv, workspace=None):
         templates = [('genome',genome)] + [(t.name,t.seq) for t in transcripts]
-        super().__init__(name, templates, primer_fw, primer_rv)
+        super().__init__(name, templates, primer_fw, primer_rv, workspace)
 
     def genome_pcr(self):
         return self.multi_temp[0][1]
 
     def transcript_pcr(self, transcript):
-        return PCR(self.name, transcript.seq, self.fw, self.rv)
+        return PCR(self.name, transcript.seq, self.fw, self.rv, workspace=self.workspace)
         
@@ -1,5 +1,7 @@
 import re
 
+import numpy as np
+
 from . import to_seq, melt_temp, tm_gc, is_sequence_like
 from ..util.memoize import memoize
 from ..util import xmlwriter
@@ -9,27 +11,45 @@ from ..util.namedlist import NamedList
 from . import iupac
 from . import primer_cond as pcond
 from .annealing import OligoAnnealing
+from .template_index import template_index
+from .primerset import PrimerSet
+from .primerhits import PrimerHits, encode
+from .primertable import PrimerTable
+from .dimer import DimerMatrix
+from .duplex import duplex_dg, hairpin_dg
 
 __all__ = ['Primer', 'PrimerPair']
 
-def count_while(iteration):
+def count_while(iteration, tolerance=0):
     '''
+    count leading true values. if tolerance is given, up to tolerance false
+    values are skipped over, but the count never ends with a false value.
+
     >>> count_while([1,2,3,4,0])
     4
     >>> count_while([])
     0
     >>> count_while([0])
     0
+    >>> count_while([1,0,1,1,0,0,1], 1)
+    4
+    >>> count_while([1,0,1,1,0,1,0,0], 2)
+    6
     '''
     count = 0
+    last = 0
 
     for i in iteration:
         if i:
             count += 1
+            last = count
+        elif tolerance > 0:
+            tolerance -= 1
+            count += 1
         else:
             break
 
-    return count
+    return last
 
 class CoordinateTransform:
     @classmethod
@@ -93,7 +113,7 @@ class CoordinateTransform:
         
     
 class PrimerTemplateAnnealing:
-    def __init__(self, primer, template, strand, loc_3p):
+    def __init__(self, primer, template, strand, loc_3p, mismatches=0):
         """
            5'-ATGCATGCCATG-3'            (fw primer)
         5'-.......ATGCCATG..........-3'  (template)
@@ -143,6 +163,17 @@ class PrimerTemplateAnnealing:
         (15, 19)
         >>> a.match_length, a.adapter_length
         (8, 4)
+
+        mismatches: number of mismatches tolerated inside the match.
+
+        >>> template = to_seq('nnntacgATGCGATGatgcnnnnnn')
+        >>> PrimerTemplateAnnealing(fw, template, True, 14)
+        PrimerTemplateAnnealing(True, match(3bp):12 -> 15, adapter(9bp):3 -> 12)
+        >>> a = PrimerTemplateAnnealing(fw, template, True, 14, mismatches=1)
+        >>> a
+        PrimerTemplateAnnealing(True, match(8bp):7 -> 15, adapter(4bp):3 -> 7, 1 mismatches)
+        >>> a.mismatches
+        1
         """
         self.primer = primer
         self.template = template
@@ -157,8 +188,8 @@ class PrimerTemplateAnnealing:
             p = primer.seq
             l = min(len(p), loc_3p+1)
 
-            self.match_length = count_while(
-                iupac.base_match(template[i],p[p_coord.get_l(i)]) for i in range(loc_3p, loc_3p-l, -1) )
+            matches = [iupac.base_match(template[i],p[p_coord.get_l(i)]) for i in range(loc_3p, loc_3p-l, -1)]
+            self.match_length = count_while(matches, mismatches)
             assert(self.match_length > 0)
             self.adapter_length = len(p) - self.match_length
 
@@ -183,8 +214,8 @@ class PrimerTemplateAnnealing:
         else:
             p = primer.seq.complement()
             l = min(len(p), len(template)-loc_3p)
-            self.match_length = count_while(
-                iupac.base_match(template[i],p[p_coord.get_l(i)]) for i in range(loc_3p,loc_3p+l))
+            matches = [iupac.base_match(template[i],p[p_coord.get_l(i)]) for i in range(loc_3p,loc_3p+l)]
+            self.match_length = count_while(matches, mismatches)
             assert(self.match_length > 0)
             self.adapter_length = len(p) - self.match_length
 
@@ -209,11 +240,13 @@ class PrimerTemplateAnnealing:
             self.display_match = str(self.primer_match)[::-1]
             self.display_adapter = str(self.primer_adapter)[::-1]
 
+        self.mismatches = self.match_length - sum(matches[:self.match_length])
         self.full = (self.match_length == len(self.primer))
         self.match = self.template[self.match_left:self.match_right]
 
     def __repr__(self):
-        return 'PrimerTemplateAnnealing({}, match({}bp):{} -> {}, adapter({}bp):{} -> {})'.format(self.strand, self.match_length, self.match_left, self.match_right, self.adapter_length, self.adapter_left, self.adapter_right)
+        mm = ', {} mismatches'.format(self.mismatches) if self.mismatches else ''
+        return 'PrimerTemplateAnnealing({}, match({}bp):{} -> {}, adapter({}bp):{} -> {}{})'.format(self.strand, self.match_length, self.match_left, self.match_right, self.adapter_length, self.adapter_left, self.adapter_right, mm)
 
     def __le__(self, rhs):
         return (self.match_left <= rhs.match_left) and (self.match_right <= rhs.match_right)
@@ -227,6 +260,9 @@ class PrimerTemplateAnnealing:
 
 
 class Primer:
+    # memoize keeps caches of all methods in '_memo'.
+    __slots__ = ('name', 'seq', '_codes', '_memo')
+
     def __init__(self, name, seq):
         self.name = name
         self.seq = to_seq(seq)
@@ -249,6 +285,20 @@ class Primer:
     def reverse(self):
         return self.seq[::-1]
 
+    @property
+    def codes(self):
+        '''
+        uint8 IUPAC codes of seq, see primerhits.encode.
+
+        >>> Primer('p', 'ATGCY').codes
+        array([0, 1, 2, 3, 8], dtype=uint8)
+        '''
+        try:
+            return self._codes
+        except AttributeError:
+            self._codes = encode(self.seq)
+            return self._codes
+
     @property
     def gc_ratio(self):
         return gc_ratio(self.seq)
@@ -268,15 +318,76 @@ class Primer:
     self_annealing = sa
     self_end_annealing = sea
 
-    def search(self, template, template_ambiguous=False, min_length=16):
+    def hairpin(self, temp=37., pcr_mix=melt_temp.DEFAULT_MIX):
+        '''
+        delta G [kcal/mol] of the most stable hairpin, see duplex.hairpin_dg.
+
+        >>> round(Primer('p', 'GGGCCCAAAAGGGCCC').hairpin(), 2)
+        -3.68
+        '''
+        return hairpin_dg(self.full_seq, temp, pcr_mix)
+
+    def self_dimer_dg(self, temp=37., pcr_mix=melt_temp.DEFAULT_MIX):
+        return duplex_dg(self.full_seq, self.full_seq, temp, pcr_mix)
+
+    def search_tail(self, min_length=16):
         """
-        Return tuple of fowards anneal locations and reverse anneal locations.
-        anneal locations are (5'location, 3'location)
+        3' end of the primer used for template search.
+
+        >>> Primer('p', 'AAAAATGCATGC').search_tail(8)
+        Seq('ATGCATGC', IUPACUnambiguousDNA())
         """
         if min_length > 0 and len(self.seq) > min_length:
-            seq = self.seq[-min_length:]
+            return self.seq[-min_length:]
         else:
-            seq = self.seq
+            return self.seq
+
+    def template_annealing(self, template, strand, loc_3p, mismatches=0):
+        return PrimerTemplateAnnealing(self, template, strand, loc_3p, mismatches)
+
+    def template_hits(self, template, fw_starts, rc_starts, length):
+        """
+        PrimerHits of template hits which pass Tm and N percent filters.
+        """
+        return PrimerHits.from_starts([self], template, [(fw_starts, rc_starts)], [length]).filter()
+
+    def template_annealings(self, template, fw_starts, rc_starts, length):
+        return self.template_hits(template, fw_starts, rc_starts, length).split()[0]
+
+    def search(self, template, template_ambiguous=False, min_length=16, max_mismatches=0):
+        """
+        Return tuple of fowards anneal locations and reverse anneal locations.
+        anneal locations are (5'location, 3'location)
+
+        if max_mismatches is given, 3' tail matches with up to max_mismatches
+        mismatches are reported as well. see BitParallelMatcher.
+
+        the k-mer index of template is built once and shared by all primers.
+
+        >>> p = Primer('p', 'AAAAAGCATGTCCATGGTTACG')
+        >>> t = to_seq('CCCCGCATGTCCATGGTTACGCCCCCGTAACCATGGACATGCGGGG')
+        >>> pp, pc = p.search(t)
+        >>> pp, pc
+        ([PrimerTemplateAnnealing(True, match(17bp):4 -> 21, adapter(5bp):-1 -> 4)], [PrimerTemplateAnnealing(False, match(17bp):25 -> 42, adapter(5bp):42 -> 47)])
+        >>> [repr(x) for x in p.search_regex(t)] == [repr(pp), repr(pc)]
+        True
+        >>> t = to_seq('CCCCGCATGTCCATGGATACGCCCCC')
+        >>> p.search(t)
+        ([], [])
+        >>> p.search(t, max_mismatches=1)
+        ([PrimerTemplateAnnealing(True, match(17bp):4 -> 21, adapter(5bp):-1 -> 4, 1 mismatches)], [])
+        """
+        if max_mismatches > 0:
+            return PrimerSet([self], template_ambiguous, min_length, max_mismatches).search(template)[0]
+        tail = self.search_tail(min_length)
+        fw, rc = template_index(template).find(tail, template_ambiguous)
+        return self.template_annealings(template, fw, rc, len(tail))
+
+    def search_regex(self, template, template_ambiguous=False, min_length=16):
+        """
+        reference implementation of search. scans template with a regex for each primer.
+        """
+        seq = self.search_tail(min_length)
         primer = seq
         cprimer = seq.reverse_complement()
 
@@ -288,8 +399,8 @@ class Primer:
         reg = re.compile('(%s)|(%s)'%(oregex(primer),oregex(cprimer)))
 
         template_str = str(template).upper()
-        pp = []
-        pc = []
+        fw = []
+        rc = []
         start = 0
         while True:
             m = reg.search(template_str, start)
@@ -297,20 +408,10 @@ class Primer:
                 break
             start = m.start()+1
             if m.group(1):
-                pta = PrimerTemplateAnnealing(self, template, True, m.end()-1)
-                if pta.tm() < 40.:
-                    continue
-                if pta.n_percent() > 0.5:
-                    continue
-                pp.append(pta)
+                fw.append(m.start())
             if m.group(2):
-                pta = PrimerTemplateAnnealing(self, template, False, m.start())
-                if pta.tm() < 40.:
-                    continue
-                if pta.n_percent() > 0.5:
-                    continue
-                pc.append(pta)
-        return pp,pc
+                rc.append(m.start())
+        return self.template_annealings(template, fw, rc, len(seq))
 
     def write_text(self):
         print("-"*20)
@@ -359,24 +460,34 @@ class Primer:
 
 
     def sdss_length(self, anneal_temp=None, pcr_mix=melt_temp.DEFAULT_MIX, unmethyl=False):
-        s = str(self.seq).upper()
-        if unmethyl:
-            s = s.replace('R','A').replace('Y','T')
-        else:
-            s = s.replace('R','G').replace('Y','C')
-
+        '''
+        >>> p = Primer('p', 'CGAACGACGCCCTACGAAAACG')
+        >>> p.sdss_length(), p.sdss_length(60.), p.sdss_length(30.)
+        (18, 14, 8)
+        '''
         if not anneal_temp:
             anneal_temp = self.melting_temperature()
-            
+        return int(self.sdss_lengths([anneal_temp], pcr_mix, unmethyl)[0])
+
+    def sdss_lengths(self, anneal_temps, pcr_mix=melt_temp.DEFAULT_MIX, unmethyl=False):
+        '''
+        sdss_length for each of anneal_temps, as numpy array.
+
+        >>> Primer('p', 'CGAACGACGCCCTACGAAAACG').sdss_lengths([30., 60., 90.])
+        array([ 8, 14, 21])
+        '''
+        s = melt_temp._normalize([self.seq], unmethyl)[0]
+
+        # fraction of s[l-i:-1] for i = 2 ... l-1, in column i-2
         l = len(s)
-        for i in range(2,l):
-            f = melt_temp.complex_fraction(s[l-i:-1], anneal_temp, pcr_mix)
-            if f>0.01:
-                break
-        return i
+        f = melt_temp.sl_suffix_fractions(s[:-1], anneal_temps, pcr_mix.cation_conc(), pcr_mix.c_primer)[:,:max(l-2, 0)]
+        over = f > 0.01
+        return np.where(over.any(axis=1), over.argmax(axis=1) + 2, l-1)
 
 
 class PrimerPartial(Primer):
+    __slots__ = ('full', 'fs')
+
     def __init__(self, name, seq, match_length):
         seq = to_seq(seq)
         name = '{}({}-mer)'.format(name, match_length)
@@ -399,6 +510,8 @@ class PrimerPartial(Primer):
 
         
 class TaqmanProbe(Primer):
+    __slots__ = ()
+
     def write_text(self):
         super().write_text()
         c = self.seq.count('C')
@@ -424,6 +537,17 @@ class PrimerPair:
         return self.annealings().end_annealing
     pair_annealing = pa
     pair_end_annealing = pea
+
+    def dimer_dg(self, temp=37., pcr_mix=melt_temp.DEFAULT_MIX):
+        '''
+        delta G [kcal/mol] of the most stable fw-rv dimer, see duplex.duplex_dg.
+        pairs of the same pa score can differ in stability.
+
+        >>> pp = PrimerPair(Primer('fw', 'GAAGGAGACCCAAATTCAAAGTT'), Primer('rv', 'CCTTTCTCCCTTCGTAGGT'))
+        >>> pp.pa.score, round(pp.dimer_dg(), 2)
+        (18, -3.4)
+        '''
+        return duplex_dg(self.fw.full_seq, self.rv.full_seq, temp, pcr_mix)
         
     @property
     @memoize
@@ -483,15 +607,65 @@ class PrimerPair:
 class Primers(NamedList):
     def __init__(self):
         super(Primers,self).__init__()
+        self._changed()
+
+    def _changed(self):
+        # table and primer sets are rebuilt after any change of primers
+        self._primer_sets = {}
+        self._table = None
+
+    def append(self, value):
+        super().append(value)
+        self._changed()
 
+    def extend(self, values):
+        for v in values:
+            super().append(v)
+        self._changed()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    @property
+    def table(self):
+        '''
+        PrimerTable of all primers, built at once on first use.
+        '''
+        if self._table is None:
+            self._table = PrimerTable(self)
+        return self._table
+
+    def dimer_matrix(self, processes=1):
+        '''
+        DimerMatrix of all primers against all primers.
+        '''
+        return DimerMatrix(self, processes)
+
+    def primer_set(self, template_ambiguous=False, min_length=16, max_mismatches=0):
+        key = (template_ambiguous, min_length, max_mismatches)
+        if key not in self._primer_sets:
+            self._primer_sets[key] = PrimerSet(self, template_ambiguous, min_length, max_mismatches)
+        return self._primer_sets[key]
+
+    def search(self, template, template_ambiguous=False, min_length=16, max_mismatches=0):
+        """
+        Return list of (primer, fowards annealings, reverse annealings) for all primers.
+        template is streamed only once.
+        """
+        ps = self.primer_set(template_ambiguous, min_length, max_mismatches)
+        return [(p, pp, pc) for p, (pp, pc) in zip(ps.primers, ps.search(template))]
 
     def load_file(self, filename):
         with open(filename,'r') as f:
             parser = TreekvParser()
             tree = parser.readfp(f, filename)
 
-            for kv in list(tree.items()):
-                self.append(Primer(kv.key, kv.value))
+            self.extend([Primer(kv.key, kv.value) for kv in tree.items()])
 
 
     def write_csv(self):
@@ -499,8 +673,8 @@ class Primers(NamedList):
         ret += ", ".join(Primer.get_table_head())
         ret += "\n"
 
-        for r in self:
-            ret += (", ".join([str(v) for v in r.get_table_row()]) + "\n")
+        for row in self.table.rows():
+            ret += (", ".join(row) + "\n")
 
         return ret+"\n"
 
@@ -513,10 +687,10 @@ class Primers(NamedList):
                     for p in Primer.get_table_head():
                         b.th(p)
 
-                for r in self:
+                for row in self.table.rows():
                     with b.tr:
-                        for v in r.get_table_row():
-                            b.td(str(v))
+                        for v in row:
+                            b.td(v)
 
             b.p('Tm melting temperature(SantaLucia), oTm melting temperature for bisulfite methyl-template, sa. self annealing, sea. self end annealing, pa. pair annealing, pea. pair end annealing', style='font-size:x-small')
 
@@ -1,5 +1,12 @@
 
-__all__=['PrimerCondition','NORMAL_PCR','BISULFITE_PCR']
+from concurrent.futures import ProcessPoolExecutor
+
+from . import melt_temp
+from .annealing import annealing_score_batch
+from .cpg import gc_ratio
+from ..util.memoize import LRUCache
+
+__all__=['PrimerCondition','NORMAL_PCR','BISULFITE_PCR','PrimerScorer']
 
 
 class Condition(object):
@@ -58,3 +65,146 @@ class PrimerConditionBisulfite(PrimerCondition):
 
 NORMAL_PCR = PrimerCondition()
 BISULFITE_PCR = PrimerConditionBisulfite()
+
+
+# primers and pairs kept by a PrimerScorer, each
+CACHE_SIZE = 1 << 16
+
+def _primer_components(keys):
+    """
+    (length, gc, tm, sa, sea) for each (seq, full_seq, PCRMixture.key()).
+    """
+    tms = [0.] * len(keys)
+    for mix in set(mix for seq, full, mix in keys):
+        ks = [i for i, k in enumerate(keys) if k[2] == mix]
+        for i, tm in zip(ks, melt_temp.tm_batch([keys[i][0] for i in ks], melt_temp.PCRMixture(*mix))):
+            tms[i] = float(tm)
+    fulls = [full for seq, full, mix in keys]
+    sa, sea = annealing_score_batch(fulls, fulls)
+    return [(len(seq), gc_ratio(seq), tm, int(a), int(ea))
+            for (seq, full, mix), tm, a, ea in zip(keys, tms, sa, sea)]
+
+def _pair_components(keys):
+    """
+    (pa, pea) for each (fw full_seq, rv full_seq).
+    """
+    pa, pea = annealing_score_batch([fw for fw, rv in keys], [rv for fw, rv in keys])
+    return [(int(a), int(ea)) for a, ea in zip(pa, pea)]
+
+class PrimerScorer(object):
+    """
+    score service of a PrimerCondition.
+
+    components of primers are cached by sequence and PCR mixture, so a primer
+    shared by many pairs is evaluated once, and missing components are
+    computed in batches, optionally by a process pool. primers and pairs are
+    kept in LRUCache of maxsize each. scores are the same as
+    score_primer and score_primerpair of the condition.
+
+    >>> from seqtool.nucleotide.primer import Primer, PrimerPair
+    >>> fw, rv = Primer('fw', 'GAAGGAGACCCAAATTCAAAGTT'), Primer('rv', 'CCTTTCTCCCTTCGTAGGT')
+    >>> scorer = PrimerScorer(BISULFITE_PCR)
+    >>> scorer.score_primerpairs([PrimerPair(fw, rv), PrimerPair(rv, fw)]) == [BISULFITE_PCR.score_primerpair(PrimerPair(fw, rv)), BISULFITE_PCR.score_primerpair(PrimerPair(rv, fw))]
+    True
+    >>> len(scorer._primers), len(scorer._pairs)
+    (2, 2)
+    >>> mix = melt_temp.PCRMixture(50*10**-3, 0, 2*10**-3, 200*10**-9, 0)
+    >>> scorer.primer_components([fw], mix)[0][2] == fw.melting_temperature(mix)
+    True
+    >>> len(scorer._primers)
+    3
+    """
+    def __init__(self, condition, processes=1, chunk_size=256, maxsize=CACHE_SIZE):
+        self.condition = condition
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self._primers = LRUCache(maxsize)
+        self._pairs = LRUCache(maxsize)
+
+    @staticmethod
+    def primer_key(p, pcr_mix=melt_temp.DEFAULT_MIX):
+        return (str(p.seq), str(p.full_seq), pcr_mix.key())
+
+    def _cached(self, cache, keys, func):
+        # values of a batch are kept until returned, even if the cache evicts them
+        values = dict((k, cache.lookup(k, None)) for k in set(keys) if k in cache)
+        missing = [k for k in set(keys) if k not in values]
+        if missing:
+            # chunks only spread a batch over the pool, one batch is faster in a process
+            if self.processes > 1 and len(missing) > self.chunk_size:
+                chunks = [missing[i:i+self.chunk_size] for i in range(0, len(missing), self.chunk_size)]
+                with ProcessPoolExecutor(max_workers=self.processes) as executor:
+                    results = list(executor.map(func, chunks))
+            else:
+                chunks = [missing]
+                results = [func(missing)]
+            for chunk, vs in zip(chunks, results):
+                values.update(zip(chunk, vs))
+            for k in missing:
+                cache.lookup(k, values.__getitem__, k)
+        return [values[k] for k in keys]
+
+    def primer_components(self, primers, pcr_mix=melt_temp.DEFAULT_MIX):
+        """
+        return list of (length, gc, tm, sa, sea) for primers.
+        """
+        return self._cached(self._primers, [self.primer_key(p, pcr_mix) for p in primers], _primer_components)
+
+    def annealings(self, fws, rvs):
+        """
+        return list of (pa, pea) of full sequences fws[i] and rvs[i].
+        """
+        return self._cached(self._pairs, [(str(fw), str(rv)) for fw, rv in zip(fws, rvs)], _pair_components)
+
+    def pair_components(self, pairs):
+        """
+        return list of (pa, pea) for primer pairs.
+        """
+        pairs = list(pairs)
+        return self.annealings([pp.fw.full_seq for pp in pairs], [pp.rv.full_seq for pp in pairs])
+
+    def _score_components(self, length, gc, tm, sa, sea):
+        c = self.condition
+        return c.primer_length.score(length) \
+              + c.gc.score(gc) \
+              + c.tm.score(tm) \
+              + c.sa.score(sa) \
+              + c.sea.score(sea)
+
+    def _bound_components(self, length, gc, tm, sa, sea):
+        c = self.condition
+        return c.primer_length.bound(length) \
+              and c.gc.bound(gc) \
+              and c.tm.bound(tm) \
+              and c.sa.bound(sa) \
+              and c.sea.bound(sea)
+
+    def score_primers(self, primers, pcr_mix=melt_temp.DEFAULT_MIX):
+        return [self._score_components(*v) for v in self.primer_components(primers, pcr_mix)]
+
+    def bound_primers(self, primers, pcr_mix=melt_temp.DEFAULT_MIX):
+        return [self._bound_components(*v) for v in self.primer_components(primers, pcr_mix)]
+
+    def score_primerpairs(self, pairs, pcr_mix=melt_temp.DEFAULT_MIX):
+        pairs = list(pairs)
+        primers = self.primer_components([p for pp in pairs for p in (pp.fw, pp.rv)], pcr_mix)
+        c = self.condition
+        ret = []
+        for k, (pa, pea) in enumerate(self.pair_components(pairs)):
+            ret.append(self._score_components(*primers[2*k]) \
+                       + self._score_components(*primers[2*k+1]) \
+                       + c.pa.score(pa) \
+                       + c.pea.score(pea))
+        return ret
+
+    def bound_primerpairs(self, pairs, pcr_mix=melt_temp.DEFAULT_MIX):
+        pairs = list(pairs)
+        primers = self.primer_components([p for pp in pairs for p in (pp.fw, pp.rv)], pcr_mix)
+        c = self.condition
+        ret = []
+        for k, (pa, pea) in enumerate(self.pair_components(pairs)):
+            ret.append(self._bound_components(*primers[2*k]) \
+                       and self._bound_components(*primers[2*k+1]) \
+                       and c.pa.bound(pa) \
+                       and c.pea.bound(pea))
+        return ret
@@ -0,0 +1,268 @@
+import numpy as np
+
+from . import iupac, melt_temp
+
+__all__ = ['PrimerHits', 'HIT_DTYPE']
+
+HIT_DTYPE = np.dtype([('primer', np.int32),
+                      ('strand', np.bool_),
+                      ('loc_3p', np.int64),
+                      ('match_length', np.int32),
+                      ('mismatches', np.int8)])
+
+IUPAC_LETTERS = 'ATGCWRMKYSBVHDN'
+IUPAC_COMPLEMENT = 'TACGWYKMRSVBDHN'
+
+# code of letters, 'unknown' is never matched.
+UNKNOWN = len(IUPAC_LETTERS)
+_codes = np.full(256, UNKNOWN, dtype=np.uint8)
+for _i, _c in enumerate(IUPAC_LETTERS):
+    _codes[ord(_c)] = _i
+
+# PARTIAL_MATCH[template, primer] is iupac.base_match(template, primer)
+PARTIAL_MATCH = np.zeros((UNKNOWN+1, UNKNOWN+1), dtype=np.bool_)
+for _i, _t in enumerate(IUPAC_LETTERS):
+    for _j, _p in enumerate(IUPAC_LETTERS):
+        PARTIAL_MATCH[_i, _j] = iupac.base_match(_t, _p)
+
+def encode(seq):
+    """
+    codes of letters of seq. a uint8 array is taken as upper case ascii letters.
+
+    >>> encode('ATGCNx')
+    array([ 0,  1,  2,  3, 14, 15], dtype=uint8)
+    >>> encode(np.frombuffer(b'GCN', dtype=np.uint8))
+    array([ 2,  3, 14], dtype=uint8)
+    """
+    if isinstance(seq, np.ndarray):
+        return _codes[seq]
+    return _codes[np.frombuffer(str(seq).upper().encode('ascii'), dtype=np.uint8)]
+
+_N = IUPAC_LETTERS.index('N')
+
+# code of complement letter
+_complement_codes = np.append(encode(IUPAC_COMPLEMENT), UNKNOWN).astype(np.uint8)
+
+class PrimerHits:
+    """
+    compact records of primer-template hits.
+
+    each hit is (primer index, strand, loc_3p, match_length) in a numpy
+    structured array. match length, Tm and N percent of all hits are computed
+    at once, and PrimerTemplateAnnealing is built only on demand.
+
+    >>> from seqtool.nucleotide.primer import Primer
+    >>> from seqtool.nucleotide import to_seq
+    >>> fw = Primer('fw', 'ATGCATGCCATGGTTACGATCGGA')
+    >>> template = to_seq('ttttCATGCCATGGTTACGATCGGAttttTCCGATCGTAACCATGGCAnnnn')
+    >>> hits = PrimerHits.from_starts([fw], template, [([9], [29])], [16])
+    >>> hits.records['match_length']
+    array([21, 23], dtype=int32)
+    >>> hits.match_left, hits.match_right
+    (array([ 4, 29]), array([25, 52]))
+    >>> hits.annealing(1)
+    PrimerTemplateAnnealing(False, match(23bp):29 -> 52, adapter(1bp):52 -> 53)
+    >>> hits.n_percent()
+    array([0.        , 0.17391304])
+    >>> len(hits.filter(max_n_percent=0.1))
+    1
+    """
+    def __init__(self, primers, template, records, max_mismatches=0):
+        self.primers = primers
+        self.template = template
+        self.records = records
+        self.max_mismatches = max_mismatches
+        self._annealings = {}
+        self._template_codes = None
+
+    @classmethod
+    def from_starts(cls, primers, template, starts, lengths, max_mismatches=0, template_codes=None):
+        """
+        starts: list of (forward start positions, reverse complement start positions) for each primer.
+        lengths: length of the searched 3' tail of each primer.
+        max_mismatches: number of mismatches tolerated in match, see PrimerTemplateAnnealing.
+        template_codes: encode(template), if the caller has it already.
+        """
+        count = sum(len(fw)+len(rc) for fw, rc in starts)
+        records = np.zeros(count, dtype=HIT_DTYPE)
+        k = 0
+        for i, ((fw, rc), l) in enumerate(zip(starts, lengths)):
+            for strand, ss, d in [(True, fw, l-1), (False, rc, 0)]:
+                n = len(ss)
+                r = records[k:k+n]
+                r['primer'] = i
+                r['strand'] = strand
+                r['loc_3p'] = np.asarray(ss, dtype=np.int64) + d
+                k += n
+
+        hits = cls(primers, template, records, max_mismatches)
+        hits._template_codes = template_codes
+        hits._compute_match_length()
+        return hits
+
+    @property
+    def template_codes(self):
+        """
+        encoded template, made once and shared with filtered hits.
+        """
+        if self._template_codes is None:
+            self._template_codes = encode(self.template)
+        return self._template_codes
+
+    def _compute_match_length(self):
+        r = self.records
+        if not len(r):
+            return
+        t = self.template_codes
+        n = len(t)
+
+        plens = np.array([len(p.seq) for p in self.primers])
+        lmax = plens.max()
+        fw_codes = np.full((len(self.primers), lmax), UNKNOWN, dtype=np.uint8)
+        rc_codes = np.full((len(self.primers), lmax), UNKNOWN, dtype=np.uint8)
+        for i, p in enumerate(self.primers):
+            # primer bases from 3' end
+            fw_codes[i, :len(p.seq)] = p.codes[::-1]
+            rc_codes[i, :len(p.seq)] = _complement_codes[p.codes[::-1]]
+
+        steps = np.arange(lmax)
+        strand = r['strand'][:,None]
+        loc = r['loc_3p'][:,None]
+        pos = np.where(strand, loc - steps, loc + steps)
+        valid = (steps < plens[r['primer']][:,None]) & (0 <= pos) & (pos < n)
+        pcodes = np.where(strand, fw_codes[r['primer']], rc_codes[r['primer']])
+        matched = valid & PARTIAL_MATCH[t[np.clip(pos, 0, n-1)], pcodes]
+
+        # same as count_while(matched, max_mismatches)
+        within = valid & (np.cumsum(~matched, axis=1) <= self.max_mismatches)
+        length = ((within & matched) * (steps+1)).max(axis=1)
+        r['match_length'] = length
+        matched_count = np.cumsum(matched, axis=1)[np.arange(len(r)), np.maximum(length-1, 0)]
+        r['mismatches'] = np.where(length > 0, length - matched_count, 0)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def match_left(self):
+        r = self.records
+        return np.where(r['strand'], r['loc_3p'] - r['match_length'] + 1, r['loc_3p'])
+
+    @property
+    def match_right(self):
+        r = self.records
+        return np.where(r['strand'], r['loc_3p'] + 1, r['loc_3p'] + r['match_length'])
+
+    @property
+    def leftmost(self):
+        r = self.records
+        plens = np.array([len(p.seq) for p in self.primers], dtype=np.int64)
+        return np.where(r['strand'], r['loc_3p'] - plens[r['primer']] + 1, r['loc_3p'])
+
+    @property
+    def rightmost(self):
+        r = self.records
+        plens = np.array([len(p.seq) for p in self.primers], dtype=np.int64)
+        return np.where(r['strand'], r['loc_3p'] + 1, r['loc_3p'] + plens[r['primer']])
+
+    def pairs(self, max_product_size=None):
+        """
+        return (forward strand hits, reverse strand hits) index arrays of pairs
+        making products, in the order of (forward, reverse) indices.
+
+        hits i and j make a product if match_left[i] <= match_left[j] and
+        match_right[i] <= match_right[j]. with max_product_size, products
+        longer than that from leftmost[i] to rightmost[j] are not reported.
+        reverse hits are swept in the order of match_left, so pairs of each
+        forward hit are a range found by bisection and the cost is of the
+        number of reported pairs.
+
+        >>> from seqtool.nucleotide.primer import Primer
+        >>> fw = Primer('fw', 'ATGCATGC')
+        >>> hits = PrimerHits.from_starts([fw], 'ATGCATGCnnGCATGCATnnATGCATGCnnnnnGCATGCAT', [([0, 20], [10, 33])], [8])
+        >>> hits.pairs()
+        (array([0, 0, 1]), array([2, 3, 3]))
+        >>> hits.pairs(max_product_size=21)
+        (array([0, 1]), array([2, 3]))
+        """
+        r = self.records
+        left = self.match_left
+        right = self.match_right
+        fws = np.flatnonzero(r['strand'])
+        rvs = np.flatnonzero(~r['strand'])
+        rvs = rvs[np.argsort(left[rvs], kind='mergesort')]
+
+        lo = np.searchsorted(left[rvs], left[fws], 'left')
+        if max_product_size is None:
+            hi = np.full(len(fws), len(rvs))
+        else:
+            # rightmost[j] - leftmost[i] <= max_product_size needs match_left[j] < leftmost[i] + max_product_size
+            hi = np.searchsorted(left[rvs], self.leftmost[fws] + max_product_size, 'left')
+        counts = np.maximum(hi - lo, 0)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        i = np.repeat(fws, counts)
+        j = rvs[np.repeat(lo, counts) + offsets]
+
+        keep = right[i] <= right[j]
+        if max_product_size is not None:
+            keep &= self.rightmost[j] - self.leftmost[i] <= max_product_size
+        i, j = i[keep], j[keep]
+        order = np.lexsort((j, i))
+        return i[order], j[order]
+
+    def tm(self, pcr_mix=melt_temp.STANDARD_MIX):
+        """
+        Tm of matched part of primers. computed once for each (primer, match_length).
+        """
+        r = self.records
+        keys = np.stack([r['primer'], r['match_length']], axis=1)
+        uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+        tms = melt_temp.tm_batch([str(self.primers[i].seq)[len(self.primers[i].seq)-l:] for i, l in uniq], pcr_mix)
+        return tms[inverse.reshape(-1)]
+
+    def n_percent(self):
+        # bases of matches are gathered, so the cost does not grow with the template
+        r = self.records
+        if not len(r):
+            return np.zeros(0)
+        t = self.template_codes
+        steps = np.arange(max(int(r['match_length'].max()), 1))
+        pos = self.match_left[:,None] + steps
+        within = steps < r['match_length'][:,None]
+        n = (within & (t[np.clip(pos, 0, len(t)-1)] == _N)).sum(axis=1)
+        return n / r['match_length']
+
+    def filter(self, min_tm=40., max_n_percent=0.5, pcr_mix=melt_temp.STANDARD_MIX):
+        if not len(self):
+            return self
+        keep = (self.tm(pcr_mix) >= min_tm) & (self.n_percent() <= max_n_percent)
+        hits = self.__class__(self.primers, self.template, self.records[keep], self.max_mismatches)
+        hits._template_codes = self._template_codes
+        return hits
+
+    def annealing(self, k):
+        """
+        PrimerTemplateAnnealing of k-th hit.
+        """
+        if k not in self._annealings:
+            h = self.records[k]
+            primer = self.primers[h['primer']]
+            self._annealings[k] = primer.template_annealing(self.template, bool(h['strand']), int(h['loc_3p']), self.max_mismatches)
+        return self._annealings[k]
+
+    def indices(self, primer=None, strand=None):
+        r = self.records
+        mask = np.ones(len(r), dtype=np.bool_)
+        if primer is not None:
+            mask &= r['primer'] == primer
+        if strand is not None:
+            mask &= r['strand'] == strand
+        return np.flatnonzero(mask)
+
+    def split(self):
+        """
+        return list of (forward annealings, reverse annealings) for each primer.
+        """
+        return [([self.annealing(k) for k in self.indices(i, True)],
+                 [self.annealing(k) for k in self.indices(i, False)])
+                for i in range(len(self.primers))]
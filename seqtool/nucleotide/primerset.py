@@ -0,0 +1,346 @@
+import re
+import itertools
+from collections import deque
+
+import numpy as np
+
+from . import iupac, to_seq
+from .primerhits import PrimerHits, encode, UNKNOWN
+
+__all__ = ['PrimerSet']
+
+# fully expand a degenerate tail if it has at most this number of variants,
+# otherwise only its least degenerate seed is put into the automaton.
+MAX_TAIL_EXPANSION = 16
+SEED_LENGTH = 8
+MIN_SEED_LENGTH = 4
+MAX_SEED_EXPANSION = 64
+
+# bases at primer 3' end which must match exactly in mismatch tolerant search.
+ANCHOR_LENGTH = 3
+
+# template positions compared at once in mismatch tolerant search.
+MATCH_CHUNK = 1 << 16
+
+def _expansion(allowed):
+    c = 1
+    for a in allowed:
+        c *= len(a)
+    return c
+
+class Automaton:
+    """
+    Aho-Corasick automaton.
+
+    >>> a = Automaton()
+    >>> a.add('ATG', 'atg')
+    >>> a.add('TGC', 'tgc')
+    >>> a.add('G', 'g')
+    >>> a.build()
+    >>> list(a.iter('AATGCG'))
+    [(3, 'atg'), (3, 'g'), (4, 'tgc'), (5, 'g')]
+    """
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+    def add(self, word, value):
+        node = 0
+        for c in word:
+            nxt = self.goto[node].get(c)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+                self.goto[node][c] = nxt
+            node = nxt
+        self.out[node].append(value)
+
+    def build(self):
+        goto = self.goto
+        fail = self.fail
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and c not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(c, 0)
+                self.out[nxt] = self.out[nxt] + self.out[fail[nxt]]
+
+    def dfa(self, alphabet):
+        """
+        return transition table resolving every fail link for letters of alphabet.
+        """
+        goto = self.goto
+        fail = self.fail
+        delta = [None] * len(goto)
+        delta[0] = {c:goto[0].get(c, 0) for c in alphabet}
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            d = dict(delta[fail[node]])
+            d.update(goto[node])
+            delta[node] = d
+            queue.extend(goto[node].values())
+        return delta
+
+    def iter(self, text, delta=None):
+        """
+        yield (end position, value) of every word found in text.
+        """
+        if delta is None:
+            delta = self.dfa(set(text))
+        out = self.out
+        node = 0
+        i = 0
+        for c in text:
+            node = delta[node][c]
+            if out[node]:
+                for v in out[node]:
+                    yield i, v
+            i += 1
+
+class _Pattern:
+    def __init__(self, index, strand, seq, match):
+        self.index = index
+        self.strand = strand
+        self.allowed = [match[s] for s in str(seq).upper()]
+        self.length = len(self.allowed)
+        # lookahead to find overlapping matches
+        self.regex = re.compile('(?=[{}])'.format(']['.join(self.allowed)))
+        # table[j, code] is whether letter of code is allowed at position j
+        self.table = np.zeros((self.length, UNKNOWN+1), dtype=bool)
+        for j, a in enumerate(self.allowed):
+            self.table[j, encode(a)] = True
+
+    def restrict(self, alphabet):
+        return [''.join(c for c in a if c in alphabet) for a in self.allowed]
+
+    def scan(self, s):
+        return [m.start() for m in self.regex.finditer(s)]
+
+    def match_codes(self, codes, starts):
+        """
+        those of starts at which the pattern matches encoded template codes,
+        same as regex.match. starts failing a position are dropped before the next.
+
+        >>> p = _Pattern(0, True, 'AYG', iupac.basematch_unambiguous)
+        >>> p.match_codes(encode('ACGnATGnAAG'), np.array([0, 4, 8, 9, -1]))
+        array([0, 4])
+        """
+        starts = starts[(0 <= starts) & (starts + self.length <= len(codes))]
+        for j in range(self.length):
+            starts = starts[self.table[j, codes[starts + j]]]
+        return starts
+
+class BitParallelMatcher:
+    """
+    substitution tolerant matcher over numpy-encoded chunks of a template.
+
+    the Shift-And state of a pattern lane at a text position counts the
+    mismatches of the alignment ending there, so instead of stepping base
+    by base, the count of every alignment of a chunk is summed at once,
+    one vectorized comparison per pattern position. exact hits and
+    mismatched hits are found in the same pass. mismatches are not allowed
+    within anchor bases of primer 3' end.
+
+    >>> from seqtool.nucleotide import iupac
+    >>> m = iupac.basematch_unambiguous
+    >>> ps = [_Pattern(0, True, 'ATGCAT', m), _Pattern(0, False, 'TTGCCA', m)]
+    >>> [(i, p.strand, d) for i, p, d in BitParallelMatcher(ps, 1, anchor=2).iter('ATGCATnnATCCATnnTTGACA')]
+    [(5, True, 0), (13, True, 1), (21, False, 1)]
+    >>> [(i, p.strand, d) for i, p, d in BitParallelMatcher(ps, 1, anchor=4).iter('ATGCATnnATCCATnnTTGACA')]
+    [(5, True, 0)]
+    """
+    def __init__(self, patterns, max_mismatches, anchor=ANCHOR_LENGTH):
+        self.max_mismatches = max_mismatches
+        self.patterns = list(patterns)
+        # per pattern, (letter codes allowed at each position, positions which must match)
+        self.tables = []
+        for p in self.patterns:
+            l = p.length
+            # a single allowed letter is compared, others are looked up
+            allowed = []
+            anchored = np.zeros(l, dtype=bool)
+            for j, a in enumerate(p.allowed):
+                if len(a) == 1:
+                    allowed.append(int(encode(a)[0]))
+                else:
+                    allowed.append(p.table[j])
+                # primer 3' end is the end of forward pattern and the start of reverse pattern.
+                anchored[j] = ((l-1-j) if p.strand else j) < anchor
+            self.tables.append((allowed, anchored))
+
+    def iter(self, text, chunk=MATCH_CHUNK):
+        """
+        yield (end position, pattern, number of mismatches) of every hit in text,
+        in the order of end position and pattern.
+        """
+        codes = encode(text)
+        n = len(codes)
+        k = self.max_mismatches
+        for first in range(0, n, chunk):
+            last = min(first+chunk, n)
+            ends = [np.zeros(0, dtype=np.int64)]
+            lanes = [np.zeros(0, dtype=np.int64)]
+            counts = [np.zeros(0, dtype=np.int64)]
+            for lane, (p, (allowed, anchored)) in enumerate(zip(self.patterns, self.tables)):
+                l = p.length
+                # alignments ending within first...last
+                lo = max(first-l+1, 0)
+                m = last - l + 1 - lo
+                if m <= 0:
+                    continue
+                d = np.zeros(m, dtype=np.uint8 if l < 256 else np.int64)
+                bad = np.zeros(m, dtype=bool)
+                for j, a in enumerate(allowed):
+                    c = codes[lo+j:lo+j+m]
+                    miss = (c != a) if isinstance(a, int) else ~a[c]
+                    if anchored[j]:
+                        bad |= miss
+                    else:
+                        d += miss
+                hit = np.flatnonzero(~bad & (d <= k))
+                ends.append(lo + hit + l - 1)
+                lanes.append(np.full(len(hit), lane, dtype=np.int64))
+                counts.append(d[hit])
+            ends, lanes, counts = np.concatenate(ends), np.concatenate(lanes), np.concatenate(counts)
+            patterns = self.patterns
+            for x in np.lexsort((lanes, ends)).tolist():
+                yield int(ends[x]), patterns[lanes[x]], int(counts[x])
+
+class PrimerSet:
+    """
+    batch matcher of primers.
+
+    one automaton is built over the 3' tails of all primers, forward and
+    reverse complement, with IUPAC degeneracy expanded over the letters
+    which appear in the template. a template is streamed once to find every
+    hit of every primer, so the cost grows with template length rather than
+    primers x template.
+
+    >>> from seqtool.nucleotide.primer import Primer
+    >>> ps = PrimerSet([Primer('a', 'ATGCATGC'), Primer('b', 'GCAYGC')], min_length=0)
+    >>> ps.find('nnnATGCATGCnnnGCATGCATnnn')
+    [([3], [14]), ([5, 14], [])]
+
+    with max_mismatches, primers are searched by BitParallelMatcher.
+
+    >>> ps = PrimerSet([Primer('a', 'ATGCATGC')], min_length=0, max_mismatches=1)
+    >>> ps.find('nnnATGCATGCnnnGCATGCATnnnATCCATGCnnn')
+    [([3, 25], [14])]
+    """
+    def __init__(self, primers, template_ambiguous=False, min_length=16, max_mismatches=0):
+        self.primers = list(primers)
+        self.template_ambiguous = template_ambiguous
+        self.min_length = min_length
+        self.max_mismatches = max_mismatches
+
+        match = iupac.basematch_subset if template_ambiguous else iupac.basematch_unambiguous
+
+        self.patterns = []
+        for i, p in enumerate(self.primers):
+            tail = to_seq(p.search_tail(min_length))
+            for strand, seq in [(True, tail), (False, tail.reverse_complement())]:
+                self.patterns.append(_Pattern(i, strand, seq, match))
+
+        self._automata = {}
+
+    def automaton(self, alphabet):
+        """
+        return (automaton, transition table, patterns to be scanned) for templates consist of alphabet.
+        """
+        alphabet = frozenset(alphabet)
+        if alphabet not in self._automata:
+            automaton = Automaton()
+            scan_patterns = []
+            for pattern in self.patterns:
+                allowed = pattern.restrict(alphabet)
+                if not all(allowed):
+                    continue
+                if not self._add(automaton, pattern, allowed):
+                    scan_patterns.append(pattern)
+            automaton.build()
+            self._automata[alphabet] = (automaton, automaton.dfa(alphabet), scan_patterns)
+        return self._automata[alphabet]
+
+    @staticmethod
+    def _add(automaton, pattern, allowed):
+        l = pattern.length
+        if _expansion(allowed) <= MAX_TAIL_EXPANSION:
+            for word in itertools.product(*allowed):
+                automaton.add(''.join(word), (pattern, l-1, False))
+            return True
+
+        for k in range(min(SEED_LENGTH, l), MIN_SEED_LENGTH-1, -1):
+            offset = min(range(l-k+1), key=lambda o: _expansion(allowed[o:o+k]))
+            seed = allowed[offset:offset+k]
+            if _expansion(seed) <= MAX_SEED_EXPANSION:
+                for word in itertools.product(*seed):
+                    automaton.add(''.join(word), (pattern, offset+k-1, True))
+                return True
+        return False
+
+    def __len__(self):
+        return len(self.primers)
+
+    def find(self, template):
+        """
+        return list of (forward start positions, reverse complement start positions) for each primer.
+        like Primer.search, a position matched by forward is not reported for reverse complement.
+        """
+        s = str(template).upper()
+        starts = {id(p):set() for p in self.patterns}
+
+        if self.max_mismatches > 0:
+            self._find_mismatch(s, starts)
+        else:
+            self._find_exact(s, starts)
+
+        ret = [([], []) for p in self.primers]
+        for pattern in self.patterns:
+            fw, rc = ret[pattern.index]
+            (fw if pattern.strand else rc).extend(sorted(starts[id(pattern)]))
+        for fw, rc in ret:
+            fw_set = set(fw)
+            rc[:] = [x for x in rc if x not in fw_set]
+        return ret
+
+    def _find_exact(self, s, starts):
+        n = len(s)
+        automaton, delta, scan_patterns = self.automaton(set(s))
+
+        for end, (pattern, offset, verify) in automaton.iter(s, delta):
+            start = end - offset
+            if start < 0 or n < start + pattern.length:
+                continue
+            if verify and not pattern.regex.match(s, start):
+                continue
+            starts[id(pattern)].add(start)
+
+        for pattern in scan_patterns:
+            starts[id(pattern)].update(pattern.scan(s))
+
+    def _find_mismatch(self, s, starts):
+        if not hasattr(self, '_matcher'):
+            self._matcher = BitParallelMatcher(self.patterns, self.max_mismatches)
+        for end, pattern, d in self._matcher.iter(s):
+            starts[id(pattern)].add(end - pattern.length + 1)
+
+    def hits(self, template):
+        """
+        return PrimerHits of all primers which pass Tm and N percent filters.
+        """
+        lengths = [len(p.search_tail(self.min_length)) for p in self.primers]
+        return PrimerHits.from_starts(self.primers, template, self.find(template), lengths, self.max_mismatches).filter()
+
+    def search(self, template):
+        """
+        return list of (forward annealings, reverse annealings) for each primer.
+        """
+        return self.hits(template).split()
@@ -0,0 +1,82 @@
+import numpy as np
+
+from . import melt_temp
+from .primerhits import IUPAC_LETTERS, UNKNOWN
+
+__all__ = ['PrimerTable']
+
+_GC_WEIGHT = np.zeros(UNKNOWN+1, dtype=np.float64)
+for _c, _w in [('G', 1.), ('C', 1.), ('Y', .5), ('R', .5)]:
+    _GC_WEIGHT[IUPAC_LETTERS.index(_c)] = _w
+
+_A, _T, _G, _C = [IUPAC_LETTERS.index(c) for c in 'ATGC']
+
+class PrimerTable:
+    """
+    column store of primers.
+
+    sequences are kept as a matrix of IUPAC codes (see primerhits.encode),
+    padded with UNKNOWN, and Tm, GC, sa and sea are computed once for all
+    primers and kept as numpy columns.
+
+    >>> from seqtool.nucleotide.primer import Primer
+    >>> t = PrimerTable([Primer('a', 'ATGCATGCATGC'), Primer('b', 'GGCYRATG')])
+    >>> t.lengths
+    array([12,  8], dtype=int32)
+    >>> t.codes[1]
+    array([ 2,  2,  3,  8,  5,  0,  1,  2, 15, 15, 15, 15], dtype=uint8)
+    >>> t.seqs()
+    ['ATGCATGCATGC', 'GGCYRATG']
+    >>> t.gc
+    array([50. , 62.5])
+    >>> t.rows()[1] == Primer('b', 'GGCYRATG').get_table_row()
+    True
+    """
+    def __init__(self, primers, pcr_mix=melt_temp.STANDARD_MIX):
+        primers = list(primers)
+        n = len(primers)
+        self.names = [p.name for p in primers]
+        self.formatedseqs = [p.formatedseq for p in primers]
+        self.lengths = np.array([len(p.seq) for p in primers], dtype=np.int32)
+
+        self.codes = np.full((n, self.lengths.max() if n else 0), UNKNOWN, dtype=np.uint8)
+        for i, p in enumerate(primers):
+            self.codes[i, :self.lengths[i]] = p.codes
+
+        seqs = self.seqs()
+        self.tm = melt_temp.tm_batch(seqs, pcr_mix, unmethyl=True)
+        self.otm = melt_temp.tm_batch(seqs, pcr_mix, unmethyl=False)
+
+        self.gc_count = ((self.codes == _G) | (self.codes == _C)).sum(axis=1)
+        self.at_count = ((self.codes == _A) | (self.codes == _T)).sum(axis=1)
+        self.gc = 100. * _GC_WEIGHT[self.codes].sum(axis=1) / self.lengths
+
+        self.sa = np.array([p.sa.score for p in primers], dtype=np.int32)
+        self.sea = np.array([p.sea.score for p in primers], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.names)
+
+    def seqs(self):
+        letters = np.frombuffer((IUPAC_LETTERS+'-').encode('ascii'), dtype=np.uint8)
+        return [letters[c[:l]].tobytes().decode('ascii') for c, l in zip(self.codes, self.lengths)]
+
+    def tm_gc(self):
+        """
+        same as nucleotide.tm_gc for all primers.
+        """
+        return ['4x%s+2x%s=%s'%(gc,at,4*gc+2*at) for gc, at in zip(self.gc_count, self.at_count)]
+
+    def rows(self):
+        """
+        same as Primer.get_table_row for all primers.
+        """
+        return [[str(v) for v in row] for row in zip(self.names,
+                                                     self.formatedseqs,
+                                                     self.lengths,
+                                                     ['%.2f'%v for v in self.tm],
+                                                     ['%.2f'%v for v in self.otm],
+                                                     self.tm_gc(),
+                                                     ['%.2f'%v for v in self.gc],
+                                                     self.sa,
+                                                     self.sea)]
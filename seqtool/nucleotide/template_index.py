@@ -0,0 +1,249 @@
+import re
+import itertools
+
+import numpy as np
+
+from . import iupac, to_seq
+from .primerhits import encode, UNKNOWN
+
+__all__ = ['TemplateIndex', 'template_index']
+
+DEFAULT_K = 8
+MAX_SEED_EXPANSION = 64
+
+# letters are packed by their primerhits.encode code in 4 bits.
+BITS = 4
+MAX_K = 64 // BITS
+
+def pack(codes, k):
+    """
+    packed k-mers of every position of encoded letters codes.
+
+    >>> pack(encode('ATGC'), 2).tolist()
+    [1, 18, 35]
+    """
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    c = codes.astype(np.uint64)
+    packed = np.zeros(n, dtype=np.uint64)
+    bits = np.uint64(BITS)
+    for j in range(k):
+        packed <<= bits
+        packed |= c[j:j+n]
+    return packed
+
+def _allowed(seq, match):
+    return [match[s] for s in str(seq).upper()]
+
+def _expansion(allowed):
+    c = 1
+    for a in allowed:
+        c *= len(a)
+    return c
+
+class TemplateIndex:
+    """
+    k-mer index of a template.
+
+    built once per template and shared by every primer searched against it.
+    k-mers are packed into integers and kept as a sorted array with their
+    positions, and a k-mer is looked up by bisection. each primer 3' tail is
+    looked up through its least degenerate k-mer seed, then candidates are
+    verified with the same IUPAC regex as Primer.search.
+
+    >>> idx = TemplateIndex('nnnATGCATGCnnnGCATGCATnnn', k=4)
+    >>> idx.find('ATGCATGC')
+    ([3], [14])
+    >>> idx.find('ATGCNTGC')
+    ([3], [14])
+    >>> idx.find('ATGYATGC', template_ambiguous=True)
+    ([], [])
+    >>> idx.find_batch(['ATGCATGC', 'GCA'])
+    [([3], [14]), ([5, 14, 18], [4, 8, 17])]
+    """
+    def __init__(self, template, k=DEFAULT_K):
+        if not 0 < k <= MAX_K:
+            raise ValueError('k must be 1...{}: {}'.format(MAX_K, k))
+        self.template = template
+        self.template_str = str(template).upper()
+        self.k = k
+
+        s = self.template_str
+        packed = pack(encode(s), k)
+        if len(packed) < 1<<32 and k * BITS <= 32:
+            # k-mer and position in one 64 bit key, whose unstable sort is much faster
+            shift = np.uint64(32)
+            key = (packed << shift) | np.arange(len(packed), dtype=np.uint64)
+            key.sort()
+            self._kmers = (key >> shift).astype(np.uint32)
+            self._positions = key.astype(np.uint32)
+        else:
+            order = np.argsort(packed, kind='mergesort')
+            self._kmers = packed[order]
+            self._positions = order
+        self.letters = set(s)
+        self._codes = None
+
+    def __len__(self):
+        return len(self.template_str)
+
+    def positions(self, kmer):
+        """
+        ascending positions of kmer.
+        """
+        kmer = kmer.upper()
+        if len(kmer) != self.k:
+            return []
+        codes = encode(kmer)
+        v = self._kmers.dtype.type(int(pack(codes, self.k)[0]))
+        lo = np.searchsorted(self._kmers, v, 'left')
+        hi = np.searchsorted(self._kmers, v, 'right')
+        ret = self._positions[lo:hi].tolist()
+        if (codes == UNKNOWN).any():
+            # letters out of IUPAC share one code
+            s = self.template_str
+            ret = [p for p in ret if s[p:p+self.k] == kmer]
+        return ret
+
+    def _seed(self, allowed):
+        """
+        (k-mer words, offset) of the least degenerate seed of a pattern, with
+        no words if the pattern can not match, or None if it is too degenerate.
+        """
+        l = len(allowed)
+        k = self.k
+        if len(self.template_str) < l:
+            return [], 0
+        # only letters in the template need to be expanded.
+        allowed = [''.join(c for c in a if c in self.letters) for a in allowed]
+        if not all(allowed):
+            return [], 0
+        if l < k:
+            return None
+
+        offset = min(range(l-k+1), key=lambda o: _expansion(allowed[o:o+k]))
+        seed = allowed[offset:offset+k]
+        if _expansion(seed) > MAX_SEED_EXPANSION:
+            return None
+        return [''.join(w) for w in itertools.product(*seed)], offset
+
+    def candidates(self, allowed):
+        """
+        return sorted start positions at which a pattern could match,
+        or None if the pattern is too degenerate to be looked up.
+        allowed is a list of template letters allowed at each pattern position.
+        """
+        seed = self._seed(allowed)
+        if seed is None:
+            return None
+        words, offset = seed
+        last = len(self.template_str) - len(allowed)
+        ret = set()
+        for kmer in words:
+            for p in self.positions(kmer):
+                start = p - offset
+                if 0 <= start <= last:
+                    ret.add(start)
+        return sorted(ret)
+
+    def match(self, seq, match=iupac.basematch_unambiguous):
+        """
+        return sorted start positions of exact IUPAC matches of seq.
+        """
+        allowed = _allowed(seq, match)
+        # lookahead to find overlapping matches
+        reg = re.compile('(?=[{}])'.format(']['.join(allowed)))
+        s = self.template_str
+        candidates = self.candidates(allowed)
+        if candidates is None:
+            return [m.start() for m in reg.finditer(s)]
+        return [p for p in candidates if reg.match(s, p)]
+
+    def find(self, tail, template_ambiguous=False):
+        """
+        return (forward start positions, reverse complement start positions) of tail.
+        like the alternation regex of Primer.search, a position matched by forward
+        is not reported for reverse complement.
+        """
+        match = iupac.basematch_subset if template_ambiguous else iupac.basematch_unambiguous
+        fw = self.match(tail, match)
+        fw_set = set(fw)
+        rc = [p for p in self.match(to_seq(tail).reverse_complement(), match) if p not in fw_set]
+        return fw, rc
+
+    def find_batch(self, tails, template_ambiguous=False):
+        """
+        list of find of each tail, in one pass. seeds of all the tails are
+        looked up by one bisection of the k-mer array, and candidates of each
+        pattern are verified on the encoded template, a position at a time.
+        """
+        match = iupac.basematch_subset if template_ambiguous else iupac.basematch_unambiguous
+        patterns = []
+        for t in tails:
+            patterns += [_allowed(t, match), _allowed(to_seq(t).reverse_complement(), match)]
+
+        words = []
+        owners = []
+        offsets = []
+        scans = set()
+        for o, allowed in enumerate(patterns):
+            seed = self._seed(allowed)
+            if seed is None:
+                scans.add(o)
+                continue
+            words += seed[0]
+            owners += [o] * len(seed[0])
+            offsets += [seed[1]] * len(seed[0])
+
+        # words are concatenated, so each k-th k-mer is a word.
+        packed = pack(encode(''.join(words)), self.k)[::self.k].astype(self._kmers.dtype)
+        lo = np.searchsorted(self._kmers, packed, 'left')
+        count = np.searchsorted(self._kmers, packed, 'right') - lo
+        hit = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count) + np.repeat(lo, count)
+        starts = self._positions[hit].astype(np.int64) - np.repeat(np.array(offsets, dtype=np.int64), count)
+        owners = np.repeat(np.array(owners, dtype=np.int64), count)
+        order = np.argsort(owners, kind='mergesort')
+        starts = starts[order]
+        bounds = np.searchsorted(owners[order], np.arange(len(patterns)+1))
+
+        t = self.codes
+        n = len(t)
+        found = []
+        for o, allowed in enumerate(patterns):
+            l = len(allowed)
+            ss = np.arange(max(n-l+1, 0)) if o in scans else starts[bounds[o]:bounds[o+1]]
+            ss = ss[(0 <= ss) & (ss + l <= n)]
+            for j, a in enumerate(allowed):
+                table = np.zeros(UNKNOWN+1, dtype=bool)
+                table[encode(a)] = True
+                ss = ss[table[t[ss + j]]]
+            found.append(np.unique(ss))
+        return [(fw.tolist(), np.setdiff1d(rc, fw).tolist()) for fw, rc in zip(found[0::2], found[1::2])]
+
+    @property
+    def codes(self):
+        """
+        encoded template, made on first use.
+        """
+        if self._codes is None:
+            self._codes = encode(self.template_str)
+        return self._codes
+
+def template_index(template, k=DEFAULT_K):
+    """
+    return TemplateIndex of template. the index is cached on the template object.
+    """
+    key = '_kmer_index_{}'.format(k)
+    try:
+        return getattr(template, key)
+    except AttributeError:
+        pass
+
+    idx = TemplateIndex(template, k)
+    try:
+        setattr(template, key, idx)
+    except AttributeError:
+        # str template can not hold cache.
+        pass
+    return idx
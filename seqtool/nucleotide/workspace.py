@@ -0,0 +1,78 @@
+from .primerset import PrimerSet
+from .primerhits import PrimerHits
+from .bisulfite_index import bisulfite_index
+from .primer_cond import PrimerScorer, NORMAL_PCR
+
+__all__ = ['TemplateWorkspace']
+
+class TemplateWorkspace:
+    """
+    converted templates, primer hits and primer scores shared by PCRs of a template.
+
+    converted templates are those of bisulfite_index of the genome, so they
+    are the same objects for every PCR. start positions of primers are
+    searched once per template; when a primer is not searched yet, it is
+    searched together with all the other primers of the workspace in one
+    PrimerSet pass. PrimerHits of any primers are assembled from them.
+    scorer is a PrimerScorer of NORMAL_PCR, so a primer of many PCRs is
+    scored once.
+
+    >>> from seqtool.nucleotide.primer import Primer
+    >>> from seqtool.nucleotide import to_seq
+    >>> fw = Primer('fw', 'ATGCATGCCATGGTTACG')
+    >>> rv = Primer('rv', 'TCCGATCGTAACCATGGC')
+    >>> ws = TemplateWorkspace(to_seq('ttttATGCATGCCATGGTTACGATCGGAtttt'), [fw, rv])
+    >>> hits = ws.hits(ws.genome, [fw, rv])
+    >>> hits.match_left, hits.match_right
+    (array([ 4, 10]), array([22, 28]))
+    >>> ws.searches
+    1
+    >>> ws.hits(ws.converted(True), [fw], template_ambiguous=True).records['primer']
+    array([], dtype=int32)
+    >>> ws.hits(ws.genome, [rv]).match_left, ws.searches
+    (array([10]), 2)
+    """
+    def __init__(self, genome, primers=()):
+        self.genome = genome
+        self.primers = primers
+        # number of template scans
+        self.searches = 0
+        self._starts = {}
+        self.scorer = PrimerScorer(NORMAL_PCR)
+
+    def bisulfite(self):
+        return bisulfite_index(self.genome)
+
+    def converted(self, sense=True):
+        return self.bisulfite().converted(sense)
+
+    def starts(self, template, primers, template_ambiguous=False, min_length=16):
+        """
+        PrimerSet.find of primers on template.
+        """
+        key = (id(template), template_ambiguous, min_length)
+        if key not in self._starts:
+            # template is kept so that its id is not reused
+            self._starts[key] = (template, {})
+        cache = self._starts[key][1]
+
+        if any(str(p.seq) not in cache for p in primers):
+            seqs = []
+            batch = []
+            for p in list(self.primers) + list(primers):
+                s = str(p.seq)
+                if s not in cache and s not in seqs:
+                    seqs.append(s)
+                    batch.append(p)
+            cache.update(zip(seqs, PrimerSet(batch, template_ambiguous, min_length).find(template)))
+            self.searches += 1
+        return [cache[str(p.seq)] for p in primers]
+
+    def hits(self, template, primers, template_ambiguous=False, min_length=16):
+        """
+        same as PrimerSet(primers, template_ambiguous, min_length).hits(template).
+        """
+        primers = list(primers)
+        lengths = [len(p.search_tail(min_length)) for p in primers]
+        starts = self.starts(template, primers, template_ambiguous, min_length)
+        return PrimerHits.from_starts(primers, template, starts, lengths).filter()
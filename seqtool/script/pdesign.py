@@ -1,32 +1,182 @@
-
 import sys
+import json
+from collections import deque
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 from ..nucleotide.primer import Primer
 from ..nucleotide import to_seq, primer_cond
+from ..nucleotide.melt_temp import TemplateThermo
 
-def main():
+# margin for rounding difference of TemplateThermo from Primer.melting_temperature
+TM_MARGIN = 1e-6
+
+# records submitted to worker processes ahead of the output, per process
+PENDING_PER_PROCESS = 4
+
+COLUMNS = ['record', 'name', 'start', 'end', 'seq', 'tm', 'gc', 'sa', 'sea', 'score']
+
+def default_condition():
     pc = primer_cond.PrimerCondition()
     pc.tm = primer_cond.Condition(1.0, 60., 59., 61.)
     pc.primer_length = primer_cond.Condition(.5, 23., 17, 30)
     pc.sa = primer_cond.Condition(0.1, 0., 0, 100)
     pc.sea = primer_cond.Condition(0.1, 0., 0, 50)
     pc.gc = primer_cond.Condition(1., 50., 30, 90)
+    return pc
 
-    a,b = pc.primer_length.minimum, pc.primer_length.maximum
+_GC2 = np.zeros(256, dtype=np.int64)
+for _c, _w in [('G', 2), ('C', 2), ('Y', 1), ('R', 1)]:
+    _GC2[ord(_c)] = _w
+
+def _prefix(values):
+    ret = np.zeros(len(values)+1, dtype=np.int64)
+    np.cumsum(values, out=ret[1:])
+    return ret
+
+def prefilter(seq, starts, ends, pc, max_cpg=None):
+    """
+    mask of windows seq[starts:ends] which may be in bound of pc, and have
+    at most max_cpg CpG.
+
+    length, GC, CpG and Tm of all windows are differences of prefix sums,
+    and are tested in this order, each only on windows which passed the
+    former. sa and sea are left to Primer.
+
+    >>> seq = 'ATGCGATTTTTTTTGCGCGCGCAT'
+    >>> pc = default_condition()
+    >>> pc.tm = primer_cond.Condition(1.0, 60., 0., 100.)
+    >>> pc.primer_length = primer_cond.Condition(.5, 23., 4, 6)
+    >>> starts, ends = np.array([0, 0, 5, 12, 13, 14]), np.array([5, 3, 11, 18, 19, 20])
+    >>> prefilter(seq, starts, ends, pc)
+    array([ True, False, False,  True,  True, False])
+    >>> prefilter(seq, starts, ends, pc, max_cpg=1)
+    array([ True, False, False,  True, False, False])
+    """
+    s = str(seq).upper()
+    bases = np.frombuffer(s.encode('ascii'), dtype=np.uint8)
+    lengths = ends - starts
+    keep = np.flatnonzero((pc.primer_length.minimum <= lengths) & (lengths <= pc.primer_length.maximum))
+
+    # same as gc_ratio
+    gc2 = _prefix(_GC2[bases])
+    gc = 100. * ((gc2[ends[keep]] - gc2[starts[keep]]) / 2.) / lengths[keep]
+    keep = keep[(pc.gc.minimum <= gc) & (gc <= pc.gc.maximum)]
+
+    # same as count_cpg, CpG at t is s[t:t+2]
+    if max_cpg is not None:
+        c, g = bases[:-1], bases[1:]
+        pair = np.zeros(len(bases), dtype=bool)
+        pair[:-1] = (((c == ord('C')) | (c == ord('Y'))) & (g == ord('G'))) | ((c == ord('C')) & (g == ord('R')))
+        cpg = _prefix(pair)
+        count = cpg[np.maximum(ends[keep]-1, starts[keep])] - cpg[starts[keep]]
+        keep = keep[count <= max_cpg]
 
-    if len(sys.argv)!=2:
-        print('usage: pdesign [sequence]')
-        return
-    s = to_seq(sys.argv[1])
+    # nan Tm of other letters are left to Primer
+    tms = TemplateThermo(s).tm_range(starts[keep], ends[keep])
+    keep = keep[np.isnan(tms) | ((pc.tm.minimum - TM_MARGIN <= tms) & (tms <= pc.tm.maximum + TM_MARGIN))]
+
+    mask = np.zeros(len(starts), dtype=bool)
+    mask[keep] = True
+    return mask
+
+def design(seq, pc=None, max_cpg=None, scorer=None):
+    """
+    yield (start, end, Primer) of every window of seq in bound of pc.
+    primers are named p{start}-{end}. windows passing prefilter are bound
+    by a PrimerScorer of pc at once.
+
+    >>> names = [p.name for i, j, p in design('GAAGGAGACCCAAATTCAAAGTTCCTTTCTCCCTTCGTAGGT')]
+    >>> len(names), names[:3]
+    (59, ['p0-23', 'p0-24', 'p1-24'])
+    """
+    pc = pc or default_condition()
+    scorer = scorer or primer_cond.PrimerScorer(pc)
+    a,b = pc.primer_length.minimum, pc.primer_length.maximum
+    s = to_seq(seq)
     l = len(s)
 
-    for i in range(l):
-        for j in range(i+a, i+b):
-            name = "p{}-{}".format(i,j)
-            pp = Primer(name, s[i:j])
-            if not pc.bound_primer(pp):
-                continue
+    # (i, j) in the order of the original double loop, windows beyond the end are cut
+    starts = np.repeat(np.arange(l), b-a)
+    ends = starts + np.tile(np.arange(a, b), l)
+
+    windows = [(int(starts[k]), int(ends[k])) for k in np.flatnonzero(prefilter(s, starts, np.minimum(ends, l), pc, max_cpg))]
+    primers = [Primer("p{}-{}".format(i,j), s[i:j]) for i, j in windows]
+    for (i, j), pp, bound in zip(windows, primers, scorer.bound_primers(primers)):
+        if bound:
+            yield i, j, pp
+
+def design_record(record, max_cpg=None):
+    """
+    rows of COLUMNS for (record id, sequence).
+    """
+    rid, seq = record
+    pc = default_condition()
+    scorer = primer_cond.PrimerScorer(pc)
+    rows = []
+    for i, j, p in design(seq, pc, max_cpg, scorer):
+        length, gc, tm, sa, sea = scorer.primer_components([p])[0]
+        rows.append([rid, p.name, i, j, str(p.seq), round(tm, 2),
+                     round(gc, 2), sa, sea, round(scorer.score_primers([p])[0], 3)])
+    return rows
+
+def imap_bounded(executor, func, iterable, pending):
+    """
+    executor.map which reads iterable only pending items ahead of the results.
+    """
+    queue = deque()
+    for item in iterable:
+        queue.append(executor.submit(func, item))
+        if len(queue) >= pending:
+            yield queue.popleft().result()
+    while queue:
+        yield queue.popleft().result()
+
+def design_fasta(filename, processes=1, max_cpg=None):
+    """
+    yield rows of each record of a fasta file, in the order of records.
+    """
+    from Bio import SeqIO
+    records = ((r.id, str(r.seq)) for r in SeqIO.parse(filename, 'fasta'))
+    func = partial(design_record, max_cpg=max_cpg)
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            for rows in imap_bounded(executor, func, records, processes * PENDING_PER_PROCESS):
+                yield rows
+    else:
+        for record in records:
+            yield func(record)
+
+def write_rows(w, rows, format):
+    for row in rows:
+        if format == 'json':
+            w.write(json.dumps(dict(zip(COLUMNS, row))) + '\n')
+        else:
+            w.write('\t'.join(str(v) for v in row) + '\n')
+    w.flush()
+
+def main():
+    from argparse import ArgumentParser
+    parser = ArgumentParser(prog='pdesign', description='Print primers of every window in bound of primer condition')
+    parser.add_argument('sequence', nargs='?', help="sequence from 5' to 3'")
+    parser.add_argument('-f', '--fasta', dest='fasta', help='fasta file of templates, designed record by record')
+    parser.add_argument('-j', '--processes', type=int, default=1, dest='processes', help='number of processes for records of fasta file')
+    parser.add_argument('--max_cpg', type=int, default=None, dest='max_cpg', help='maximum number of CpG in a primer')
+    parser.add_argument('--format', choices=['tsv', 'json'], default='tsv', help='output format for fasta file, json is a json object per line')
+    args = parser.parse_args()
+
+    if args.fasta:
+        if args.format == 'tsv':
+            sys.stdout.write('\t'.join(COLUMNS) + '\n')
+        for rows in design_fasta(args.fasta, args.processes, args.max_cpg):
+            write_rows(sys.stdout, rows, args.format)
+    elif args.sequence:
+        for i, j, pp in design(args.sequence, max_cpg=args.max_cpg):
             print("{}: {}".format(pp.name, pp.seq))
+    else:
+        parser.print_usage()
 
 if __name__=='__main__':
     main()
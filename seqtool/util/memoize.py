@@ -1,4 +1,5 @@
 import functools
+from collections import OrderedDict
 # http://wiki.python.org/moin/PythonDecoratorLibrary#Memoize
 class memoize(object):
     """Decorator that caches a function's return value each time it is called.
@@ -22,12 +23,18 @@ class memoize(object):
             return self.func(*args)
 
     def method_call(self, self_, *args):
+        # caches of all memoized methods of an object are kept in its '_memo'
+        # attribute, so a class with __slots__ only needs a '_memo' slot.
         try:
-            cache = getattr(self_,self.name)
-        except:
-            self.name = '_cache' + self.func.__name__
-            cache = {}
-            setattr(self_,self.name,cache)
+            memo = self_._memo
+        except AttributeError:
+            memo = {}
+            self_._memo = memo
+        # keyed by the decorator, so an overridden method has its own cache
+        try:
+            cache = memo[self]
+        except KeyError:
+            cache = memo[self] = {}
 
         try:
             return cache[args]
@@ -46,6 +53,58 @@ class memoize(object):
         """Support instance methods."""
         return functools.partial(self.method_call, obj)
 
+class LRUCache(object):
+    """
+    size bounded cache, least recently used values are evicted first.
+
+    >>> c = LRUCache(2)
+    >>> c.lookup('a', len, 'a')
+    1
+    >>> c.lookup('bb', len, 'bb')
+    2
+    >>> c.lookup('a', len, 'a')
+    1
+    >>> c.lookup('ccc', len, 'ccc')
+    3
+    >>> 'bb' in c, 'a' in c
+    (False, True)
+    >>> c.hits, c.misses, len(c)
+    (1, 3, 2)
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def lookup(self, key, func, *args):
+        """
+        return cached value of key, or func(*args) which is cached as value of key.
+        """
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            value = func(*args)
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return value
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
 def curry(func):
     def inner(*args,**kw):
         def inner2(w):
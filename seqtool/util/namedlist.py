@@ -24,6 +24,9 @@ class NamedList(object):
     def __setitem__(self, key, value):
         self._dict[key] = value
 
+    def __delitem__(self, key):
+        del self._dict[key]
+
     def get(self, name):
         v = self._dict.get(name)
         if v:
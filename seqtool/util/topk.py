@@ -0,0 +1,113 @@
+import heapq
+
+import numpy as np
+
+__all__ = ['BinnedTopK']
+
+class _Entry(object):
+    # heap of a bin keeps the worst entry at top
+    __slots__ = ('score', 'rank', 'position', 'item')
+
+    def __init__(self, score, rank, position, item):
+        self.score = score
+        self.rank = rank
+        self.position = position
+        self.item = item
+
+    def key(self):
+        return (self.score, self.rank)
+
+    def __lt__(self, other):
+        return self.key() > other.key()
+
+class BinnedTopK(object):
+    """
+    k best items of each bin of bin_size positions, lower score is better.
+    ties of score are broken by rank, then by order of addition.
+
+    each bin is a heap of at most k entries whose top is the worst one,
+    so an addition takes O(log k). floors[bin] is the worst score of a
+    full bin and inf otherwise, and items not better than the floor are
+    rejected without touching the heap, also in bulk by numpy.
+
+    with min_distance, an item closer than min_distance to a better item
+    of the same bin is rejected, and worse items close to an added item
+    are removed, which takes O(k). results then depend on the order of
+    addition, as a removal may make room for an item rejected before.
+
+    >>> t = BinnedTopK(100, 50, 2)
+    >>> [t.add(p, s, name) for p, s, name in [(10, 3., 'a'), (20, 1., 'b'), (30, 2., 'c'), (40, 5., 'd'), (70, 4., 'e')]]
+    [True, True, True, False, True]
+    >>> t.floors
+    array([ 2., inf])
+    >>> t.items()
+    ['b', 'c', 'e']
+    >>> t.bin(np.array([0, 49, 50, 200]))
+    array([0, 0, 1, 1])
+
+    >>> t = BinnedTopK(100, 100, 3, min_distance=5)
+    >>> [t.add(p, s, name) for p, s, name in [(10, 3., 'a'), (12, 1., 'b'), (30, 2., 'c'), (33, 5., 'd')]]
+    [True, True, True, False]
+    >>> t.items(), t.rejected
+    (['b', 'c'], 2)
+    """
+    def __init__(self, length, bin_size, k, min_distance=0):
+        self.bin_size = max(1, int(bin_size))
+        self.k = k
+        self.min_distance = min_distance
+        self.bins = [[] for i in range(max(0, length-1) // self.bin_size + 1)]
+        self.floors = np.full(len(self.bins), np.inf)
+        self.added = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return sum(len(b) for b in self.bins)
+
+    def bin(self, positions):
+        """
+        bin index of positions, positions beyond length are in the last bin.
+        """
+        return np.minimum(np.asarray(positions) // self.bin_size, len(self.bins)-1)
+
+    def floor(self, position):
+        return self.floors[self.bin(position)]
+
+    def add(self, position, score, item, rank=()):
+        """
+        add item at position and return True if it is kept.
+        """
+        b = int(self.bin(position))
+        heap = self.bins[b]
+        entry = _Entry(score, (rank, self.added), position, item)
+        self.added += 1
+
+        if len(heap) >= self.k and not entry.key() < heap[0].key():
+            self.rejected += 1
+            return False
+
+        if self.min_distance > 0:
+            near = [e for e in heap if abs(e.position - position) < self.min_distance]
+            if any(e.key() < entry.key() for e in near):
+                self.rejected += 1
+                return False
+            if near:
+                self.rejected += len(near)
+                heap[:] = [e for e in heap if e not in near]
+                heapq.heapify(heap)
+
+        if len(heap) >= self.k:
+            heapq.heapreplace(heap, entry)
+            self.rejected += 1
+        else:
+            heapq.heappush(heap, entry)
+        self.floors[b] = heap[0].score if len(heap) >= self.k else np.inf
+        return True
+
+    def entries(self):
+        return sorted((e for heap in self.bins for e in heap), key=_Entry.key)
+
+    def items(self):
+        """
+        kept items of all bins, best first.
+        """
+        return [e.item for e in self.entries()]
@@ -1,5 +1,6 @@
 
-from ..nucleotide.cpg import bisulfite_conversion
+from ..nucleotide.bisulfite_index import bisulfite_index
+from ..nucleotide.primerset import PrimerSet
 from ..util import svg
 from ..util.rectangle import Rectangle,Line
 from ..nucleotide import reverse, complement
@@ -44,19 +45,17 @@ class AnnotationTexts(Annotation):
         return svg.SvgBoundbox(svg.SvgExpandWidth(self._vr.length, t))
 
 class AnnotationPrimerAnneal(Annotation):
-    def __init__(self, pta):
-        self.pta = pta
-        self.name = pta.primer.name
-        
-        self.matched = (pta.display_match, pta.match_left, pta.match_right)
-        self.left = pta.leftmost
-        self.right = pta.match_right
-
-        if not pta.full:
-            self.adapter = (pta.display_adapter, pta.adapter_left, pta.adapter_right)
-
-
-        super().__init__(pta.primer.name, self.left, self.right)
+    def __init__(self, hits, k, left, right):
+        """
+        k-th hit of PrimerHits. PrimerTemplateAnnealing is built when rendered.
+        """
+        self.hits = hits
+        self.k = k
+        self.left = left
+        self.right = right
+
+        name = hits.primers[hits.records[k]['primer']].name
+        super().__init__(name, self.left, self.right)
 
     def svg_item(self, r=None):
         if r and not self.range.has_intersect(r):
@@ -64,13 +63,13 @@ class AnnotationPrimerAnneal(Annotation):
         w = svg.font_width()
         h = svg.font_height()
 
+        pta = self.hits.annealing(self.k)
+
         ps = svg.SvgItemsFixedHeight(h)
-        s,l,r = self.matched
-        ps.add(svg.SvgText(s, l*w, 0))
+        ps.add(svg.SvgText(pta.display_match, pta.match_left*w, 0))
 
-        if not self.pta.full:
-            s,l,r = self.adapter
-            ps.add(svg.SvgBoundbox(svg.SvgText(s, l*w, 0)))
+        if not pta.full:
+            ps.add(svg.SvgBoundbox(svg.SvgText(pta.display_adapter, pta.adapter_left*w, 0)))
 
         t = svg.SvgItemsVStack()
         t.add(svg.SvgText(self.name, self.left*w, 0))
@@ -126,12 +125,17 @@ class DoubleStrand:
         # padding
         t.add(svg.SvgItemsFixedHeight(8))
 
-    def add_primer(self, primer):
-        pp,pc = primer.search(self.seq, template_ambiguous = True)
-        for a in pp:
-            self.pos.append(AnnotationPrimerAnneal(a))
-        for a in pc:
-            self.neg.append(AnnotationPrimerAnneal(a))
+    def add_primers(self, primer_set):
+        self.add_hits(primer_set.hits(self.seq))
+
+    def add_hits(self, hits):
+        strands = hits.records['strand']
+        for k, (left, right) in enumerate(zip(hits.leftmost, hits.match_right)):
+            a = AnnotationPrimerAnneal(hits, k, int(left), int(right))
+            if strands[k]:
+                self.pos.append(a)
+            else:
+                self.neg.append(a)
 
     def add_restriction_batch(self, rb):
         for enzyme, locs in list(rb.search(self.seq).items()):
@@ -148,9 +152,9 @@ NO_CONVERSIONS = [("", lambda x: x)]
 
 
 BISULFITE_CONVERSIONS = [
-    ("BS(+)", lambda x: bisulfite_conversion(x, sense=True)),
+    ("BS(+)", lambda x: bisulfite_index(x).converted(True)),
     ("", lambda x: x),
-    ("BS(-)", lambda x: bisulfite_conversion(x, sense=False)),
+    ("BS(-)", lambda x: bisulfite_index(x).converted(False)),
 ]
 
 
@@ -174,8 +178,9 @@ def iter_sep(iterable, sep, firstend = True):
         
 
 class BaseseqRenderer:
-    def __init__(self, seq, bisulfite=False):
+    def __init__(self, seq, bisulfite=False, workspace=None):
         self.length = len(seq)
+        self.workspace = workspace
 
         conversions = NO_CONVERSIONS
         if bisulfite:
@@ -186,8 +191,16 @@ class BaseseqRenderer:
             self.doublestrands.append(DoubleStrand(name, conv(seq)))
 
     def add_primer(self, primer):
+        self.add_primers([primer])
+
+    def add_primers(self, primers):
+        if self.workspace is not None:
+            for ds in self.doublestrands:
+                ds.add_hits(self.workspace.hits(ds.seq, primers, template_ambiguous=True))
+            return
+        primer_set = PrimerSet(primers, template_ambiguous = True)
         for ds in self.doublestrands:
-            ds.add_primer(primer)
+            ds.add_primers(primer_set)
 
     def add_restriction_batch(self, restriction_batch):
         for ds in self.doublestrands:
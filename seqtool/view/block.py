@@ -46,9 +46,10 @@ class BaseBlock:
         pass
 
 class PcrsBlock(BaseBlock):
-    def __init__(self, template, primers, title='Genome PCR'):
+    def __init__(self, template, primers, title='Genome PCR', workspace=None):
         self.pcrsholder = PcrsHolder(primers)
         self.template = template
+        self.workspace = workspace
         super().__init__(title)
 
     def __iter__(self):
@@ -56,7 +57,7 @@ class PcrsBlock(BaseBlock):
 
     def add(self, name, fw, rv):
         fw, rv = self.pcrsholder.get_primers(name, fw, rv)
-        self.pcrsholder.add(PCR(name, self.template.seq, fw, rv))
+        self.pcrsholder.add(PCR(name, self.template.seq, fw, rv, workspace=self.workspace))
 
     def svg_genome(self, t):
         t.add_pcrs_track(self.title, self.pcrsholder.pcrs)
@@ -77,12 +78,12 @@ class BsPcrsBlock(PcrsBlock):
     Bisulfite Sequence sample usually contains Genomic DNA as well.
     so, targets  are bisulite-methyl-DNA, unmethyl-DNA and Genomic DNA.
     """
-    def __init__(self, template, primers):
-        super().__init__(template, primers, 'Bisulfite PCR')
+    def __init__(self, template, primers, workspace=None):
+        super().__init__(template, primers, 'Bisulfite PCR', workspace)
 
     def add(self, name, fw, rv):
         fw, rv = self.pcrsholder.get_primers(name, fw, rv)
-        self.pcrsholder.add(BisulfitePCR(name, self.template.seq, fw, rv))
+        self.pcrsholder.add(BisulfitePCR(name, self.template.seq, fw, rv, self.workspace))
 
     def svg_genome(self, t):
         t.add_bs_pcrs_track(self.title, self.pcrsholder.pcrs)
@@ -92,12 +93,12 @@ class RtPcrsBlock(PcrsBlock):
     RT-PCR sample usually contains Genomic DNA as well.
     so, targets of RT-PCR are all transcripts and Genomic DNA.
     """
-    def __init__(self, template, primers):
-        super().__init__(template, primers, 'RT-PCR')
+    def __init__(self, template, primers, workspace=None):
+        super().__init__(template, primers, 'RT-PCR', workspace)
 
     def add(self, name, fw, rv):
         fw, rv = self.pcrsholder.get_primers(name, fw, rv)
-        self.pcrsholder.add(RtPCR(name, self.template.seq, self.template.transcripts, fw, rv))
+        self.pcrsholder.add(RtPCR(name, self.template.seq, self.template.transcripts, fw, rv, self.workspace))
 
     def svg_genome(self, t):
         t.add_pcrs_track(self.title, [p.genome_pcr() for p in self.pcrsholder.pcrs])
@@ -3,7 +3,7 @@
 from math import ceil
 
 from ..nucleotide import base_color
-from ..nucleotide.cpg import cpg_sites
+from ..nucleotide.bisulfite_index import bisulfite_index
 from ..nucleotide.cpgisland import seq_cpg_analysis
 from ..util import svg
 
@@ -252,7 +252,7 @@ class OutlineRenderer(NamedTracks):
         t = svg.SvgItemsFixedHeight(height)
 
         length = len(seq)
-        cpg = cpg_sites(seq)
+        cpg = bisulfite_index(seq).cpg_sites()
 
         t.add(self.gen.hline(0, length, height/2))
         lines = []
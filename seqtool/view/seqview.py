@@ -10,6 +10,7 @@ from ..util import svg
 from ..util import report
 from ..nucleotide import fasta_file
 from ..nucleotide.primer import Primer,Primers
+from ..nucleotide.workspace import TemplateWorkspace
 from ..util.parser import TreekvParser
 
 from ..util.dirutils import Filepath
@@ -33,9 +34,12 @@ class Seqview(object):
         self.primers = Primers()
         self.restrictions = []
 
-        self.pcrs = block.PcrsBlock(self.template, self.primers)
-        self.bs_pcrs = block.BsPcrsBlock(self.template, self.primers)
-        self.rt_pcrs = block.RtPcrsBlock(self.template, self.primers)
+        # converted templates and primer hits shared by all PCRs and renderers
+        self.workspace = TemplateWorkspace(self.template.seq, self.primers)
+
+        self.pcrs = block.PcrsBlock(self.template, self.primers, workspace=self.workspace)
+        self.bs_pcrs = block.BsPcrsBlock(self.template, self.primers, self.workspace)
+        self.rt_pcrs = block.RtPcrsBlock(self.template, self.primers, self.workspace)
 
         self.bsa = bsa_block.BsaBlock(self.bs_pcrs)
 
@@ -231,10 +235,9 @@ class Seqview(object):
     def baseseq_renderer(self, template, bisulfite):
         key = '_baseseq_{}'.format(bisulfite)
         if not hasattr(template, key):
-            aseq = BaseseqRenderer(template, bisulfite)
+            aseq = BaseseqRenderer(template, bisulfite, self.workspace)
 
-            for p in self.primers:
-                aseq.add_primer(p)
+            aseq.add_primers(self.primers)
 
             aseq.add_restriction_batch(Restriction.RestrictionBatch(self.restrictions))
             setattr(template, key, aseq)
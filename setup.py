@@ -32,12 +32,15 @@ get_genbank = seqtool.frontend.command:get_genbank
 geneview = seqtool.frontend.command:geneview
 tssview = seqtool.frontend.command:tssview
 primers = seqtool.frontend.command:primers
+pbisearch = seqtool.frontend.command:pbisearch
 sequencing = seqtool.frontend.command:sequencing
 seqtooldb = seqtool.db:seqdb_command
 abiview = seqtool.frontend.command:abiview
 
 convert_bs = seqtool.bowtie.convert_bs:main
 virtualpcr = seqtool.bowtie.virtualpcr:main
+insilico_pcr = seqtool.genome.insilico:main
+seqtool = seqtool.frontend.command:seqtool
 
 primer = seqtool.nucleotide.primer:main
 probe = seqtool.nucleotide.primer:probe
@@ -0,0 +1,17 @@
+import random
+
+from seqtool.nucleotide.primer import Primer
+
+def random_template(length, seed):
+    """
+    reproducible random sequence of A, T, G, C as str.
+    """
+    r = random.Random(seed)
+    return ''.join(r.choice('ACGT') for i in range(length))
+
+def random_primers(n, seed):
+    """
+    reproducible random primers p0, p1, ... of 17 to 28 bases.
+    """
+    r = random.Random(seed)
+    return [Primer('p{}'.format(i), ''.join(r.choice('ACGT') for k in range(r.randint(17, 28)))) for i in range(n)]
@@ -0,0 +1,31 @@
+from nose.tools import *
+
+from seqtool.nucleotide import to_seq
+from seqtool.nucleotide.cpg import bisulfite, cpg_sites, count_cpg, bisulfite_conversion_unambiguous
+from seqtool.nucleotide.bisulfite_index import bisulfite_index
+
+from helpers import random_template
+
+def test_strands_same_as_conversion():
+    t = to_seq(random_template(300, 1))
+    idx = bisulfite_index(t)
+    for (methyl, sense), strand in idx.strands():
+        eq_(str(strand), str(bisulfite_conversion_unambiguous(t, sense=sense, methyl=methyl)))
+        ok_(bisulfite(t, methyl, sense) is strand)
+    ok_(bisulfite_index(t) is idx)
+
+def test_cpg_sites_same_as_regex():
+    t = to_seq(random_template(300, 2))
+    idx = bisulfite_index(t)
+    eq_(idx.cpg_sites(), list(cpg_sites(t)))
+    for p, q in [(0, 10), (5, 120), (33, 299), (100, 100)]:
+        eq_(idx.cpg_sites(p, q), list(cpg_sites(t, (p, q))))
+        eq_(idx.count_cpg(p, q), count_cpg(t, (p, q)))
+
+def test_find_on_strands():
+    t = to_seq(random_template(500, 3))
+    idx = bisulfite_index(t)
+    tail = str(idx.strand(False, True)[200:220])
+    fw, rc = idx.find(tail, methyl=False, sense=True)
+    ok_(200 in fw)
+    eq_(fw, [m for m in range(len(t)) if str(idx.strand(False, True)[m:m+20]) == tail])
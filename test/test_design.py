@@ -0,0 +1,86 @@
+from nose.tools import *
+
+from seqtool.nucleotide.design import PrimerDesigner
+from seqtool.nucleotide.primer import Primer, PrimerPair
+
+from helpers import random_template
+
+def brute_force(d, per_bin):
+    """
+    best pairs of each bin by scoring every pair with PrimerPair.
+    """
+    c = d.candidates
+    cond = d.condition
+    pmin, pmax = d.product_length
+    valid_fw, valid_rv = d._valid(c)
+    bins = {}
+    for f in range(len(c)):
+        if not valid_fw[f]:
+            continue
+        for r in range(len(c)):
+            if not valid_rv[r] or c.start[r] < c.end[f] or not pmin <= c.end[r] - c.start[f] <= pmax:
+                continue
+            if abs(c.tm[f] - c.tm[r]) > d.max_tm_diff:
+                continue
+            if d.bisulfite and not d.msp and abs(c.otm[f] - c.otm[r]) > d.max_tm_diff:
+                continue
+            pp = PrimerPair(Primer('fw', d._primer_seq(c.start[f], c.end[f], True)),
+                            Primer('rv', d._primer_seq(c.start[r], c.end[r], False)))
+            if not (cond.pa.bound(pp.pa.score) and cond.pea.bound(pp.pea.score)):
+                continue
+            score = cond.score_primerpair(pp)
+            if score > d.score_threshold:
+                continue
+            b = (c.start[f] + c.end[r]) // 2 // 40
+            bins.setdefault(b, []).append((round(score, 6), c.start[f], c.end[f], c.start[r], c.end[r]))
+    ret = []
+    for b in bins.values():
+        ret += sorted(b)[:per_bin]
+    return sorted(ret)
+
+def check_design(bisulfite, msp=None):
+    d = PrimerDesigner(random_template(150, 7), bisulfite=bisulfite, primer_length=(15, 18),
+                       product_length=(50, 90), max_tm_diff=4., max_met_tm_diff=5., max_cpg_in_primer=3,
+                       msp=msp, msp_3prime=5)
+    d.condition.tm.minimum = 35.
+    d._candidates = None
+    results = d.design(max_results=None, bin_size=40, per_bin=3)
+    ok_(results)
+    eq_([(round(r.score, 6), r.fw_start, r.fw_end, r.rv_start, r.rv_end) for r in results],
+        brute_force(d, 3))
+
+def test_design_same_as_brute_force():
+    check_design(False)
+
+def test_design_bisulfite_same_as_brute_force():
+    check_design(True)
+
+def test_design_msp_same_as_brute_force():
+    check_design(True, 'methyl')
+    check_design(True, 'unmethyl')
+
+def test_design_msp_primers_have_cpg_at_3prime():
+    d = PrimerDesigner(random_template(300, 3), msp='unmethyl', primer_length=(18, 24))
+    results = d.design(max_results=5)
+    ok_(results)
+    for r in results:
+        ok_('Y' in d.design_seq[r.fw_end-3:r.fw_end])
+        ok_('Y' in d.design_seq[r.rv_start:r.rv_start+3])
+        ok_('Y' not in r.fw and 'R' not in r.rv)
+
+def test_design_seqv():
+    d = PrimerDesigner(random_template(200, 1), bisulfite=True, primer_length=(18, 24), max_cpg_in_primer=3)
+    text = d.write_seqv(d.design(max_results=3), 'Bi')
+    ok_('show_bisulfite: True' in text)
+    ok_('bs_pcr:' in text)
+
+def test_design_pair_cache_is_bounded():
+    from seqtool.nucleotide.primer_cond import PrimerScorer
+    t = random_template(600, 8)
+    expected = [(r.fw, r.rv, r.score) for r in PrimerDesigner(t).design()]
+    ok_(expected)
+    d = PrimerDesigner(t)
+    d.scorer = PrimerScorer(d.condition, maxsize=50)
+    eq_([(r.fw, r.rv, r.score) for r in d.design()], expected)
+    ok_(d.scorer._pairs.misses > 50)
+    eq_(len(d.scorer._pairs), 50)
@@ -0,0 +1,111 @@
+import os
+import random
+import tempfile
+from nose.tools import *
+
+from seqtool.nucleotide import to_seq
+from seqtool.nucleotide.primer import Primer
+from seqtool.nucleotide.primerset import PrimerSet
+from seqtool.nucleotide.pcr import PCR
+from seqtool.genome.insilico import PrimerSeeds, insilico_pcr
+
+from helpers import random_template
+
+def make_genome(seed):
+    r = random.Random(seed)
+    fw = random_template(22, seed+100)
+    rv = random_template(20, seed+200)
+    rv_site = str(to_seq(rv).reverse_complement())
+    chroms = []
+    for c in range(4):
+        parts = []
+        for k in range(r.randint(2, 8)):
+            parts += [random_template(r.randint(0, 600), seed*10+c*100+k), r.choice([fw, rv_site, fw.lower(), 'N'*30])]
+        parts.append(random_template(200, seed*10+c))
+        chroms.append(('chr{}'.format(c+1), ''.join(parts)))
+    return [Primer('fw', fw), Primer('rv', rv)], chroms
+
+def write_fasta(chroms):
+    with tempfile.NamedTemporaryFile('w', suffix='.fa', delete=False) as f:
+        for name, seq in chroms:
+            f.write('>{} test\n'.format(name))
+            for i in range(0, len(seq), 60):
+                f.write(seq[i:i+60] + '\n')
+    return f.name
+
+def test_seeds_find_same_as_primerset():
+    t = random_template(3000, 1)
+    primers = [Primer('p{}'.format(k), t[k*7:k*7+10]) for k in range(20)]
+    primers.append(Primer('d', 'AYGCNNTGCA'))
+    for k in [4, 8, 12]:
+        eq_(PrimerSeeds(primers, k, min_length=0).find(t), PrimerSet(primers, min_length=0).find(t))
+
+def test_insilico_pcr_same_as_pcr():
+    for seed in range(3):
+        primers, chroms = make_genome(seed)
+        filename = write_fasta(chroms)
+        try:
+            found = [[(p.chrom, p.start, p.end, p.length) for p in ps] for ps in insilico_pcr(filename, primers, max_product_size=1500)]
+            expected = []
+            for name, seq in chroms:
+                pcr = PCR('p', to_seq(seq), primers[0], primers[1], max_product_size=1500)
+                expected.append([(name, p.start_0, p.end_0, len(p)) for p in pcr.products])
+            eq_(found, expected)
+            ok_(any(found))
+            parallel = [[(p.chrom, p.start, p.end, p.length) for p in ps] for ps in insilico_pcr(filename, primers, processes=2, max_product_size=1500)]
+            eq_(parallel, found)
+            windowed = [[(p.chrom, p.start, p.end, p.length) for p in ps] for ps in insilico_pcr(filename, primers, max_product_size=1500, window=256)]
+            eq_(windowed, found)
+        finally:
+            os.remove(filename)
+
+def test_indexed_insilico_pcr_same_as_without_index():
+    from seqtool.genome.index import build_index, STRANDS
+    import shutil
+    primers, chroms = make_genome(5)
+    filename = write_fasta(chroms)
+    directory = tempfile.mkdtemp()
+    try:
+        build_index(filename, directory, k=10, bisulfite=True, processes=2)
+        for strand in STRANDS:
+            expected = [[repr(p) for p in ps] for ps in insilico_pcr(filename, primers, strand=strand)]
+            found = [[repr(p) for p in ps] for ps in insilico_pcr(filename, primers, index=directory, strand=strand)]
+            eq_(found, expected)
+            for index in [None, directory]:
+                windowed = [[repr(p) for p in ps] for ps in insilico_pcr(filename, primers, index=index, strand=strand, max_product_size=500, window=200)]
+                eq_(windowed, [[repr(p) for p in ps] for ps in insilico_pcr(filename, primers, strand=strand, max_product_size=500, window=None)])
+            ok_(strand != 'genome' or any(found))
+    finally:
+        os.remove(filename)
+        shutil.rmtree(directory)
+
+def test_index_strands_same_as_bisulfite_index():
+    from seqtool.genome.index import convert, BISULFITE_STRANDS
+    from seqtool.nucleotide.bisulfite_index import BisulfiteIndex
+    t = random_template(500, 7)
+    idx = BisulfiteIndex(to_seq(t))
+    for strand, (methyl, sense) in BISULFITE_STRANDS.items():
+        eq_(convert(t, strand), str(idx.strand(methyl, sense)))
+
+def test_index_chunks_same_as_whole_strand():
+    from seqtool.genome import index
+    import shutil
+    primers, chroms = make_genome(6)
+    filename = write_fasta(chroms)
+    directory = tempfile.mkdtemp()
+    try:
+        for k, chunk, block in [(5, 97, 7), (17, 250, 64)]:
+            index.MERGE_BLOCK, default = block, index.MERGE_BLOCK
+            try:
+                idx = index.build_index(filename, directory, k=k, bisulfite=True, chunk=chunk)
+            finally:
+                index.MERGE_BLOCK = default
+            for strand in index.STRANDS:
+                for name, seq in chroms:
+                    kmers, positions = index.seed_arrays(index.convert(seq.upper(), strand), k)
+                    found = idx.arrays(name, strand)
+                    eq_(found[0].dtype, kmers.dtype)
+                    eq_((found[0].tolist(), found[1].tolist()), (kmers.tolist(), positions.tolist()))
+    finally:
+        os.remove(filename)
+        shutil.rmtree(directory)
@@ -0,0 +1,41 @@
+import os
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from nose.tools import *
+
+from seqtool.script import pdesign
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'example')
+
+def test_imap_bounded_reads_ahead_only_pending():
+    read = []
+    def items():
+        for i in itertools.count():
+            read.append(i)
+            yield i
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = pdesign.imap_bounded(executor, lambda x: x * x, items(), 3)
+        eq_([next(results) for i in range(5)], [0, 1, 4, 9, 16])
+    eq_(len(read), 7)
+
+def test_design_fasta_parallel_same_as_serial():
+    fasta = os.path.join(EXAMPLE, 'test.fasta')
+    serial = list(pdesign.design_fasta(fasta))
+    eq_(list(pdesign.design_fasta(fasta, processes=2)), serial)
+    ok_(serial)
+
+def test_prefilter_keeps_every_primer_in_bound():
+    import random
+    import numpy as np
+    from seqtool.nucleotide.primer import Primer
+    from seqtool.nucleotide.cpg import count_cpg
+    random.seed(0)
+    seq = ''.join(random.choice('ACGTGC') for i in range(150))
+    pc = pdesign.default_condition()
+    found = set((i, j) for i, j, p in pdesign.design(seq, pc, max_cpg=1))
+    ok_(found)
+    for i in range(len(seq)):
+        for j in range(i + pc.primer_length.minimum, min(i + pc.primer_length.maximum, len(seq))):
+            p = Primer('p', seq[i:j])
+            if pc.bound_primer(p) and count_cpg(seq[i:j]) <= 1:
+                ok_((i, j) in found)
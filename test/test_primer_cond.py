@@ -0,0 +1,42 @@
+from nose.tools import *
+
+from seqtool.nucleotide.primer import PrimerPair
+from seqtool.nucleotide import primer_cond as pcond
+
+from helpers import random_primers
+
+def test_scorer_pool_same_as_condition():
+    primers = random_primers(60, 0)
+    pairs = [PrimerPair(fw, rv) for fw, rv in zip(primers, primers[1:] + primers[:1])]
+    for cond in [pcond.NORMAL_PCR, pcond.BISULFITE_PCR]:
+        scorer = pcond.PrimerScorer(cond, processes=2, chunk_size=16)
+        eq_(scorer.score_primerpairs(pairs), [cond.score_primerpair(pp) for pp in pairs])
+        eq_(scorer.bound_primerpairs(pairs), [cond.bound_primerpair(pp) for pp in pairs])
+        eq_(scorer.score_primers(primers), [cond.score_primer(p) for p in primers])
+        eq_(len(scorer._primers), len(primers))
+
+def test_pcr_score_of_workspace_same_as_primers():
+    from seqtool.nucleotide import to_seq
+    from seqtool.nucleotide.pcr import PCR
+    from seqtool.nucleotide.workspace import TemplateWorkspace
+    fw, rv = random_primers(2, 1)
+    template = to_seq(str(fw.seq) + 'ACGT' * 30 + str(rv.seq.reverse_complement()))
+    ws = TemplateWorkspace(template, [fw, rv])
+    eq_(PCR('a', template, fw, rv, workspace=ws).primer_score, PCR('a', template, fw, rv).primer_score)
+    eq_(len(ws.scorer._primers), 2)
+
+def test_tm_cache_shared_by_batch_and_primer():
+    from seqtool.nucleotide import melt_temp
+    primers = random_primers(20, 3)
+    melt_temp.THERMO_CACHE.clear()
+    tms = [p.melting_temperature() for p in primers]
+    eq_((melt_temp.THERMO_CACHE.hits, melt_temp.THERMO_CACHE.misses), (0, 20))
+    eq_([p.melting_temperature() for p in primers], tms)
+    eq_((melt_temp.THERMO_CACHE.hits, melt_temp.THERMO_CACHE.misses), (20, 20))
+    # a batch finds the values of the primers, and primers find the batch values
+    eq_([c[2] for c in pcond.PrimerScorer(pcond.NORMAL_PCR).primer_components(primers)], tms)
+    eq_((melt_temp.THERMO_CACHE.hits, melt_temp.THERMO_CACHE.misses), (40, 20))
+    melt_temp.THERMO_CACHE.clear()
+    melt_temp.tm_batch([p.seq for p in primers])
+    eq_([p.melting_temperature() for p in primers], tms)
+    eq_((melt_temp.THERMO_CACHE.hits, melt_temp.THERMO_CACHE.misses), (20, 20))
@@ -0,0 +1,131 @@
+import os
+from Bio import SeqIO
+from nose.tools import *
+
+from seqtool.nucleotide import to_seq
+from seqtool.nucleotide.cpg import bisulfite_conversion
+from seqtool.nucleotide.primer import Primer, Primers
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'example')
+
+def load_template():
+    record = next(SeqIO.parse(os.path.join(EXAMPLE, 'test.fasta'), 'fasta'))
+    return to_seq(str(record.seq))
+
+def load_primers(template):
+    ps = Primers()
+    ps.load_file(os.path.join(EXAMPLE, 'primers.txt'))
+    s = str(template)
+    # primers which surely hit the template
+    ps.append(Primer('sub-fw', s[100:122]))
+    ps.append(Primer('sub-rv', to_seq(s[2000:2024]).reverse_complement()))
+    ps.append(Primer('repeat', s[0:20]))
+    ps.append(Primer('degenerate', s[296:310] + ('Y' if s[310] in 'CT' else 'R') + s[311:318]))
+    return ps
+
+def same_result(primer, template, template_ambiguous):
+    r = primer.search(template, template_ambiguous)
+    e = primer.search_regex(template, template_ambiguous)
+    eq_([repr(x) for x in r], [repr(x) for x in e])
+    return len(r[0]) + len(r[1])
+
+def test_search_same_as_regex():
+    template = load_template()
+    hits = 0
+    for p in load_primers(template):
+        hits += same_result(p, template, False)
+    ok_(hits > 4)
+
+def test_search_bisulfite_same_as_regex():
+    template = load_template()
+    converted = [bisulfite_conversion(template, sense=True),
+                 bisulfite_conversion(template, sense=False)]
+    for t in converted:
+        for p in load_primers(template):
+            same_result(p, t, True)
+
+def test_primer_set_same_as_regex():
+    template = load_template()
+    converted = bisulfite_conversion(template, sense=True)
+    ps = load_primers(template)
+    for t, ambiguous in [(template, False), (converted, True)]:
+        for p, pp, pc in ps.search(t, ambiguous):
+            eq_([repr(x) for x in (pp, pc)],
+                [repr(x) for x in p.search_regex(t, ambiguous)])
+
+def test_primer_hits_same_as_annealing():
+    template = load_template()
+    converted = bisulfite_conversion(template, sense=False)
+    ps = load_primers(template)
+    for t, ambiguous in [(template, False), (converted, True)]:
+        hits = ps.primer_set(ambiguous).hits(t)
+        for k, (l, r) in enumerate(zip(hits.match_left, hits.match_right)):
+            a = hits.annealing(k)
+            eq_((a.match_left, a.match_right), (l, r))
+            eq_(a.match_length, hits.records[k]['match_length'])
+            ok_(a.tm() >= 40. and a.n_percent() <= 0.5)
+
+def test_mismatch_search():
+    template = load_template()
+    s = str(template)
+    ps = load_primers(template)
+    # 2 mismatches far from 3' end
+    mutated = s[1000:1004] + ('A' if s[1004] != 'A' else 'T') + s[1005:1008] + ('A' if s[1008] != 'A' else 'T') + s[1009:1024]
+    ps.append(Primer('mutated', mutated))
+
+    exact = ps.search(template)
+    tolerant = ps.search(template, max_mismatches=2)
+    for (p, pp, pc), (q, qp, qc) in zip(exact, tolerant):
+        eq_(p, q)
+        # 3' end locations
+        ok_(set(a.match_right for a in pp) <= set(a.match_right for a in qp))
+        ok_(set(a.match_left for a in pc) <= set(a.match_left for a in qc))
+        for a in qp + qc:
+            ok_(a.mismatches <= 2)
+
+    pp, pc = ps['mutated'].search(template, max_mismatches=2)
+    # the template is repetitive
+    ok_((1000, 1024, 2) in [(a.match_left, a.match_right, a.mismatches) for a in pp])
+    # the second mismatch is out of the 3' tail, and it stops the match
+    pp, pc = ps['mutated'].search(template, max_mismatches=1)
+    ok_((1005, 1024, 1) in [(a.match_left, a.match_right, a.mismatches) for a in pp])
+    pp, pc = ps['mutated'].search(template)
+    ok_(1024 not in [a.match_right for a in pp])
+
+def test_mismatch_matcher_same_as_brute_force():
+    import random
+    from seqtool.nucleotide import iupac
+    from seqtool.nucleotide.primerset import BitParallelMatcher, _Pattern
+    r = random.Random(11)
+    s = ''.join(r.choice('ACGTN') for i in range(30000))
+    m = iupac.basematch_unambiguous
+    patterns = [_Pattern(0, True, s[5000:5012], m), _Pattern(0, False, s[9000:9012], m), _Pattern(1, True, 'ATGNNCAYGT', m)]
+
+    def brute(anchor):
+        ret = []
+        for i in range(len(s)):
+            for p in patterns:
+                l = p.length
+                if i < l - 1:
+                    continue
+                miss = [j for j in range(l) if s[i-l+1+j] not in p.allowed[j]]
+                near = [j for j in miss if ((l-1-j) if p.strand else j) < anchor]
+                if not near and len(miss) <= 2:
+                    ret.append((i, p, len(miss)))
+        return ret
+
+    for anchor in [0, 3]:
+        eq_(list(BitParallelMatcher(patterns, 2, anchor).iter(s, chunk=7000)), brute(anchor))
+
+def test_template_index_batch_same_as_find():
+    import random
+    from seqtool.nucleotide.template_index import TemplateIndex
+    r = random.Random(5)
+    s = ''.join(r.choice('ACGTACGTNYR') for i in range(5000))
+    tails = [s[p:p+r.randint(3, 14)] for p in (r.randrange(4990) for i in range(200))]
+    tails += [''.join(r.choice('ACGTNYRW') for j in range(r.randint(3, 14))) for i in range(200)]
+    for k in [4, 8]:
+        idx = TemplateIndex(to_seq(s), k)
+        for ambiguous in [False, True]:
+            eq_(idx.find_batch(tails, ambiguous), [idx.find(t, ambiguous) for t in tails])
+    eq_(TemplateIndex(to_seq('ATGC')).find_batch(['ATGCATGCAT', 'TG']), [([], []), ([1], [])])
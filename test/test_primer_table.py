@@ -0,0 +1,41 @@
+import os
+from nose.tools import *
+
+from seqtool.nucleotide.primer import Primer, Primers, PrimerPartial
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'example')
+
+def test_table_same_as_rows():
+    ps = Primers()
+    ps.load_file(os.path.join(EXAMPLE, 'primers.txt'))
+    ps.append(Primer('degenerate', 'TTYGGRTTAGTTTAGGAYGT'))
+    ps.append(PrimerPartial('partial', 'GGATCCATGCATGCCATGGTTAC', 18))
+
+    eq_(ps.table.rows(), [p.get_table_row() for p in ps])
+    eq_(ps.table.seqs(), [str(p.seq) for p in ps])
+
+    head = ", ".join(Primer.get_table_head()) + "\n"
+    eq_(ps.write_csv(), head + "".join(", ".join(p.get_table_row()) + "\n" for p in ps) + "\n")
+
+def test_table_and_primer_set_follow_changes():
+    ps = Primers()
+    ps.append(Primer('a', 'ATGCATGCCATGGTTACGAT'))
+    ps.append(Primer('b', 'TCCGATCGTAACCATGGCAT'))
+    seqs = ps.table.seqs()
+    primer_set = ps.primer_set()
+
+    ps['a'] = Primer('a', 'GGATCCATGCATGCCATGGT')
+    eq_(ps.table.seqs(), ['GGATCCATGCATGCCATGGT', seqs[1]])
+    ok_(ps.primer_set() is not primer_set)
+    eq_([str(p.seq) for p in ps.primer_set().primers], ps.table.seqs())
+
+    del ps['b']
+    eq_(ps.table.seqs(), ['GGATCCATGCATGCCATGGT'])
+    eq_(len(ps.primer_set()), 1)
+
+def test_memoized_methods_of_slotted_primers():
+    for p in [Primer('p', 'ATGCATGCCATGGTTACGAT'), PrimerPartial('q', 'GGATCCATGCATGCCATGGTTAC', 18)]:
+        ok_(not hasattr(p, '__dict__'))
+        eq_(p.score, p.score)
+        eq_(p.score_bisulfite, p.score_bisulfite)
+        ok_(p.annealings() is p.annealings())
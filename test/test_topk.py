@@ -0,0 +1,28 @@
+import random
+from nose.tools import *
+
+from seqtool.util.topk import BinnedTopK
+
+def test_topk_same_as_sort():
+    r = random.Random(0)
+    items = [(r.randrange(1000), r.randrange(50), i) for i in range(2000)]
+    t = BinnedTopK(1000, 100, 4)
+    for position, score, i in items:
+        t.add(position, score, i)
+
+    expected = []
+    for b in range(10):
+        in_bin = sorted((score, i) for position, score, i in items if position // 100 == b)
+        expected += in_bin[:4]
+    eq_(t.items(), [i for score, i in sorted(expected)])
+    eq_(len(t), 40)
+    eq_(t.added - t.rejected, 40)
+    ok_(all(t.floors == [max(s for s, i in sorted((score, i) for position, score, i in items if position // 100 == b)[:4]) for b in range(10)]))
+
+def test_topk_min_distance():
+    r = random.Random(1)
+    t = BinnedTopK(1000, 1000, 10, min_distance=20)
+    for i in range(500):
+        t.add(r.randrange(1000), r.random(), i)
+    positions = sorted(e.position for e in t.entries())
+    ok_(all(b - a >= 20 for a, b in zip(positions, positions[1:])))
@@ -0,0 +1,34 @@
+from nose.tools import *
+
+from seqtool.nucleotide import to_seq
+from seqtool.nucleotide.primer import Primer
+from seqtool.nucleotide.pcr import PCR, BisulfitePCR
+from seqtool.nucleotide.workspace import TemplateWorkspace
+
+from helpers import random_template
+
+def products(pcr):
+    ret = [repr(p) for p in pcr.products]
+    for name, abbr, temp, ps in getattr(pcr, 'converted_temp', []):
+        ret += [repr(p) for p in ps]
+    return ret
+
+def test_pcr_with_workspace_same_as_without():
+    t = to_seq(random_template(600, 4))
+    ws = TemplateWorkspace(t)
+    bs = ws.bisulfite().strand(True, True)
+    for k, (i, j) in enumerate([(10, 300), (50, 500), (120, 420)]):
+        fw = Primer('fw{}'.format(k), str(t[i:i+20]))
+        rv = Primer('rv{}'.format(k), str(t[j-20:j].reverse_complement()))
+        eq_(products(PCR('p', t, fw, rv, workspace=ws)), products(PCR('p', t, fw, rv)))
+        bfw = Primer('bfw{}'.format(k), str(bs[i:i+20]))
+        brv = Primer('brv{}'.format(k), str(bs[j-20:j].reverse_complement()))
+        eq_(products(BisulfitePCR('b', t, bfw, brv, ws)), products(BisulfitePCR('b', t, bfw, brv)))
+
+def test_workspace_searches_template_once_for_known_primers():
+    t = to_seq(random_template(400, 5))
+    primers = [Primer('p{}'.format(k), str(t[k*30:k*30+20])) for k in range(6)]
+    ws = TemplateWorkspace(t, primers)
+    for p in primers:
+        ws.hits(t, [p, primers[0]])
+    eq_(ws.searches, 1)